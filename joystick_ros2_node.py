@@ -61,8 +61,8 @@ class JoystickPublisher(Node):
 
     def _publish(self):
         data = self.controller.read()
-        self.pub_ai.publish(Int8MultiArray(data=data.ai))
-        self.pub_di.publish(Int8MultiArray(data=data.di))
+        self.pub_ai.publish(Int8MultiArray(data=data.ai.tolist()))
+        self.pub_di.publish(Int8MultiArray(data=data.di.tolist()))
 
     def destroy_node(self):
         self.controller.close()
@@ -11,6 +11,9 @@ Usage:
     python main.py --ip 192.168.0.132:8080
     python main.py --dry
     python main.py --dry --verbose   # show robot channel names instead of raw axis values
+    python main.py --ip 192.168.0.132:8080 --pipeline --tx-rate 100   # TX on its own clock
+    python main.py --dry --no-nidaq  # gamepad only
+    python main.py --ip 127.0.0.1:8080 --sim-daq sine --duration 10   # against python -m modules.robot_sim
 """
 
 import argparse
@@ -23,7 +26,15 @@ import threading
 import time
 
 from modules.controller_stack import ControllerStack, DEFAULT_CONFIG_PATH
-from modules.udp_socket import UDPSocket
+from modules.NiDAQ_controller import DI_TIMINGS
+from modules.nidaq_processing import BLOCK_FILTERS
+from modules.netem import LINK_PRESETS, ImpairedSocket, LinkModel, impair
+from modules.packet_layout import layout_from_config
+from modules.pacing import DeadlinePacer, JitterStats, LatestValue
+from modules.sim_daq import SimulatedDAQ, waveform_from_spec
+from modules.telemetry import TELEMETRY_FORMAT, TelemetrySocket
+from modules.tx_policy import AdaptiveRateController
+from modules.udp_socket import MAC_ALGORITHMS, MAC_TAG_SIZES, UDPSocket
 
 
 # Robot channel names by packet byte index (matches simple_drive.py receiver)
@@ -54,6 +65,35 @@ def _ts():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
 
 
+def _format_axes(ai, verbose):
+    if verbose:
+        return _format_channels(ai)
+    return " ".join(f"A{i}:{v:+4d}" for i, v in enumerate(ai))
+
+
+def _format_stage(label, stats):
+    summary = stats.summary()
+    return f"{label}:{summary['rate_hz']:5.0f}Hz ±{summary['stdev_s'] * 1000:4.2f}ms"
+
+
+def _acquisition_loop(controllers, slot, stats, stop, console, pacer=None):
+    """Pipeline acquisition stage: read controllers and publish the newest command.
+
+    With NiDAQ the blocking hardware-timed read paces the loop; gamepad-only
+    runs pass a pacer instead.
+    """
+    try:
+        while not stop.is_set():
+            if pacer:
+                pacer.wait()
+            command = controllers.read()
+            slot.publish(command)
+            stats.record()
+    except Exception as e:
+        console.log(f"Acquisition stopped: {e}")
+        stop.set()
+
+
 class AsyncConsole:
     """Best-effort console output that cannot block the control loop."""
 
@@ -107,21 +147,287 @@ class AsyncConsole:
                 pass
 
 
+def _format_saved(udp):
+    """Suppressed sends and delta/keepalive savings for the status line, or '' when the mode is off."""
+    if udp is None or udp.tx_policy is None:
+        return ""
+    stats = udp.get_connection_stats()
+    return f" sup:{stats['packets_suppressed']:7d} saved:{stats['bytes_saved'] / 1024:6.1f}kB"
+
+
+def _format_link(udp):
+    """Probe-measured RTT, one-way delay and command age for the status line, or ''."""
+    if udp is None or not udp.probe_interval_s:
+        return ""
+    stats = udp.get_connection_stats()
+    if stats.get("srtt_ms") is None:
+        return " rtt:  --"
+    text = f" rtt:{stats['srtt_ms']:5.1f}ms owd:{stats['one_way_delay_ms']:5.1f}ms"
+    if stats["command_age_ms"] is not None:
+        text += f" cmd:{stats['command_age_ms']:5.1f}ms"
+    return text
+
+
+def _format_telemetry(udp):
+    """Robot telemetry rate and any fault bits for the status line, or '' without --telemetry."""
+    if not isinstance(udp, TelemetrySocket):
+        return ""
+    ring = udp.telemetry
+    text = f" tlm:{ring.rate_hz():3.0f}Hz"
+    _, values = ring.latest()
+    if len(values):
+        faults = int(values[0, ring.field_index("faults")])
+        if faults:
+            text += f" FAULT:{faults:#x}"
+    return text
+
+
+def _rate_controller(args, udp, console):
+    """AdaptiveRateController for --adaptive-rate, with the floor kept inside the robot's max_age."""
+    if udp is None or args.adaptive_rate is None:
+        return None
+    floor_hz, ceiling_hz = args.adaptive_rate
+    remote_max_age = udp.get_handshake_info()["remote_max_age_seconds"]
+    if remote_max_age and floor_hz < 2.0 / remote_max_age:
+        floor_hz = min(ceiling_hz, 2.0 / remote_max_age)
+        console.log(f"Adaptive rate floor raised to {floor_hz:.1f} Hz to stay inside robot max_age "
+                    f"{remote_max_age * 1000:.0f} ms")
+    if not udp.get_handshake_info()["probes"]:
+        console.log("Robot does not answer probes; adaptive rate reacts to send drops only")
+    return AdaptiveRateController(floor_hz, ceiling_hz, initial_hz=args.tx_rate)
+
+
+def _run_pipeline(args, controllers, udp, console):
+    """Pipelined sender: acquisition thread -> latest-value slot -> paced TX loop.
+
+    The TX loop runs on absolute deadlines, so acquisition hiccups, gamepad
+    lock contention or console back-pressure delay only the data age, not
+    the send times. With --adaptive-rate the TX rate follows the link.
+    """
+    slot = LatestValue()
+    stop = threading.Event()
+    acq_stats = JitterStats(1.0 / args.rate)
+    tx_stats = JitterStats(1.0 / args.tx_rate)
+    acq_pacer = DeadlinePacer(args.rate, spin_seconds=0.0) if args.no_nidaq else None
+    acquisition = threading.Thread(
+        target=_acquisition_loop,
+        args=(controllers, slot, acq_stats, stop, console, acq_pacer),
+        daemon=True,
+    )
+    acquisition.start()
+
+    rate_control = _rate_controller(args, udp, console)
+    tx_rate = rate_control.rate_hz if rate_control else args.tx_rate
+    pacer = DeadlinePacer(tx_rate, spin_seconds=args.spin_ms / 1000.0)
+    tx_stats.period = 1.0 / tx_rate
+    rate_check_period = 0.1
+    rate_check_time = time.monotonic()
+    stale_seconds = args.stale_ms / 1000.0
+    neutral_ai = [0] * 8
+    display_period = 1.0 / 20.0
+    display_time = time.monotonic()
+    status_width = 0
+    last_gamepad_connected = None
+    stale = False
+    end_time = time.monotonic() + args.duration if args.duration else None
+    try:
+        while not stop.is_set():
+            pacer.wait()
+            if end_time is not None and time.monotonic() >= end_time:
+                break
+            sequence, command, acquired_at = slot.get()
+            if command is None:
+                continue
+
+            now = time.monotonic()
+            age = now - acquired_at
+            if (age > stale_seconds) != stale:
+                stale = not stale
+                console.log(f"Acquisition stale ({age * 1000:.0f} ms), sending neutral" if stale
+                            else "Acquisition recovered")
+            ai, mask = (neutral_ai, 0) if stale else (command["ai"], command["mask"])
+
+            sent = udp.packets_sent if udp else 0
+            if udp and not udp.send(ai + [mask]):
+                break
+            # TX counts datagrams actually written; suppressed sends are shown as sup:.
+            if not udp or udp.packets_sent != sent:
+                tx_stats.record()
+
+            if rate_control and now - rate_check_time >= rate_check_period:
+                rate_check_time = now
+                new_rate = rate_control.update(udp.get_connection_stats(), now)
+                if new_rate is not None:
+                    console.log(f"TX rate {tx_rate:.0f} -> {new_rate:.0f} Hz ({rate_control.reason})")
+                    tx_rate = new_rate
+                    pacer.set_rate(tx_rate)
+                    tx_stats.period = 1.0 / tx_rate
+                    udp.set_nominal_rate_hz(tx_rate)
+
+            gamepad_connected = command["gamepad_connected"]
+            if gamepad_connected != last_gamepad_connected:
+                status = "connected" if gamepad_connected else "disconnected"
+                console.log(f"Gamepad {status}")
+                last_gamepad_connected = gamepad_connected
+
+            if now - display_time >= display_period:
+                gp_str = "GP:OK" if gamepad_connected else "GP:--"
+                rate_str = f" set:{tx_rate:3.0f}Hz" if rate_control else ""
+                status = (f"[{_ts()}] {_format_stage('ACQ', acq_stats)} {_format_stage('TX', tx_stats)}{rate_str} "
+                          f"late:{pacer.overruns} age:{age * 1000:3.0f}ms{_format_saved(udp)}{_format_link(udp)}"
+                          f"{_format_telemetry(udp)} {gp_str} | "
+                          f"{_format_axes(ai, args.verbose)} | BTN:{mask:016b}")
+                status_width = max(status_width, len(status))
+                console.status(status, status_width)
+                display_time = now
+    finally:
+        stop.set()
+        acquisition.join(timeout=1.0)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Robot joystick/gamepad sender")
     parser.add_argument("--ip", help="Robot IP:port  e.g. 192.168.0.132:8080")
     parser.add_argument("--id", type=int, default=1, dest="local_id", help="Local device ID")
     parser.add_argument("--rate", type=int, default=100, help="NiDAQ/TX rate in Hz (default: 100)")
+    parser.add_argument("--daq-rate", type=int, default=None,
+                        help="NiDAQ AI hardware sample rate in Hz, a multiple of --rate oversamples (default: --rate)")
+    parser.add_argument("--daq-filter", choices=BLOCK_FILTERS, default="latest",
+                        help="Reduction applied to each oversampled NiDAQ block (default: latest)")
+    parser.add_argument("--daq-cutoff", type=float, default=None, help="Low-pass cutoff in Hz for --daq-filter iir/fir")
+    parser.add_argument("--daq-taps", type=int, default=31, help="FIR length for --daq-filter fir (default: 31)")
+    parser.add_argument("--daq-raw", action="store_true",
+                        help="Read unscaled int16 NiDAQ counts and fold device scaling into normalization")
+    parser.add_argument("--daq-events", action="store_true",
+                        help="Acquire NiDAQ blocks via every-N-samples callbacks instead of polling the driver")
+    parser.add_argument("--di-timing", choices=DI_TIMINGS, default="on_demand",
+                        help="NiDAQ button sampling: once per tick, buffered on the AI clock, "
+                             "or change detection (default: on_demand)")
+    parser.add_argument("--di-debounce-ms", type=float, default=0.0,
+                        help="Button debounce for buffered --di-timing modes in ms (default: 0)")
+    parser.add_argument("--sim-daq", nargs="?", const="neutral", default=None, metavar="WAVEFORM",
+                        help="Use the simulated NiDAQ backend: 'neutral' (default), 'sine', "
+                             "or a recorded .npy/.csv file sampled at --daq-rate")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Acquire on a background thread and send on an independent TX clock")
+    parser.add_argument("--tx-rate", type=int, default=None,
+                        help="TX rate in Hz; requires --pipeline (default: --rate)")
+    parser.add_argument("--spin-ms", type=float, default=2.0,
+                        help="Busy-wait the last part of each --pipeline TX period, in ms (default: 2.0)")
+    parser.add_argument("--stale-ms", type=float, default=200.0,
+                        help="--pipeline: send neutral if the newest command is older than this (default: 200)")
+    parser.add_argument("--no-nidaq", action="store_true",
+                        help="Gamepad only, no NiDAQ (implies --pipeline; --rate sets the gamepad poll rate)")
+    parser.add_argument("--hmac-key", default=None, help="Shared key to authenticate every packet (robot must match)")
+    parser.add_argument("--mac", choices=tuple(MAC_ALGORITHMS), default="hmac-sha256",
+                        help="Packet MAC algorithm with --hmac-key (default: hmac-sha256)")
+    parser.add_argument("--mac-tag", type=int, choices=MAC_TAG_SIZES, default=32,
+                        help="MAC bytes per packet with --hmac-key (default: 32)")
+    parser.add_argument("--seq", action="store_true",
+                        help="Request per-packet sequence numbers so the robot can drop late packets and measure loss")
+    parser.add_argument("--path", action="append", default=[], metavar="[BIND_IP@]HOST:PORT",
+                        help="Also send every packet over this path, e.g. from a second modem's IP; repeatable "
+                             "(implies --seq; the robot must set multipath=True)")
+    parser.add_argument("--copies", type=int, default=1,
+                        help="Send every packet this many times per path (implies --seq; default: 1)")
+    parser.add_argument("--copy-spacing-ms", type=float, default=2.0,
+                        help="Delay between copies on one path with --copies (default: 2)")
+    parser.add_argument("--keepalive-hz", type=float, default=None,
+                        help="Send only on change (see --delta-threshold) and otherwise at this rate, to save data")
+    parser.add_argument("--delta-threshold", default="0", metavar="N[,N...]",
+                        help="--keepalive-hz: axis change in int8 steps needed to send, one value or one per axis "
+                             "(default: 0 = any change; buttons always send on any edge)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Send a bit-packed payload compiled from the controller config "
+                             "(the robot must set accept_layouts=True; falls back otherwise)")
+    parser.add_argument("--probe-ms", type=float, default=None,
+                        help="Measure RTT, one-way delay and command age with a probe every N ms "
+                             "(the robot must set answer_probes=True)")
+    parser.add_argument("--adaptive-rate", default=None, metavar="MIN:MAX",
+                        help="Move the TX rate between MIN and MAX Hz from measured loss, RTT growth and send "
+                             "drops, starting at --tx-rate (implies --pipeline; probes every 500 ms unless "
+                             "--probe-ms is set)")
+    parser.add_argument("--telemetry", action="store_true",
+                        help=f"Receive robot state ('{TELEMETRY_FORMAT}': joints, pressures, faults) into a "
+                             "time-indexed history buffer (the robot must send it as its outputs)")
+    parser.add_argument("--telemetry-log", default=None, metavar="PATH.npz",
+                        help="With --telemetry, save the buffered history to this file on exit")
+    parser.add_argument("--netem", choices=tuple(LINK_PRESETS), default=None,
+                        help="Impair outgoing packets with an emulated link after the handshake (testing only)")
+    parser.add_argument("--netem-seed", type=int, default=0, help="RNG seed for --netem (default: 0)")
     parser.add_argument("--config", default=str(DEFAULT_CONFIG_PATH), help="Controller config JSON path")
     parser.add_argument("--dry", action="store_true", help="Run without connecting to robot")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Stop after this many seconds (e.g. for benchmarks against modules/robot_sim.py)")
     parser.add_argument("--verbose", action="store_true", help="Show robot channel names instead of raw axis values")
     args = parser.parse_args()
 
     if args.rate <= 0:
         parser.error("--rate must be greater than 0")
+    if args.daq_rate is not None and args.daq_rate < args.rate:
+        parser.error("--daq-rate must be at least --rate")
+    if args.daq_filter in ("iir", "fir") and args.daq_cutoff is None:
+        parser.error(f"--daq-filter {args.daq_filter} requires --daq-cutoff")
+    if args.di_debounce_ms < 0:
+        parser.error("--di-debounce-ms must be >= 0")
+    if args.no_nidaq:
+        args.pipeline = True
+    if args.tx_rate is not None and not args.pipeline and args.adaptive_rate is None:
+        # The default loop sends at --rate; advertising another rate would mislead the peer.
+        parser.error("--tx-rate requires --pipeline")
+    if args.tx_rate is None:
+        args.tx_rate = args.rate
+    if args.tx_rate <= 0:
+        parser.error("--tx-rate must be greater than 0")
+    if args.spin_ms < 0:
+        parser.error("--spin-ms must be >= 0")
+    if args.probe_ms is not None and args.probe_ms <= 0:
+        parser.error("--probe-ms must be greater than 0")
+    if args.adaptive_rate is not None:
+        try:
+            floor_hz, ceiling_hz = (float(v) for v in args.adaptive_rate.split(':'))
+        except ValueError:
+            parser.error("--adaptive-rate must be in MIN:MAX format, e.g. 30:100")
+        if not 0 < floor_hz <= ceiling_hz:
+            parser.error("--adaptive-rate needs 0 < MIN <= MAX")
+        args.adaptive_rate = (floor_hz, ceiling_hz)
+        args.tx_rate = min(ceiling_hz, max(floor_hz, args.tx_rate))
+        args.pipeline = True
+        if args.probe_ms is None:
+            args.probe_ms = 500.0
+    if args.stale_ms <= 0:
+        parser.error("--stale-ms must be greater than 0")
+    if args.telemetry_log and not args.telemetry:
+        parser.error("--telemetry-log requires --telemetry")
 
     if not args.dry and not args.ip:
         parser.error("--ip is required unless --dry is set")
+    if args.duration is not None and args.duration <= 0:
+        parser.error("--duration must be greater than 0")
+    if args.copies < 1:
+        parser.error("--copies must be >= 1")
+    if args.copy_spacing_ms < 0:
+        parser.error("--copy-spacing-ms must be >= 0")
+
+    extra_paths = []
+    for spec in args.path:
+        bind_host, _, target = spec.rpartition('@')
+        path_host, _, path_port = target.rpartition(':')
+        if not path_host or not path_port.isdigit() or not (0 < int(path_port) <= 65535):
+            parser.error(f"--path must be in [BIND_IP@]HOST:PORT format, got '{spec}'")
+        extra_paths.append((bind_host or None, path_host, int(path_port)))
+    multipath = bool(extra_paths) or args.copies > 1
+
+    if args.keepalive_hz is not None and args.keepalive_hz <= 0:
+        parser.error("--keepalive-hz must be greater than 0")
+    try:
+        delta_thresholds = [int(t) for t in args.delta_threshold.split(',')]
+    except ValueError:
+        parser.error("--delta-threshold must be integers separated by commas")
+    if len(delta_thresholds) == 1:
+        delta_thresholds *= 8
+    if len(delta_thresholds) != 8 or any(t < 0 for t in delta_thresholds):
+        parser.error("--delta-threshold takes one value or 8 non-negative values")
 
     host = None
     port = None
@@ -154,14 +460,41 @@ def main():
 
     console = AsyncConsole()
     console.log("Initializing controller stack...")
-    tx_period = 1.0 / args.rate
-
-    controllers = ControllerStack(config_path=args.config, nidaq_sample_rate=args.rate)
+    tx_period = 1.0 / args.tx_rate
+
+    nidaq_options = {
+        "acquisition_rate": args.daq_rate,
+        "block_filter": args.daq_filter,
+        "filter_cutoff_hz": args.daq_cutoff,
+        "filter_taps": args.daq_taps,
+        "raw_counts": args.daq_raw,
+        "acquisition_mode": "event" if args.daq_events else "poll",
+        "di_timing": args.di_timing,
+        "di_debounce_ms": args.di_debounce_ms,
+    }
+    if args.sim_daq is not None:
+        waveform = waveform_from_spec(args.sim_daq, args.daq_rate or args.rate)
+        nidaq_options["backend"] = SimulatedDAQ(ai_waveform=waveform)
+    controllers = ControllerStack(config_path=args.config, nidaq_sample_rate=args.rate, nidaq_options=nidaq_options,
+                                  use_nidaq=not args.no_nidaq)
 
     udp = None
     if not args.dry:
-        udp = UDPSocket(local_id=args.local_id, max_age_seconds=0.5, nominal_rate_hz=args.rate)
-        udp.setup(host=host, port=port, inputs='', outputs='<8bH', is_server=False)
+        socket_class, socket_options = UDPSocket, {}
+        if args.telemetry:
+            # Two minutes of history at 100 Hz.
+            socket_class, socket_options = TelemetrySocket, {"capacity": 12000}
+        udp = socket_class(local_id=args.local_id, max_age_seconds=0.5, nominal_rate_hz=args.tx_rate,
+                           hmac_key=args.hmac_key, mac_algorithm=args.mac, mac_tag_size=args.mac_tag,
+                           sequence_numbers=args.seq, multipath=multipath, copies=args.copies,
+                           copy_spacing_s=args.copy_spacing_ms / 1000.0, keepalive_rate_hz=args.keepalive_hz,
+                           delta_thresholds=delta_thresholds,
+                           packet_layout=layout_from_config(controllers.config) if args.compact else None,
+                           probe_interval_s=args.probe_ms / 1000.0 if args.probe_ms else None, **socket_options)
+        udp.setup(host=host, port=port, inputs=TELEMETRY_FORMAT if args.telemetry else '', outputs='<8bH',
+                  is_server=False)
+        for bind_host, path_host, path_port in extra_paths:
+            udp.add_path(path_host, path_port, bind_host=bind_host)
         console.log(f"Connecting to {host}:{port}...")
         if not udp.handshake(timeout=120.0):
             console.log("Handshake failed")
@@ -170,11 +503,24 @@ def main():
             console.stop()
             return
         udp.set_nonblocking_send(True)
+        if args.telemetry or udp.get_handshake_info()["probes"]:
+            udp.start_receiving()  # telemetry and probe replies
+        if args.netem:
+            impair(udp, tx=LinkModel(**LINK_PRESETS[args.netem], seed=args.netem_seed))
+            console.log(f"Emulating a '{args.netem}' link on outgoing packets")
 
     label = "DRY RUN" if args.dry else f"→ {args.ip}"
-    console.log(f"{label} at {args.rate} Hz - Ctrl+C to stop")
+    if args.pipeline:
+        source = "gamepad" if args.no_nidaq else "NiDAQ"
+        console.log(f"{label} at {args.tx_rate} Hz, {source} acquisition at {args.rate} Hz - Ctrl+C to stop")
+    else:
+        console.log(f"{label} at {args.rate} Hz - Ctrl+C to stop")
 
     try:
+        if args.pipeline:
+            _run_pipeline(args, controllers, udp, console)
+            return
+
         display_period = 1.0 / 20.0
         hz_window_seconds = 1.0
         send_times = deque()
@@ -182,8 +528,9 @@ def main():
         display_time = time.monotonic()
         status_width = 0
         last_gamepad_connected = None
+        end_time = time.monotonic() + args.duration if args.duration else None
 
-        while True:
+        while end_time is None or time.monotonic() < end_time:
             command = controllers.read()
             ai = command["ai"]
             mask = command["mask"]
@@ -199,11 +546,13 @@ def main():
                 loop_times.popleft()
 
             if udp:
+                sent = udp.packets_sent
                 if not udp.send(ai + [mask]):
                     break
-                sent_at = time.monotonic()
-                send_times.append(sent_at)
-                while send_times and sent_at - send_times[0] > hz_window_seconds:
+                # TX counts datagrams actually written; suppressed sends are shown as sup:.
+                if udp.packets_sent != sent:
+                    send_times.append(time.monotonic())
+                while send_times and now - send_times[0] > hz_window_seconds:
                     send_times.popleft()
 
             if now - display_time >= display_period:
@@ -214,11 +563,9 @@ def main():
                 else:
                     hz = 0.0
                 gp_str = "GP:OK" if gamepad_connected else "GP:--"
-                if args.verbose:
-                    ax = _format_channels(ai)
-                else:
-                    ax = " ".join(f"A{i}:{v:+4d}" for i, v in enumerate(ai))
-                status = f"[{_ts()}] {rate_label}:{hz:5.0f}Hz {gp_str} | {ax} | BTN:{mask:016b}"
+                ax = _format_axes(ai, args.verbose)
+                status = (f"[{_ts()}] {rate_label}:{hz:5.0f}Hz{_format_saved(udp)}{_format_link(udp)}"
+                          f"{_format_telemetry(udp)} {gp_str} | {ax} | BTN:{mask:016b}")
                 status_width = max(status_width, len(status))
                 console.status(status, status_width)
                 display_time = now
@@ -230,10 +577,16 @@ def main():
         pass
     finally:
         if udp:
+            if isinstance(udp.socket, ImpairedSocket):
+                # Neutral commands bypass --netem so they cannot be lost, or be
+                # overtaken by a delayed command, before close() stops the link.
+                udp.socket.stop_tx()
             for _ in range(3):
-                udp.send([0] * 8 + [0])
+                udp.send([0] * 8 + [0], force=True)
                 time.sleep(min(tx_period, 0.02))
             udp.close()
+            if args.telemetry_log:
+                udp.telemetry.save(args.telemetry_log)
         controllers.close()
         if _winmm:
             _winmm.timeEndPeriod(1)
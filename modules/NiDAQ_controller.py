@@ -3,28 +3,62 @@ NiDAQ joystick reader.
 Reads analog (joystick) and digital (button) inputs from a National Instruments DAQ device.
 """
 
-import nidaqmx
 import numpy as np
-from nidaqmx.constants import AcquisitionType, TerminalConfiguration
-from nidaqmx.errors import DaqError
-from nidaqmx.stream_readers import AnalogMultiChannelReader
 from enum import Enum, auto
 from collections import namedtuple
+import time
+from types import SimpleNamespace
+
+from modules.nidaq_processing import AINormalizer, BlockRing, ButtonLatch, make_block_filter
 
 # ----- Configuration -----
 MIN_VOLTAGE = 0.5      # Minimum joystick voltage (maps to -1.0)
 MAX_VOLTAGE = 4.5      # Maximum joystick voltage (maps to +1.0)
 
-AI_CHANNELS = [
-    "Dev2/ai0", "Dev2/ai1", "Dev2/ai2", "Dev2/ai3",
-    "Dev2/ai4", "Dev2/ai5", "Dev2/ai6", "Dev2/ai7"
+DEFAULT_DEVICE = "Dev2"
+AI_LINES = ["ai0", "ai1", "ai2", "ai3", "ai4", "ai5", "ai6", "ai7"]
+DI_LINES = [
+    "port0/line0", "port0/line1", "port0/line2", "port0/line3",
+    "port0/line4", "port0/line5", "port0/line6", "port0/line7",
+    "port1/line0", "port1/line1", "port1/line2", "port1/line3"
 ]
 
-DI_CHANNELS = [
-    "Dev2/port0/line0", "Dev2/port0/line1", "Dev2/port0/line2", "Dev2/port0/line3",
-    "Dev2/port0/line4", "Dev2/port0/line5", "Dev2/port0/line6", "Dev2/port0/line7",
-    "Dev2/port1/line0", "Dev2/port1/line1", "Dev2/port1/line2", "Dev2/port1/line3"
-]
+AI_CHANNELS = [f"{DEFAULT_DEVICE}/{line}" for line in AI_LINES]
+DI_CHANNELS = [f"{DEFAULT_DEVICE}/{line}" for line in DI_LINES]
+
+DAQ_BACKENDS = ("nidaqmx", "sim")
+ACQUISITION_MODES = ("poll", "event")
+DI_TIMINGS = ("on_demand", "ai_clock", "change_detection")
+
+
+def load_backend(name="nidaqmx"):
+    """Return the DAQ backend namespace: Task, reader classes, constants, DaqError.
+
+    'nidaqmx' is the real driver; 'sim' is modules.sim_daq.SimulatedDAQ with
+    neutral inputs. Any object with the same attributes can be passed to
+    NiDAQJoysticks directly instead.
+    """
+    if name == "sim":
+        from modules.sim_daq import SimulatedDAQ
+        return SimulatedDAQ()
+    if name != "nidaqmx":
+        raise ValueError(f"Unknown DAQ backend '{name}', expected one of {DAQ_BACKENDS}")
+    try:
+        import nidaqmx
+        from nidaqmx.constants import READ_ALL_AVAILABLE, AcquisitionType, TerminalConfiguration
+        from nidaqmx.errors import DaqError
+        from nidaqmx.stream_readers import AnalogMultiChannelReader, AnalogUnscaledReader
+    except ImportError as e:
+        raise RuntimeError(f"nidaqmx is not available ({e}); use the 'sim' backend without NI hardware") from e
+    return SimpleNamespace(
+        Task=nidaqmx.Task,
+        AcquisitionType=AcquisitionType,
+        TerminalConfiguration=TerminalConfiguration,
+        DaqError=DaqError,
+        AnalogMultiChannelReader=AnalogMultiChannelReader,
+        AnalogUnscaledReader=AnalogUnscaledReader,
+        READ_ALL_AVAILABLE=READ_ALL_AVAILABLE,
+    )
 
 
 class OutputFormat(Enum):
@@ -36,13 +70,54 @@ JoystickData = namedtuple("JoystickData", ["ai", "di"])
 
 
 class NiDAQJoysticks:
-    def __init__(self, output_format=OutputFormat.INT8, deadzone=5.0, padding=1.0, sample_rate=100):
+    def __init__(self, output_format=OutputFormat.INT8, deadzone=5.0, padding=1.0, sample_rate=100,
+                 acquisition_rate=None, block_filter="latest", filter_cutoff_hz=None, filter_taps=31,
+                 vectorized=True, raw_counts=False, backend="nidaqmx", device=DEFAULT_DEVICE,
+                 acquisition_mode="poll", di_timing="on_demand", di_debounce_ms=0.0):
         """
         :param output_format: OutputFormat.FLOAT or OutputFormat.INT8
         :param deadzone: Deadzone in %
         :param padding: Edge padding in %
-        :param sample_rate: AI hardware clock rate in Hz. In the main sender,
-                            this is also the control-loop pacing source.
+        :param sample_rate: Read rate in Hz. read() blocks until a new block of
+                            samples is complete, so in the main sender this is
+                            also the control-loop pacing source.
+        :param acquisition_rate: AI hardware clock rate in Hz. Defaults to
+                                 sample_rate; a multiple of it oversamples and
+                                 each read reduces one block with block_filter.
+        :param block_filter: 'latest', 'mean', 'median', 'iir' or 'fir'
+                             (see modules.nidaq_processing).
+        :param filter_cutoff_hz: Low-pass cutoff for 'iir'/'fir', scalar or
+                                 one value per AI channel.
+        :param filter_taps: FIR length for 'fir'.
+        :param vectorized: Normalize with NumPy array operations into
+                           preallocated arrays (ai/di are then ndarrays that
+                           are reused between reads). False uses the original
+                           per-channel Python loop and returns lists.
+        :param raw_counts: Read unscaled int16 ADC counts instead of float64
+                           volts. The device scaling polynomial is folded into
+                           the normalization, so DAQmx skips the conversion and
+                           the sample buffers are a quarter of the size.
+                           Requires vectorized=True.
+        :param backend: 'nidaqmx', 'sim' or a backend object (see load_backend).
+        :param device: DAQmx device name the AI/DI lines belong to.
+        :param acquisition_mode: 'poll' drains the AI buffer inside read().
+                                 'event' registers an every-N-samples callback
+                                 that pushes each block into a shared BlockRing;
+                                 read() and other consumers (wait_for_block)
+                                 then wait on it instead of polling the driver.
+        :param di_timing: 'on_demand' reads the DI lines once per read(), so a
+                          press shorter than one tick can be missed.
+                          'ai_clock' buffers DI on the AI sample clock and
+                          'change_detection' buffers a sample on every line
+                          edge; both drain the buffer each read() and latch
+                          presses that started and ended between reads.
+                          Edges in button_edges get sample-clock times with
+                          'ai_clock', but with 'change_detection' they share
+                          the time of the read that drained them.
+        :param di_debounce_ms: Minimum time a new button level must hold. With
+                               'ai_clock' it is applied in software over the
+                               buffered samples, with 'change_detection' it
+                               enables the DAQmx digital glitch filter.
         """
         if output_format not in OutputFormat:
             raise ValueError("output_format must be an OutputFormat enum value")
@@ -54,38 +129,171 @@ class NiDAQJoysticks:
         self.deadzone = deadzone / 100.0
         self.padding = padding / 100.0
         self.sample_rate = sample_rate
-        self.task_ai = nidaqmx.Task()
-        self.task_di = nidaqmx.Task()
+        self.backend = load_backend(backend) if isinstance(backend, str) else backend
+        self.ai_channels = [f"{device}/{line}" for line in AI_LINES]
+        self.di_channels = [f"{device}/{line}" for line in DI_LINES]
+        self.acquisition_rate = int(acquisition_rate) if acquisition_rate else int(sample_rate)
+        if self.acquisition_rate < sample_rate:
+            raise ValueError("acquisition_rate must be at least sample_rate")
+        # Samples per channel that make up one read at sample_rate.
+        self.block_size = max(1, int(round(self.acquisition_rate / sample_rate)))
+        self.block_filter = make_block_filter(
+            block_filter,
+            channels=len(self.ai_channels),
+            sample_rate=self.acquisition_rate,
+            block_size=self.block_size,
+            cutoff_hz=filter_cutoff_hz,
+            taps=filter_taps,
+        )
+        if acquisition_mode not in ACQUISITION_MODES:
+            raise ValueError(f"acquisition_mode must be one of {ACQUISITION_MODES}")
+        self.acquisition_mode = acquisition_mode
+        if di_timing not in DI_TIMINGS:
+            raise ValueError(f"di_timing must be one of {DI_TIMINGS}")
+        if di_debounce_ms < 0:
+            raise ValueError("di_debounce_ms must be >= 0")
+        self.device = device
+        self.di_timing = di_timing
+        self.di_debounce = di_debounce_ms / 1000.0
+        self.button_latch = None
+        if di_timing == "ai_clock":
+            debounce_samples = int(round(self.di_debounce * self.acquisition_rate))
+            self.button_latch = ButtonLatch(len(self.di_channels), debounce_samples)
+        elif di_timing == "change_detection":
+            # Debounced by the hardware glitch filter instead.
+            self.button_latch = ButtonLatch(len(self.di_channels))
+        self._di_samples_read = 0
+        self._di_start_time = None
+        self.vectorized = bool(vectorized)
+        self.raw_counts = bool(raw_counts)
+        if self.raw_counts and not self.vectorized:
+            raise ValueError("raw_counts requires vectorized=True")
+        self.normalizer = AINormalizer(
+            len(self.ai_channels), MIN_VOLTAGE, MAX_VOLTAGE, deadzone=self.deadzone, padding=self.padding
+        )
+        di_dtype = np.int8 if output_format == OutputFormat.INT8 else np.float64
+        self._di_out = np.zeros(len(self.di_channels), dtype=di_dtype)
+        self.task_ai = self.backend.Task()
+        self.task_di = self.backend.Task()
         self.ai_reader = None
+        self._read_ai_block = None
+        self._ai_dtype = np.int16 if self.raw_counts else np.float64
         self.ai_buffers = {}
+        self.block_ring = None
+        self._last_block = 0
+        self.last_block_timestamp = None  # perf_counter time the newest block was acquired
+        self.last_block_latency = None    # seconds from block acquisition to read()
+        if acquisition_mode == "event":
+            self.block_ring = BlockRing(len(self.ai_channels), self.block_size, dtype=self._ai_dtype)
         self._init_channels()
 
     def _init_channels(self):
         try:
-            for ch in DI_CHANNELS:
+            backend = self.backend
+            for ch in self.di_channels:
                 self.task_di.di_channels.add_di_chan(ch)
-            for ch in AI_CHANNELS:
+            self._init_di_timing()
+            for ch in self.ai_channels:
                 self.task_ai.ai_channels.add_ai_voltage_chan(
                     ch,
                     min_val=MIN_VOLTAGE,
                     max_val=MAX_VOLTAGE,
-                    terminal_config=TerminalConfiguration.RSE
+                    terminal_config=backend.TerminalConfiguration.RSE
                 )
             # Hardware-timed continuous acquisition. Keep this near the desired
             # control rate; much higher rates can build backlog and cause stalls.
             self.task_ai.timing.cfg_samp_clk_timing(
-                rate=self.sample_rate,
-                sample_mode=AcquisitionType.CONTINUOUS,
-                samps_per_chan=self.sample_rate,  # 1-second ring buffer
+                rate=self.acquisition_rate,
+                sample_mode=backend.AcquisitionType.CONTINUOUS,
+                samps_per_chan=self.acquisition_rate,  # 1-second ring buffer
             )
-            self.ai_reader = AnalogMultiChannelReader(self.task_ai.in_stream)
+            if self.raw_counts:
+                self.normalizer.set_count_scaling(
+                    [ch.ai_dev_scaling_coeff for ch in self.task_ai.ai_channels]
+                )
+                self.ai_reader = backend.AnalogUnscaledReader(self.task_ai.in_stream)
+                self._read_ai_block = self.ai_reader.read_int16
+            else:
+                self.ai_reader = backend.AnalogMultiChannelReader(self.task_ai.in_stream)
+                self._read_ai_block = self.ai_reader.read_many_sample
+            if self.block_ring is not None:
+                self.task_ai.register_every_n_samples_acquired_into_buffer_event(
+                    self.block_size, self._on_samples_acquired
+                )
+            if self.button_latch is not None:
+                # DI follows the AI sample clock, so it must be armed first.
+                self.task_di.start()
+                self._di_start_time = time.perf_counter()
             self.task_ai.start()
-            print(f"NiDAQ initialized: {len(AI_CHANNELS)} AI channels @ {self.sample_rate} Hz, {len(DI_CHANNELS)} DI channels.")
+            ai_kind = "raw int16" if self.raw_counts else "volts"
+            print(f"NiDAQ initialized: {len(self.ai_channels)} AI channels ({ai_kind}) @ {self.acquisition_rate} Hz, "
+                  f"{len(self.di_channels)} DI channels.")
+            if self.block_size > 1:
+                print(f"NiDAQ oversampling: {self.block_size} samples/read @ {self.sample_rate} Hz, "
+                      f"filter: {type(self.block_filter).__name__}")
+            if self.button_latch is not None:
+                print(f"NiDAQ buffered DI: {self.di_timing}, debounce {self.di_debounce * 1000:.1f} ms")
+            if self.block_ring is not None:
+                print(f"NiDAQ event acquisition: callback every {self.block_size} samples")
             print(f"NiDAQ ready | Deadzone: {self.deadzone*100:.1f}% | Padding: {self.padding*100:.1f}%")
-        except DaqError as e:
+        except self.backend.DaqError as e:
             self.close()
             raise RuntimeError(f"Failed to initialize NiDAQ: {e}")
 
+    def _init_di_timing(self):
+        backend = self.backend
+        if self.di_timing == "ai_clock":
+            self.task_di.timing.cfg_samp_clk_timing(
+                rate=self.acquisition_rate,
+                source=f"/{self.device}/ai/SampleClock",
+                sample_mode=backend.AcquisitionType.CONTINUOUS,
+                samps_per_chan=self.acquisition_rate,
+            )
+        elif self.di_timing == "change_detection":
+            # Change detection only reports edges, so seed the latch with the
+            # current levels before switching the task to buffered timing.
+            self.button_latch.reset(np.asarray(self.task_di.read(), dtype=bool).reshape(-1))
+            if self.di_debounce > 0:
+                for channel in self.task_di.di_channels:
+                    channel.di_dig_fltr_enable = True
+                    channel.di_dig_fltr_min_pulse_width = self.di_debounce
+            lines = ", ".join(self.di_channels)
+            self.task_di.timing.cfg_change_detection_timing(
+                rising_edge_chan=lines,
+                falling_edge_chan=lines,
+                sample_mode=backend.AcquisitionType.CONTINUOUS,
+                samps_per_chan=1000,
+            )
+
+    def _read_di(self):
+        """Current button states; buffered modes also latch presses between reads."""
+        if self.button_latch is None:
+            return self.task_di.read()
+        samples = self.task_di.read(number_of_samples_per_channel=self.backend.READ_ALL_AVAILABLE)
+        block = np.asarray(samples, dtype=bool).reshape(len(self.di_channels), -1)
+        if self.di_timing == "ai_clock":
+            first, start, rate = self._di_samples_read, self._di_start_time, self.acquisition_rate
+            self._di_samples_read += block.shape[1]
+
+            def timestamps(offset):
+                return start + (first + offset) / rate
+        else:
+            # Change-detection samples are not on a clock, so their edges
+            # carry the time of the read that drained them.
+            timestamps = time.perf_counter()
+        return self.button_latch.update(block, timestamps)
+
+    @property
+    def button_edges(self):
+        """Accepted DI edges as (line index, pressed, perf_counter time), newest last.
+
+        With 'ai_clock' each edge has its own sample time. With
+        'change_detection' every edge in one drained block has the read time.
+        """
+        if self.button_latch is None:
+            return ()
+        return self.button_latch.edges
+
     def _apply_deadzone(self, x):
         d = self.deadzone
         ax = abs(x)
@@ -125,32 +333,93 @@ class NiDAQJoysticks:
             return JoystickData(ai=ai, di=di)
         return JoystickData(ai=ai_floats, di=di_floats)
 
+    def _quantize_arrays(self, ai_column, di_raw):
+        """Vectorized equivalent of _quantize(_normalize_ai(), _normalize_di()).
+
+        ai_column is volts, or ADC counts in raw_counts mode.
+        """
+        di = self._di_out
+        di[:] = di_raw
+        np.not_equal(di, 0, out=di, casting="unsafe")
+        if self.output_format == OutputFormat.INT8:
+            np.multiply(di, 127, out=di)
+            return JoystickData(ai=self.normalizer.to_int8(ai_column), di=di)
+        return JoystickData(ai=self.normalizer.to_float(ai_column), di=di)
+
+    def _on_samples_acquired(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data):
+        """DAQmx every-N-samples callback: move one block into the ring."""
+        ring = self.block_ring
+        try:
+            self._read_ai_block(ring.writable(), number_of_samples_per_channel=self.block_size)
+            ring.publish()
+        except Exception as e:
+            ring.fail(RuntimeError(f"NiDAQ event acquisition failed: {e}"))
+        return 0
+
+    def wait_for_block(self, after=0, timeout=1.0):
+        """Event mode: wait for an AI block newer than sequence `after`.
+
+        Lets several consumers share one acquisition. Returns
+        (sequence, block, timestamp) from BlockRing.wait().
+        """
+        if self.block_ring is None:
+            raise RuntimeError("wait_for_block requires acquisition_mode='event'")
+        return self.block_ring.wait(after, timeout)
+
+    def _read_ai_event(self):
+        timeout = max(1.0, 10.0 * self.block_size / self.acquisition_rate)
+        self._last_block, block, timestamp = self.block_ring.wait(self._last_block, timeout)
+        self.last_block_timestamp = timestamp
+        self.last_block_latency = time.perf_counter() - timestamp
+        return self.block_filter.reduce(block)
+
     def read(self):
-        """Read channels and return JoystickData(ai, di)."""
+        """Read channels and return JoystickData(ai, di).
+
+        In vectorized mode ai/di are preallocated arrays overwritten by the
+        next read; copy them if they must be kept.
+        """
+        if self.block_ring is not None:
+            try:
+                ai_column = self._read_ai_event()
+                di_raw = self._read_di()
+            except self.backend.DaqError as e:
+                raise RuntimeError(f"Failed to read from NiDAQ: {e}")
+            return self._quantize_output(ai_column, di_raw)
+
         try:
-            # Drain completed AI samples and use the newest sample per channel.
-            # Reading a fixed single sample at a slower polling rate leaves
-            # backlog and eventually raises DAQmx -200279.
+            # Drain completed AI samples and reduce them to one value per
+            # channel. Reading a fixed block at a slower polling rate leaves
+            # backlog and eventually raises DAQmx -200279. When less than a
+            # block is available, the read blocks until it completes, which
+            # paces the caller at sample_rate.
             samples_available = self.task_ai.in_stream.avail_samp_per_chan
-            samples_to_read = min(samples_available, self.sample_rate) if samples_available > 0 else 1
+            samples_to_read = min(max(samples_available, self.block_size), self.acquisition_rate)
             ai_buffer = self.ai_buffers.get(samples_to_read)
             if ai_buffer is None:
-                ai_buffer = np.empty((len(AI_CHANNELS), samples_to_read), dtype=np.float64)
+                ai_buffer = np.empty((len(self.ai_channels), samples_to_read), dtype=self._ai_dtype)
                 self.ai_buffers[samples_to_read] = ai_buffer
-            samples_read = self.ai_reader.read_many_sample(
+            samples_read = self._read_ai_block(
                 ai_buffer,
                 number_of_samples_per_channel=samples_to_read,
             )
             if samples_read <= 0:
                 raise RuntimeError("NiDAQ returned no analog samples")
-            ai_raw = ai_buffer[:, samples_read - 1].tolist()
-            di_raw = self.task_di.read()
-        except DaqError as e:
+            ai_column = self.block_filter.reduce(ai_buffer[:, :samples_read])
+            di_raw = self._read_di()
+        except self.backend.DaqError as e:
             raise RuntimeError(f"Failed to read from NiDAQ: {e}")
-        return self._quantize(self._normalize_ai(ai_raw), self._normalize_di(di_raw))
+        return self._quantize_output(ai_column, di_raw)
+
+    def _quantize_output(self, ai_column, di_raw):
+        if self.vectorized:
+            return self._quantize_arrays(ai_column, di_raw)
+        return self._quantize(self._normalize_ai(ai_column.tolist()), self._normalize_di(di_raw))
 
     def close(self):
-        for task in (self.task_ai, self.task_di):
+        for task in (getattr(self, "task_ai", None), getattr(self, "task_di", None)):
+            if task is None:
+                continue
             try:
                 task.stop()
                 task.close()
@@ -166,24 +435,25 @@ if __name__ == "__main__":
     Test mode: Print active channels in real-time.
     Useful for identifying which physical input corresponds to which channel.
     """
-    import time
+    import sys
 
     print("NiDAQ Channel Monitor")
     print("=" * 50)
     print("Move joysticks or press buttons to see active channels.")
     print("Press Ctrl+C to exit.\n")
 
-    controller = NiDAQJoysticks(output_format=OutputFormat.FLOAT, deadzone=5.0)
+    backend = "sim" if "--sim" in sys.argv else "nidaqmx"
+    controller = NiDAQJoysticks(output_format=OutputFormat.FLOAT, deadzone=5.0, backend=backend)
 
     try:
         while True:
             data = controller.read()
 
             active_channels = []
-            for i, (channel, value) in enumerate(zip(AI_CHANNELS, data.ai)):
+            for i, (channel, value) in enumerate(zip(controller.ai_channels, data.ai)):
                 if abs(value) > 0.0:
                     active_channels.append(f"[AI:{i}] {channel}: {value:+.3f}")
-            for i, (channel, value) in enumerate(zip(DI_CHANNELS, data.di)):
+            for i, (channel, value) in enumerate(zip(controller.di_channels, data.di)):
                 if value > 0.5:
                     active_channels.append(f"[DI:{i}] {channel}: PRESSED")
 
@@ -2,9 +2,10 @@
 Controller stack for merging NiDAQ joystick and USB gamepad commands.
 """
 
+from bisect import bisect_right
 import json
 from pathlib import Path
-from typing import Iterable, List, Sequence
+from typing import Callable, Iterable, List, Optional, Sequence
 
 
 DEFAULT_CONFIG_PATH = Path(__file__).resolve().parent.parent / "configuration_files" / "controller_config.json"
@@ -227,16 +228,92 @@ def apply_deadzone(value: float, deadzone: float) -> float:
     return scaled if value > 0 else -scaled
 
 
+def _expo_curve(curve: dict) -> Callable[[float], float]:
+    expo = float(curve.get("expo", 0.0))
+    if not (0.0 <= expo <= 1.0):
+        raise ValueError(f"expo curve factor must be in the range 0...1, got {expo}")
+    return lambda x: (1.0 - expo) * x + expo * x * x * x
+
+
+def _polynomial_curve(curve: dict) -> Callable[[float], float]:
+    coefficients = [float(c) for c in curve.get("coefficients", [])]
+    if not coefficients:
+        raise ValueError("polynomial curve needs a non-empty 'coefficients' list")
+
+    def evaluate(x):
+        y = 0.0
+        for c in reversed(coefficients):
+            y = y * x + c
+        return max(0.0, min(1.0, y))
+    return evaluate
+
+
+def _piecewise_curve(curve: dict) -> Callable[[float], float]:
+    try:
+        points = sorted((float(x), float(y)) for x, y in curve.get("points", []))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"piecewise curve points must be [x, y] pairs: {e}") from e
+    if any(not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0) for x, y in points):
+        raise ValueError("piecewise curve points must lie in the range 0...1")
+    if not points or points[0][0] > 0.0:
+        points.insert(0, (0.0, 0.0))
+    if points[-1][0] < 1.0:
+        points.append((1.0, 1.0))
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+
+    def evaluate(x):
+        i = min(max(bisect_right(xs, x), 1), len(xs) - 1)
+        x0, x1 = xs[i - 1], xs[i]
+        if x1 <= x0:
+            return ys[i]
+        return ys[i - 1] + (ys[i] - ys[i - 1]) * (x - x0) / (x1 - x0)
+    return evaluate
+
+
+_CURVE_TYPES = {
+    "expo": _expo_curve,
+    "polynomial": _polynomial_curve,
+    "piecewise": _piecewise_curve,
+}
+
+
+def compile_response_curve(curve) -> Optional[Callable[[float], float]]:
+    """Build a magnitude response curve [0, 1] -> [0, 1] from a config entry.
+
+    None or {"type": "linear"} means no curve. Raises ValueError for unknown
+    types or bad parameters so a typo cannot silently change stick feel.
+    """
+    if curve is None:
+        return None
+    if not isinstance(curve, dict):
+        raise ValueError(f"response curve must be an object or null, got {curve!r}")
+    kind = curve.get("type", "linear")
+    if kind == "linear":
+        return None
+    if kind not in _CURVE_TYPES:
+        raise ValueError(f"unknown response curve type '{kind}', expected one of {sorted(_CURVE_TYPES)}")
+    return _CURVE_TYPES[kind](curve)
+
+
+def _shape_axis(value: int, direction: int, deadzone: float, curve=None) -> int:
+    normalized = max(-1.0, min(1.0, float(value) * direction / 127.0))
+    shaped = apply_deadzone(normalized, deadzone)
+    if curve is not None and shaped != 0.0:
+        magnitude = curve(abs(shaped))
+        shaped = magnitude if shaped > 0 else -magnitude
+    return _clamp_int8(shaped * 127.0)
+
+
 def apply_axis_settings(
     values: Sequence[int],
     deadzones: Sequence[float],
     directions: Sequence[int],
 ) -> List[int]:
-    result = []
-    for value, deadzone, direction in zip(values, deadzones, directions):
-        normalized = max(-1.0, min(1.0, float(value) * direction / 127.0))
-        result.append(_clamp_int8(apply_deadzone(normalized, deadzone) * 127.0))
-    return result
+    return [
+        _shape_axis(value, direction, deadzone)
+        for value, deadzone, direction in zip(values, deadzones, directions)
+    ]
 
 
 def apply_axis_deadzones(values: Sequence[int], deadzones: Sequence[float]) -> List[int]:
@@ -247,18 +324,30 @@ def apply_axis_enabled(values: Sequence[int], enabled: Sequence[bool]) -> List[i
     return [value if is_enabled else 0 for value, is_enabled in zip(values, enabled)]
 
 
+def _source_index(source: dict) -> int:
+    try:
+        return int(source.get("index"))
+    except (TypeError, ValueError):
+        return -1
+
+
+def _source_direction(source: dict) -> int:
+    try:
+        return -1 if int(source.get("direction", 1)) < 0 else 1
+    except (TypeError, ValueError):
+        return 1
+
+
 def apply_axis_source(value: int, source: dict) -> int:
     if not isinstance(source, dict):
         return 0
-    try:
-        direction = -1 if int(source.get("direction", 1)) < 0 else 1
-    except (TypeError, ValueError):
-        direction = 1
     deadzone = _percent_to_fraction(source.get("deadzone_percent", 0.0))
-    return apply_axis_settings([value], [deadzone], [direction])[0]
+    curve = compile_response_curve(source.get("curve"))
+    return _shape_axis(value, _source_direction(source), deadzone, curve)
 
 
-def _packet_slots(config: dict, name: str, count: int) -> List[dict]:
+def packet_slots(config: dict, name: str, count: int) -> List[dict]:
+    """The config's `name` slots ("axes" or "buttons") by packet index; missing slots have no sources."""
     output = [{"index": i, "gamepad": None, "nidaq": None} for i in range(count)]
     raw_slots = config.get(name, [])
     if not isinstance(raw_slots, list):
@@ -282,16 +371,13 @@ def _route_packet_axes(nidaq_values: Sequence[int], gp_values: Sequence[int], co
     }
     output = []
 
-    for slot in _packet_slots(config, "axes", AXIS_COUNT):
+    for slot in packet_slots(config, "axes", AXIS_COUNT):
         nidaq_source = slot.get("nidaq")
         gp_source = slot.get("gamepad")
 
         nidaq_value = 0
         if isinstance(nidaq_source, dict):
-            try:
-                source_index = int(nidaq_source.get("index"))
-            except (TypeError, ValueError):
-                source_index = -1
+            source_index = _source_index(nidaq_source)
             if 0 <= source_index < len(nidaq_values):
                 nidaq_value = apply_axis_source(nidaq_values[source_index], nidaq_source)
 
@@ -307,15 +393,12 @@ def _route_packet_axes(nidaq_values: Sequence[int], gp_values: Sequence[int], co
 def _route_packet_buttons(nidaq_values: Sequence[bool], gp: dict, config: dict) -> List[bool]:
     output = []
 
-    for slot in _packet_slots(config, "buttons", BUTTON_COUNT):
+    for slot in packet_slots(config, "buttons", BUTTON_COUNT):
         pressed = False
 
         nidaq_source = slot.get("nidaq")
         if isinstance(nidaq_source, dict):
-            try:
-                source_index = int(nidaq_source.get("index"))
-            except (TypeError, ValueError):
-                source_index = -1
+            source_index = _source_index(nidaq_source)
             if 0 <= source_index < len(nidaq_values):
                 pressed = pressed or bool(nidaq_values[source_index])
 
@@ -329,6 +412,107 @@ def _route_packet_buttons(nidaq_values: Sequence[bool], gp: dict, config: dict)
     return output
 
 
+def _axis_table(shape: tuple) -> List[int]:
+    """Precompute `_shape_axis` for every int8 input.
+
+    Entry i holds the result for i (0...127) and i - 256 (128...255), so a
+    signed int8 value indexes the table directly via negative indexing.
+    """
+    return [_shape_axis(i if i < 128 else i - 256, *shape) for i in range(256)]
+
+
+def _gamepad_axis_source_index(source: dict) -> int:
+    name = source.get("name")
+    if isinstance(name, str) and name in GAMEPAD_AXIS_NAMES:
+        return GAMEPAD_AXIS_NAMES.index(name)
+    return -1
+
+
+def _compile_axis_source(source, index_of) -> tuple:
+    """Return (source_index, (direction, deadzone, curve)) with -1 for a disabled source."""
+    if not isinstance(source, dict):
+        return -1, (1, 0.0, None)
+    deadzone = _percent_to_fraction(source.get("deadzone_percent", 0.0))
+    curve = compile_response_curve(source.get("curve"))
+    return index_of(source), (_source_direction(source), deadzone, curve)
+
+
+class PacketRoutes:
+    """Packet slot routing compiled once from the controller config.
+
+    Produces the same output as `_route_packet_axes` and
+    `_route_packet_buttons`, but source indices, directions, deadzones and
+    button sources are resolved at construction so the per-tick path only does
+    indexing and arithmetic.
+
+    With lut=True each slot source also gets a 256-entry table holding the
+    complete direction/deadzone/response-curve/clamp/quantize result, so
+    shaping an axis is a single list index whatever the curve. Axis inputs
+    must then be int8 values (-128...127), which is what NiDAQ INT8 output
+    and `_gp_to_channels` produce.
+    """
+
+    def __init__(self, config: dict, lut: bool = False):
+        self.axes = []
+        for slot in packet_slots(config, "axes", AXIS_COUNT):
+            nidaq_route = _compile_axis_source(slot.get("nidaq"), _source_index)
+            gp_route = _compile_axis_source(slot.get("gamepad"), _gamepad_axis_source_index)
+            self.axes.append(nidaq_route + gp_route)
+
+        self.axis_tables = None
+        if lut:
+            self.axis_tables = [
+                (nidaq_index, _axis_table(nidaq_shape), gp_index, _axis_table(gp_shape))
+                for nidaq_index, nidaq_shape, gp_index, gp_shape in self.axes
+            ]
+
+        self.buttons = []
+        for slot in packet_slots(config, "buttons", BUTTON_COUNT):
+            nidaq_source = slot.get("nidaq")
+            gp_source = slot.get("gamepad")
+            nidaq_index = _source_index(nidaq_source) if isinstance(nidaq_source, dict) else -1
+            gp_name = gp_source.get("name") if isinstance(gp_source, dict) else None
+            if gp_name not in GAMEPAD_BUTTON_NAMES:
+                gp_name = None
+            self.buttons.append((nidaq_index, gp_name))
+
+    def route_axes(self, nidaq_values: Sequence[int], gp_values: Sequence[int]) -> List[int]:
+        if self.axis_tables is not None:
+            return self._route_axes_lut(nidaq_values, gp_values)
+        nidaq_count = len(nidaq_values)
+        gp_count = len(gp_values)
+        output = []
+        for nidaq_index, nidaq_shape, gp_index, gp_shape in self.axes:
+            nidaq_value = 0
+            if 0 <= nidaq_index < nidaq_count:
+                nidaq_value = _shape_axis(nidaq_values[nidaq_index], *nidaq_shape)
+            gp_value = 0
+            if 0 <= gp_index < gp_count:
+                gp_value = _shape_axis(gp_values[gp_index], *gp_shape)
+            output.append(nidaq_value if abs(nidaq_value) >= abs(gp_value) else gp_value)
+        return output
+
+    def _route_axes_lut(self, nidaq_values: Sequence[int], gp_values: Sequence[int]) -> List[int]:
+        nidaq_count = len(nidaq_values)
+        gp_count = len(gp_values)
+        output = []
+        for nidaq_index, nidaq_table, gp_index, gp_table in self.axis_tables:
+            nidaq_value = nidaq_table[nidaq_values[nidaq_index]] if 0 <= nidaq_index < nidaq_count else 0
+            gp_value = gp_table[gp_values[gp_index]] if 0 <= gp_index < gp_count else 0
+            output.append(nidaq_value if abs(nidaq_value) >= abs(gp_value) else gp_value)
+        return output
+
+    def route_buttons(self, nidaq_values: Sequence[bool], gp: dict) -> List[bool]:
+        nidaq_count = len(nidaq_values)
+        output = []
+        for nidaq_index, gp_name in self.buttons:
+            pressed = 0 <= nidaq_index < nidaq_count and bool(nidaq_values[nidaq_index])
+            if not pressed and gp_name is not None:
+                pressed = bool(gp.get(gp_name, False))
+            output.append(pressed)
+        return output
+
+
 def _gp_to_channels(gp: dict):
     """Convert XboxController.read() dict to (ai: List[int8], di: List[bool])."""
     def joy(v):
@@ -371,33 +555,52 @@ def _merge(nidaq_ai, nidaq_di, gp_ai, gp_di):
     return ai, di
 
 
+def _as_list(values):
+    """Return NiDAQ ndarray output as a list of Python scalars for fast indexing."""
+    tolist = getattr(values, "tolist", None)
+    return tolist() if tolist is not None else values
+
+
 def to_mask(di: Iterable[bool]) -> int:
     return sum(1 << i for i, v in enumerate(di) if v)
 
 
 class ControllerStack:
-    def __init__(self, config_path=DEFAULT_CONFIG_PATH, nidaq_sample_rate=100):
-        from modules.NiDAQ_controller import NiDAQJoysticks, OutputFormat
+    def __init__(self, config_path=DEFAULT_CONFIG_PATH, nidaq_sample_rate=100, axis_lut=True, nidaq_options=None,
+                 use_nidaq=True):
+        """
+        :param nidaq_options: Extra NiDAQJoysticks keyword arguments, e.g.
+                              acquisition_rate and block_filter.
+        :param use_nidaq: False runs gamepad-only with neutral NiDAQ inputs.
+                          read() then no longer blocks on the DAQ, so the
+                          caller must pace it.
+        """
+        from modules.NiDAQ_controller import AI_LINES, DI_LINES, JoystickData, NiDAQJoysticks, OutputFormat
         from modules.gamepad_module import XboxController
 
         config = load_controller_config(config_path)
         self.config = config
-        self.joy = NiDAQJoysticks(
-            output_format=OutputFormat.INT8,
-            deadzone=0.0,
-            padding=2.5,
-            sample_rate=nidaq_sample_rate,
-        )
+        self.routes = PacketRoutes(config, lut=axis_lut)
+        self.joy = None
+        if use_nidaq:
+            self.joy = NiDAQJoysticks(
+                output_format=OutputFormat.INT8,
+                deadzone=0.0,
+                padding=2.5,
+                sample_rate=nidaq_sample_rate,
+                **(nidaq_options or {}),
+            )
+        self._neutral_nidaq = JoystickData(ai=[0] * len(AI_LINES), di=[0] * len(DI_LINES))
         self.gamepad = XboxController()
 
     def read(self) -> dict:
-        nidaq = self.joy.read()
+        nidaq = self.joy.read() if self.joy is not None else self._neutral_nidaq
         gp = self.gamepad.read()
 
-        nidaq_di = [v > 0 for v in nidaq.di]
+        nidaq_di = [v > 0 for v in _as_list(nidaq.di)]
         gp_ai, gp_di = _gp_to_channels(gp)
-        ai = _route_packet_axes(nidaq.ai, gp_ai, self.config)
-        di = _route_packet_buttons(nidaq_di, gp, self.config)
+        ai = self.routes.route_axes(_as_list(nidaq.ai), gp_ai)
+        di = self.routes.route_buttons(nidaq_di, gp)
 
         return {
             "ai": ai,
@@ -410,4 +613,5 @@ class ControllerStack:
         try:
             self.gamepad.stop_monitoring()
         finally:
-            self.joy.close()
+            if self.joy is not None:
+                self.joy.close()
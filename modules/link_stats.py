@@ -0,0 +1,259 @@
+"""
+Per-link packet statistics for the UDP protocol.
+
+SequenceTracker follows the RTP receiver rules from RFC 3550 (A.1 sequence
+validation, A.3 loss, A.8 interarrival jitter) for a 16-bit sequence number,
+with O(1) work per packet and no per-packet allocation. ClockSync turns
+NTP-style probe timestamps into round-trip time, clock offset and one-way
+delay estimates.
+"""
+
+from typing import Optional
+
+SEQ_MOD = 1 << 16
+TIMESTAMP_MOD = 1 << 32
+
+
+class SequenceTracker:
+    """Extended sequence tracking with loss, reorder, burst-loss and jitter statistics.
+
+    update() returns True only for packets newer than every packet accepted
+    so far, so a delayed packet never overwrites a newer command.
+
+    :param max_dropout: Largest forward jump treated as loss rather than a
+                        sender restart
+    :param max_misorder: Largest backward distance treated as a late packet
+                         rather than a sender restart
+    """
+
+    def __init__(self, max_dropout: int = 3000, max_misorder: int = 100):
+        self.max_dropout = max_dropout
+        self.max_misorder = max_misorder
+        self.reset()
+
+    def reset(self):
+        self.max_seq = None
+        self.cycles = 0
+        self.base_seq = 0
+        self.received = 0          # packets that passed validation, in order or late
+        self.accepted = 0          # packets that were the newest when they arrived
+        self.reordered = 0         # late packets (arrived after a newer one)
+        self.duplicates = 0
+        self.resyncs = 0
+        self.bursts = 0            # gaps of one or more missing packets
+        self.burst_lost = 0        # packets missing across all gaps
+        self.max_burst = 0
+        self.jitter_ms = 0.0
+        self._bad_seq = None
+        self._last_timestamp_ms = None
+        self._last_arrival_ms = None
+
+    def update(self, seq: int, timestamp_ms: Optional[int], arrival_ms: float, skipped: int = 0) -> bool:
+        """Record a packet; return True if it is the newest and should be used.
+
+        :param seq: 16-bit sequence number from the packet
+        :param timestamp_ms: Sender's 32-bit millisecond timestamp, or None
+                             if the packet has none (jitter is then not updated)
+        :param arrival_ms: Local arrival time in ms (any epoch, e.g. monotonic)
+        :param skipped: Older packets that arrived in the same drain and were
+                        discarded unread; they count as received, not lost.
+        """
+        if self.max_seq is None:
+            self._start(seq)
+        else:
+            delta = (seq - self.max_seq) % SEQ_MOD
+            if delta == 0:
+                self.duplicates += 1
+                return False
+            if delta < self.max_dropout:
+                if seq < self.max_seq:
+                    self.cycles += SEQ_MOD
+                self.received += skipped
+                gap = delta - 1 - skipped
+                if gap > 0:
+                    self.bursts += 1
+                    self.burst_lost += gap
+                    if gap > self.max_burst:
+                        self.max_burst = gap
+                self.max_seq = seq
+            elif delta >= SEQ_MOD - self.max_misorder:
+                self.received += 1
+                self.reordered += 1
+                return False
+            else:
+                # Large jump: accept only once two consecutive packets confirm
+                # the sender restarted (RFC 3550 A.1).
+                if seq != self._bad_seq:
+                    self._bad_seq = (seq + 1) % SEQ_MOD
+                    return False
+                self.resyncs += 1
+                self._start(seq)
+
+        self.received += 1
+        self.accepted += 1
+        if timestamp_ms is not None:
+            self._update_jitter(timestamp_ms, arrival_ms)
+        return True
+
+    def _start(self, seq):
+        self.max_seq = seq
+        self.cycles = 0
+        self.base_seq = seq
+        self.received = 0
+        self._bad_seq = None
+        self._last_timestamp_ms = None
+
+    def _update_jitter(self, timestamp_ms, arrival_ms):
+        # D = (Rj - Ri) - (Sj - Si): the difference in transit time between
+        # consecutive packets, so the unknown clock offset cancels.
+        if self._last_timestamp_ms is not None:
+            sent_delta = (timestamp_ms - self._last_timestamp_ms) % TIMESTAMP_MOD
+            if sent_delta >= TIMESTAMP_MOD // 2:
+                sent_delta -= TIMESTAMP_MOD
+            d = abs((arrival_ms - self._last_arrival_ms) - sent_delta)
+            self.jitter_ms += (d - self.jitter_ms) / 16.0
+        self._last_timestamp_ms = timestamp_ms
+        self._last_arrival_ms = arrival_ms
+
+    @property
+    def expected(self) -> int:
+        if self.max_seq is None:
+            return 0
+        return self.cycles + self.max_seq - self.base_seq + 1
+
+    def stats(self) -> dict:
+        expected = self.expected
+        lost = max(0, expected - self.received)
+        return {
+            'packets_expected': expected,
+            'packets_lost': lost,
+            'loss_rate': lost / expected if expected else 0.0,
+            'packets_reordered': self.reordered,
+            'packets_duplicate': self.duplicates,
+            'sequence_resyncs': self.resyncs,
+            'loss_bursts': self.bursts,
+            'max_burst_loss': self.max_burst,
+            'mean_burst_loss': self.burst_lost / self.bursts if self.bursts else 0.0,
+            'jitter_ms': self.jitter_ms,
+        }
+
+
+class PathStats:
+    """First-arrival de-duplication and per-path delivery statistics for redundant sends.
+
+    Every copy of a packet carries the same sequence number and its own path
+    id. The first copy to arrive is accepted; later copies are dropped and
+    record how far behind the winner they arrived, which measures the
+    latency each path adds or saves.
+
+    :param window: Recent sequence numbers remembered (a power of two that
+                   divides 2**16)
+    """
+
+    def __init__(self, window: int = 1024):
+        if window <= 0 or SEQ_MOD % window:
+            raise ValueError("window must be a power of two <= 65536")
+        self.window = window
+        self._seqs = [-1] * window
+        self._first_ms = [0.0] * window
+        self.first_arrivals = {}
+        self.duplicates = {}
+        self._lag_ms = {}
+
+    def first_arrival(self, seq: int, path: int, arrival_ms: float) -> bool:
+        """Return True for the first copy of seq; record path statistics either way."""
+        slot = seq % self.window
+        if self._seqs[slot] == seq:
+            self.duplicates[path] = self.duplicates.get(path, 0) + 1
+            self._lag_ms[path] = self._lag_ms.get(path, 0.0) + (arrival_ms - self._first_ms[slot])
+            return False
+        self._seqs[slot] = seq
+        self._first_ms[slot] = arrival_ms
+        self.first_arrivals[path] = self.first_arrivals.get(path, 0) + 1
+        return True
+
+    def stats(self) -> dict:
+        paths = sorted(set(self.first_arrivals) | set(self.duplicates))
+        return {
+            'path_first_arrivals': {p: self.first_arrivals.get(p, 0) for p in paths},
+            'path_duplicates': {p: self.duplicates.get(p, 0) for p in paths},
+            'path_mean_lag_ms': {
+                p: self._lag_ms[p] / self.duplicates[p] if self.duplicates.get(p) else 0.0 for p in paths
+            },
+        }
+
+
+class ClockSync:
+    """Round-trip time and clock offset from NTP-style probe exchanges (RFC 5905).
+
+    Each exchange gives four wall-clock times: t1 probe sent and t4 reply
+    received on the local clock, t2 probe received and t3 reply sent on the
+    remote clock. Then
+
+        rtt    = (t4 - t1) - (t3 - t2)
+        offset = ((t2 - t1) + (t3 - t4)) / 2      (remote clock - local clock)
+
+    The offset assumes a symmetric path, and queueing on either leg biases
+    it, so like NTP's clock filter the estimate comes from the sample with
+    the lowest RTT among the last `window` exchanges. The smoothed RTT and
+    its variation follow RFC 6298.
+
+    :param window: Recent exchanges considered by the minimum-delay filter
+    """
+
+    def __init__(self, window: int = 8):
+        if window < 1:
+            raise ValueError("window must be >= 1")
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self._samples = []  # (rtt, offset), at most `window`
+        self.samples = 0
+        self.rtt = None
+        self.srtt = None
+        self.rttvar = None
+        self.min_rtt = None
+        self.offset = None
+        self.forward_delay = None
+
+    def add(self, t1: float, t2: float, t3: float, t4: float) -> float:
+        """Record one exchange (times in seconds); return its round-trip time."""
+        # Timer granularity can make a very fast exchange look negative.
+        rtt = max(0.0, (t4 - t1) - (t3 - t2))
+        offset = ((t2 - t1) + (t3 - t4)) / 2.0
+        self.samples += 1
+        self._samples.append((rtt, offset))
+        if len(self._samples) > self.window:
+            del self._samples[0]
+        self.offset = min(self._samples)[1]
+
+        self.rtt = rtt
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar += (abs(self.srtt - rtt) - self.rttvar) / 4.0
+            self.srtt += (rtt - self.srtt) / 8.0
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+        # Local-to-remote transit of this probe, on the local clock.
+        self.forward_delay = max(0.0, (t2 - t1) - self.offset)
+        return rtt
+
+    def to_local(self, remote_time: float) -> float:
+        """Convert a remote wall-clock time to the local clock."""
+        return remote_time - (self.offset or 0.0)
+
+    def stats(self) -> dict:
+        def ms(value):
+            return value * 1000.0 if value is not None else None
+
+        return {
+            'rtt_ms': ms(self.rtt),
+            'srtt_ms': ms(self.srtt),
+            'rttvar_ms': ms(self.rttvar),
+            'min_rtt_ms': ms(self.min_rtt),
+            'clock_offset_ms': ms(self.offset),
+            'one_way_delay_ms': ms(self.forward_delay),
+        }
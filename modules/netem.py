@@ -0,0 +1,336 @@
+"""
+In-process network impairment for UDPSocket testing.
+
+LTE-like links lose packets in bursts, add delay spikes and occasionally
+duplicate or reorder datagrams. LinkModel reproduces that for one direction
+with a seeded RNG, and ImpairedSocket puts one model on the send side and
+one on the receive side of a real UDP socket:
+
+    udp = UDPSocket(sequence_numbers=True)
+    udp.setup("127.0.0.1", 8080, outputs="<8bH")
+    impair(udp, tx=LinkModel(**LINK_PRESETS["lte_poor"], seed=1))
+    udp.handshake()
+
+Everything above the socket (handshake, timeouts, MAC, max-age expiry,
+receive modes) runs unchanged, so its behaviour can be measured on one
+machine. Impairment is applied in user space, so it is not as precise as
+the kernel's netem qdisc, but it needs no root and is reproducible.
+"""
+
+import random
+import select
+import socket
+import struct
+import threading
+import time
+from typing import List, Optional
+
+from modules.udp_socket import IP_UDP_OVERHEAD, DelayedSender
+
+DELAY_DISTRIBUTIONS = ('constant', 'uniform', 'normal', 'pareto')
+_PARETO_ALPHA = 2.5
+_ADDR_HEADER = struct.Struct('!4sH')
+
+# Rough link models; tune to measured traces where available.
+LINK_PRESETS = {
+    'lan': dict(delay_ms=0.2, jitter_ms=0.05),
+    'lte_good': dict(delay_ms=25.0, jitter_ms=5.0, distribution='normal', loss=0.002,
+                     burst_enter=0.002, burst_exit=0.3, rate_kbps=5000.0),
+    'lte_poor': dict(delay_ms=60.0, jitter_ms=20.0, distribution='pareto', loss=0.01,
+                     burst_enter=0.01, burst_exit=0.15, reorder=0.005, duplicate=0.002, rate_kbps=500.0),
+}
+
+
+class LinkModel:
+    """One direction of an impaired link.
+
+    Loss follows a Gilbert-Elliott model: a good state with `loss`
+    probability and a bad state with `burst_loss`, entered with probability
+    `burst_enter` and left with `burst_exit` per packet, so mean burst
+    length is 1 / burst_exit. The bandwidth cap serializes packets at
+    `rate_kbps` (IP/UDP headers included) and tail-drops once the queue
+    holds more than `queue_ms` of traffic.
+
+    :param delay_ms: Base one-way delay
+    :param jitter_ms: Spread of the delay distribution (standard deviation
+                      for 'normal', half-width for 'uniform', scale of the
+                      tail for 'pareto')
+    :param distribution: One of DELAY_DISTRIBUTIONS
+    :param reorder: Probability that a packet is held back by `reorder_ms`
+                    so later packets overtake it
+    :param duplicate: Probability that a packet is delivered twice
+    :param preserve_order: Jitter alone never reorders packets, as on a
+                           link with a FIFO queue
+    :param seed: RNG seed; the same seed gives the same impairment sequence
+    """
+
+    def __init__(self, delay_ms: float = 0.0, jitter_ms: float = 0.0, distribution: str = 'normal',
+                 loss: float = 0.0, burst_enter: float = 0.0, burst_exit: float = 1.0, burst_loss: float = 1.0,
+                 reorder: float = 0.0, reorder_ms: float = 10.0, duplicate: float = 0.0,
+                 rate_kbps: Optional[float] = None, queue_ms: float = 200.0, preserve_order: bool = True,
+                 seed: int = 0):
+        if distribution not in DELAY_DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {DELAY_DISTRIBUTIONS}")
+        for name, value in (('loss', loss), ('burst_enter', burst_enter), ('burst_exit', burst_exit),
+                            ('burst_loss', burst_loss), ('reorder', reorder), ('duplicate', duplicate)):
+            if not 0.0 <= value <= 1.0:
+                raise ValueError(f"{name} must be a probability in 0...1")
+        if delay_ms < 0 or jitter_ms < 0 or reorder_ms < 0 or queue_ms < 0:
+            raise ValueError("delays must be >= 0")
+        if rate_kbps is not None and rate_kbps <= 0:
+            raise ValueError("rate_kbps must be greater than 0")
+        self.delay = delay_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.distribution = distribution
+        self.loss = loss
+        self.burst_enter = burst_enter
+        self.burst_exit = burst_exit
+        self.burst_loss = burst_loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_ms / 1000.0
+        self.duplicate = duplicate
+        self.rate_bps = rate_kbps * 1000.0 if rate_kbps else None
+        self.queue_limit = queue_ms / 1000.0
+        self.preserve_order = preserve_order
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        self._rng = random.Random(self.seed)
+        self._bad = False
+        self._link_free = 0.0
+        self._last_due = 0.0
+        self.packets = 0
+        self.lost = 0
+        self.queue_drops = 0
+        self.duplicated = 0
+        self.reordered = 0
+        self.delivered = 0
+        self._delay_sum = 0.0
+
+    def plan(self, size: int, now: float) -> List[float]:
+        """Return the delivery delay in seconds of each copy of a packet; [] if it is lost."""
+        rng = self._rng
+        self.packets += 1
+
+        # Gilbert-Elliott state transition, then loss in the current state.
+        if self._bad:
+            if rng.random() < self.burst_exit:
+                self._bad = False
+        elif rng.random() < self.burst_enter:
+            self._bad = True
+        if rng.random() < (self.burst_loss if self._bad else self.loss):
+            self.lost += 1
+            return []
+
+        departure = now
+        if self.rate_bps:
+            start = max(now, self._link_free)
+            if start - now > self.queue_limit:
+                self.queue_drops += 1
+                return []
+            self._link_free = start + (size + IP_UDP_OVERHEAD) * 8.0 / self.rate_bps
+            departure = self._link_free
+
+        due = departure + self._sample_delay()
+        if self.reorder and rng.random() < self.reorder:
+            due += self.reorder_delay
+            self.reordered += 1
+        else:
+            if self.preserve_order:
+                due = max(due, self._last_due)
+            self._last_due = due
+
+        delays = [due - now]
+        if self.duplicate and rng.random() < self.duplicate:
+            self.duplicated += 1
+            delays.append(due - now)
+        self.delivered += len(delays)
+        self._delay_sum += (due - now) * len(delays)
+        return delays
+
+    def _sample_delay(self) -> float:
+        jitter = self.jitter
+        if not jitter or self.distribution == 'constant':
+            return self.delay
+        rng = self._rng
+        if self.distribution == 'uniform':
+            sample = self.delay + rng.uniform(-jitter, jitter)
+        elif self.distribution == 'normal':
+            sample = rng.gauss(self.delay, jitter)
+        else:
+            # Heavy tail: most packets near the base delay, rare long spikes.
+            sample = self.delay + jitter * (rng.paretovariate(_PARETO_ALPHA) - 1.0)
+        return max(0.0, sample)
+
+    def stats(self) -> dict:
+        return {
+            'packets': self.packets,
+            'lost': self.lost,
+            'queue_drops': self.queue_drops,
+            'duplicated': self.duplicated,
+            'reordered': self.reordered,
+            'delivered': self.delivered,
+            'loss_rate': (self.lost + self.queue_drops) / self.packets if self.packets else 0.0,
+            'mean_delay_ms': self._delay_sum / self.delivered * 1000.0 if self.delivered else 0.0,
+        }
+
+
+class ImpairedSocket:
+    """A UDP socket with a LinkModel on each direction.
+
+    Sends are passed through the tx model and sent late from a scheduler
+    thread. Received datagrams are read by a pump thread, passed through
+    the rx model and delivered through a local socket pair, so select(),
+    timeouts and non-blocking reads behave like the real socket. Other
+    socket methods are passed through.
+    """
+
+    def __init__(self, sock: socket.socket, tx: Optional[LinkModel] = None, rx: Optional[LinkModel] = None):
+        self._sock = sock
+        self.tx = tx
+        self.rx = rx
+        self.send_errors = 0
+        self.rx_overflows = 0
+        self._scheduler = DelayedSender(self._deliver)
+        self._running = True
+        self._rx_read = self._rx_write = None
+        self._pump = None
+        if rx is not None:
+            self._rx_read, self._rx_write = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._rx_read.settimeout(sock.gettimeout())
+            self._rx_write.setblocking(False)
+            self._pump = threading.Thread(target=self._pump_loop, daemon=True)
+            self._pump.start()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    # Send side
+    def sendto(self, data, addr):
+        if self.tx is None:
+            return self._sock.sendto(data, addr)
+        for delay in self.tx.plan(len(data), time.monotonic()):
+            if delay <= 0.0:
+                self._sock.sendto(data, addr)
+            else:
+                self._scheduler.schedule(delay, self._sock, bytes(data), addr)
+        return len(data)
+
+    def stop_tx(self):
+        """Send unimpaired from now on and drop delayed sends still pending.
+
+        For final stop commands: they are neither lost nor delayed by the
+        model, and no older command still in the delay queue can arrive
+        after them.
+        """
+        self.tx = None
+        self._scheduler.cancel(self._sock)
+
+    def _deliver(self, sock, data, addr):
+        try:
+            if sock is self._sock:
+                sock.sendto(data, addr)
+            else:
+                ip, port = addr
+                sock.send(_ADDR_HEADER.pack(socket.inet_aton(ip), port) + data)
+        except (BlockingIOError, socket.timeout):
+            if sock is self._sock:
+                self.send_errors += 1
+            else:
+                self.rx_overflows += 1
+        except OSError:
+            # Closed while a delayed packet was pending.
+            if self._running:
+                self.send_errors += 1
+
+    # Receive side
+    def _pump_loop(self):
+        sock = self._sock
+        while self._running:
+            try:
+                readable, _, _ = select.select([sock], [], [], 0.2)
+                if not readable:
+                    continue
+                data, addr = sock.recvfrom(65535)
+            except (BlockingIOError, socket.timeout):
+                continue
+            except OSError:
+                if self._running:
+                    time.sleep(0.01)
+                continue
+            for delay in self.rx.plan(len(data), time.monotonic()):
+                if delay <= 0.0:
+                    self._deliver(self._rx_write, data, addr)
+                else:
+                    self._scheduler.schedule(delay, self._rx_write, data, addr)
+
+    def _unwrap(self, packet):
+        ip, port = _ADDR_HEADER.unpack_from(packet)
+        return packet[_ADDR_HEADER.size:], (socket.inet_ntoa(ip), port)
+
+    def recvfrom(self, bufsize):
+        if self.rx is None:
+            return self._sock.recvfrom(bufsize)
+        return self._unwrap(self._rx_read.recv(bufsize + _ADDR_HEADER.size))
+
+    def recvfrom_into(self, buffer, nbytes=0):
+        if self.rx is None:
+            return self._sock.recvfrom_into(buffer, nbytes)
+        data, addr = self._unwrap(self._rx_read.recv((nbytes or len(buffer)) + _ADDR_HEADER.size))
+        size = min(len(data), len(buffer))
+        buffer[:size] = data[:size]
+        return size, addr
+
+    def fileno(self):
+        return self._rx_read.fileno() if self._rx_read is not None else self._sock.fileno()
+
+    # Socket modes apply to the reader the application sees as well.
+    def settimeout(self, timeout):
+        self._sock.settimeout(timeout)
+        if self._rx_read is not None:
+            self._rx_read.settimeout(timeout)
+
+    def setblocking(self, flag):
+        self._sock.setblocking(flag)
+        if self._rx_read is not None:
+            self._rx_read.setblocking(flag)
+
+    @property
+    def tx_dropped(self) -> int:
+        """Sends lost or tail-dropped by the tx model."""
+        return self.tx.lost + self.tx.queue_drops if self.tx else 0
+
+    def stats(self) -> dict:
+        return {
+            'tx': self.tx.stats() if self.tx else None,
+            'rx': self.rx.stats() if self.rx else None,
+            'send_errors': self.send_errors,
+            'rx_overflows': self.rx_overflows,
+        }
+
+    def close(self):
+        self._running = False
+        self._scheduler.stop()
+        if self._pump is not None:
+            self._pump.join(timeout=1.0)
+        for sock in (self._rx_read, self._rx_write):
+            if sock is not None:
+                sock.close()
+        self._sock.close()
+
+
+def impair(udp, tx: Optional[LinkModel] = None, rx: Optional[LinkModel] = None) -> ImpairedSocket:
+    """Wrap udp.socket (a UDPSocket or UDPSessionServer, after setup()) in an ImpairedSocket.
+
+    Packets the tx model drops behave like loss on the network. They are
+    not in udp's packets_dropped, which counts only local send-buffer
+    drops. As on a real link, the sender sees them through the peer's probe
+    replies (remote_loss_rate and recent_loss_rate, which the adaptive rate
+    controller uses). The returned socket's tx_dropped and stats() give the
+    exact counts.
+    """
+    if udp.socket is None:
+        raise ValueError("call setup() before impair()")
+    udp.socket = ImpairedSocket(udp.socket, tx=tx, rx=rx)
+    return udp.socket
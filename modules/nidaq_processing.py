@@ -0,0 +1,399 @@
+"""
+Vectorized processing for drained NiDAQ sample blocks.
+
+Block filters reduce a (channels, samples) block to one value per channel.
+They let the AI task sample faster than the send rate and still hand the
+control loop a single, cleaner sample per tick.
+"""
+
+from collections import deque
+import math
+import threading
+import time
+
+import numpy as np
+
+
+BLOCK_FILTERS = ("latest", "mean", "median", "iir", "fir")
+_IIR_CACHED_BLOCK_SIZES = 8  # bounds IIRLowPass weights under variable-length reads
+
+
+class BlockFilter:
+    """Reduce a (channels, samples) block to a (channels,) float64 array.
+
+    The returned array is reused between calls; copy it if it must outlive
+    the next reduce().
+    """
+
+    def __init__(self, channels: int):
+        self.channels = channels
+        self._out = np.zeros(channels, dtype=np.float64)
+
+    def reset(self):
+        pass
+
+    def reduce(self, block: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class LatestFilter(BlockFilter):
+    """Newest sample only (the original NiDAQ behaviour)."""
+
+    def reduce(self, block):
+        self._out[:] = block[:, -1]
+        return self._out
+
+
+class MeanFilter(BlockFilter):
+    """Mean over the newest `window` samples of the block."""
+
+    def __init__(self, channels: int, window: int):
+        super().__init__(channels)
+        self.window = max(1, int(window))
+
+    def reduce(self, block):
+        np.mean(block[:, -self.window:], axis=1, out=self._out)
+        return self._out
+
+
+class MedianFilter(MeanFilter):
+    """Median over the newest `window` samples; rejects single-sample spikes."""
+
+    def reduce(self, block):
+        np.median(block[:, -self.window:], axis=1, out=self._out)
+        return self._out
+
+
+def _per_channel(value, channels: int, name: str) -> np.ndarray:
+    values = np.broadcast_to(np.asarray(value, dtype=np.float64), (channels,)).copy()
+    if np.any(values <= 0):
+        raise ValueError(f"{name} must be greater than 0")
+    return values
+
+
+class IIRLowPass(BlockFilter):
+    """One-pole low-pass per channel, evaluated for a whole block at once.
+
+    y[k] = a*y[k-1] + (1-a)*x[k] unrolls over an n-sample block to
+    y[n] = a^n * y[0] + sum((1-a) * a^(n-1-k) * x[k]), so a block costs one
+    weighted sum per channel instead of a Python loop over samples.
+    """
+
+    def __init__(self, channels: int, sample_rate: float, cutoff_hz):
+        super().__init__(channels)
+        cutoff = _per_channel(cutoff_hz, channels, "cutoff_hz")
+        self.alpha = np.exp(-2.0 * math.pi * cutoff / float(sample_rate))
+        self._weights = {}
+        self._primed = False
+
+    def reset(self):
+        self._primed = False
+
+    def _block_weights(self, n: int):
+        cached = self._weights.get(n)
+        if cached is None:
+            powers = self.alpha[:, None] ** np.arange(n - 1, -1, -1, dtype=np.float64)[None, :]
+            cached = ((1.0 - self.alpha)[:, None] * powers, self.alpha ** n)
+            if len(self._weights) >= _IIR_CACHED_BLOCK_SIZES:
+                # Evict the oldest block size; dicts keep insertion order.
+                del self._weights[next(iter(self._weights))]
+            self._weights[n] = cached
+        return cached
+
+    def reduce(self, block):
+        if not self._primed:
+            # Start from the first sample rather than 0 V, which would map to
+            # full negative deflection.
+            self._out[:] = block[:, 0]
+            self._primed = True
+        weights, decay = self._block_weights(block.shape[1])
+        self._out *= decay
+        self._out += np.einsum("ij,ij->i", block, weights)
+        return self._out
+
+
+def design_lowpass_taps(sample_rate: float, cutoff_hz: float, taps: int) -> np.ndarray:
+    """Hamming-windowed sinc low-pass with unity DC gain."""
+    if taps < 1:
+        raise ValueError("taps must be at least 1")
+    if not (0 < cutoff_hz < sample_rate / 2.0):
+        raise ValueError("cutoff_hz must be between 0 and half the sample rate")
+    n = np.arange(taps, dtype=np.float64) - (taps - 1) / 2.0
+    h = np.sinc(2.0 * cutoff_hz / sample_rate * n) * np.hamming(taps)
+    return h / h.sum()
+
+
+class FIRLowPass(BlockFilter):
+    """Windowed-sinc FIR low-pass per channel, evaluated at the newest sample.
+
+    Adds (taps - 1) / 2 samples of group delay at the acquisition rate, e.g.
+    15 ms for 31 taps at 1 kHz.
+    """
+
+    def __init__(self, channels: int, sample_rate: float, cutoff_hz, taps: int = 31):
+        super().__init__(channels)
+        cutoff = _per_channel(cutoff_hz, channels, "cutoff_hz")
+        # Stored oldest-first so they line up with the history buffer.
+        self.taps = np.stack([design_lowpass_taps(sample_rate, c, taps)[::-1] for c in cutoff])
+        self._history = np.zeros((channels, taps), dtype=np.float64)
+        self._primed = False
+
+    def reset(self):
+        self._primed = False
+
+    def reduce(self, block):
+        taps = self._history.shape[1]
+        n = block.shape[1]
+        if not self._primed:
+            self._history[:] = block[:, :1]
+            self._primed = True
+        if n >= taps:
+            self._history[:] = block[:, -taps:]
+        else:
+            self._history[:, :-n] = self._history[:, n:]
+            self._history[:, -n:] = block
+        np.einsum("ij,ij->i", self._history, self.taps, out=self._out)
+        return self._out
+
+
+def make_block_filter(kind: str, channels: int, sample_rate: float, block_size: int,
+                      cutoff_hz=None, taps: int = 31) -> BlockFilter:
+    """Build a block filter by name, see BLOCK_FILTERS."""
+    if kind == "latest":
+        return LatestFilter(channels)
+    if kind == "mean":
+        return MeanFilter(channels, block_size)
+    if kind == "median":
+        return MedianFilter(channels, block_size)
+    if kind in ("iir", "fir"):
+        if cutoff_hz is None:
+            raise ValueError(f"'{kind}' block filter needs cutoff_hz")
+        if kind == "iir":
+            return IIRLowPass(channels, sample_rate, cutoff_hz)
+        return FIRLowPass(channels, sample_rate, cutoff_hz, taps)
+    raise ValueError(f"Unknown block filter '{kind}', expected one of {BLOCK_FILTERS}")
+
+
+class AINormalizer:
+    """Voltage-to-output mapping for one AI column as array operations.
+
+    Matches NiDAQJoysticks' per-channel loop (range mapping, clamp, deadzone,
+    edge padding, int8 rounding) bit for bit, but writes into preallocated
+    arrays so a read creates no per-channel Python objects. The returned
+    arrays are reused between calls.
+    """
+
+    def __init__(self, channels: int, min_voltage: float, max_voltage: float,
+                 deadzone: float = 0.0, padding: float = 0.0):
+        """
+        :param deadzone: Deadzone as a fraction (0...<1)
+        :param padding: Edge padding as a fraction (0...<1)
+        """
+        self.channels = channels
+        self.min_voltage = float(min_voltage)
+        self.voltage_range = float(max_voltage) - float(min_voltage)
+        self.deadzone = float(deadzone)
+        self.padding = float(padding)
+        self._x = np.zeros(channels, dtype=np.float64)
+        self._magnitude = np.zeros(channels, dtype=np.float64)
+        self._int8 = np.zeros(channels, dtype=np.int8)
+        self._count_coeffs = None
+
+    def set_count_scaling(self, coefficients):
+        """Accept raw ADC counts instead of volts.
+
+        :param coefficients: Per-channel device scaling polynomials, lowest
+                             order first (volts = c0 + c1*raw + c2*raw^2 ...),
+                             as reported by DAQmx ai_dev_scaling_coeff.
+
+        The voltage mapping (v - min) / range * 2 - 1 is linear, so it folds
+        into the polynomial: counts go straight to [-1, 1] with one Horner
+        pass per channel. None switches back to volts input.
+        """
+        if coefficients is None:
+            self._count_coeffs = None
+            return
+        if len(coefficients) != self.channels:
+            raise ValueError(f"Expected scaling coefficients for {self.channels} channels, got {len(coefficients)}")
+        order = max(len(c) for c in coefficients)
+        if order < 2:
+            raise ValueError("Scaling polynomials need at least an offset and a gain term")
+        coeffs = np.zeros((order, self.channels), dtype=np.float64)
+        for channel, c in enumerate(coefficients):
+            coeffs[:len(c), channel] = c
+        coeffs *= 2.0 / self.voltage_range
+        coeffs[0] -= self.min_voltage * 2.0 / self.voltage_range + 1.0
+        # Highest order first for Horner evaluation.
+        self._count_coeffs = coeffs[::-1].copy()
+
+    def _counts_to_unit(self, counts: np.ndarray, x: np.ndarray):
+        coeffs = self._count_coeffs
+        x[:] = coeffs[0]
+        for c in coeffs[1:]:
+            np.multiply(x, counts, out=x)
+            np.add(x, c, out=x)
+
+    def to_float(self, column: np.ndarray) -> np.ndarray:
+        """Map volts (or counts, see set_count_scaling) to [-1.0, 1.0] with deadzone and padding."""
+        x = self._x
+        if self._count_coeffs is not None:
+            self._counts_to_unit(column, x)
+        else:
+            np.subtract(column, self.min_voltage, out=x)
+            np.divide(x, self.voltage_range, out=x)
+            np.multiply(x, 2, out=x)
+            np.subtract(x, 1, out=x)
+        # maximum/minimum rather than np.clip: same result, far less call
+        # overhead on 8-element arrays.
+        np.maximum(x, -1.0, out=x)
+        np.minimum(x, 1.0, out=x)
+
+        d = self.deadzone
+        if d > 0:
+            magnitude = self._magnitude
+            np.abs(x, out=magnitude)
+            np.subtract(magnitude, d, out=magnitude)
+            np.maximum(magnitude, 0.0, out=magnitude)
+            np.divide(magnitude, 1.0 - d, out=magnitude)
+            np.copysign(magnitude, x, out=x)
+
+        p = self.padding
+        if p > 0:
+            np.divide(x, 1.0 - p, out=x)
+            np.maximum(x, -1.0, out=x)
+            np.minimum(x, 1.0, out=x)
+        return x
+
+    def to_int8(self, column: np.ndarray) -> np.ndarray:
+        """Map volts (or counts) to int8 [-128, 127] (round half to even, like round())."""
+        x = self.to_float(column)
+        np.multiply(x, 127, out=x)
+        # |x| <= 127 after the clamp above, so the int8 cast cannot wrap.
+        np.rint(x, out=self._int8, casting="unsafe")
+        return self._int8
+
+
+class BlockRing:
+    """Preallocated ring of acquired sample blocks shared by several consumers.
+
+    The acquisition side fills writable() and calls publish(); consumers call
+    wait() with the last sequence number they saw and block on a condition
+    instead of calling into the driver. A consumer that falls more than
+    `slots` blocks behind skips ahead to the newest block.
+    """
+
+    def __init__(self, channels: int, block_size: int, slots: int = 8, dtype=np.float64):
+        self.blocks = np.zeros((slots, channels, block_size), dtype=dtype)
+        self.timestamps = np.zeros(slots, dtype=np.float64)
+        self.slots = slots
+        self.sequence = 0  # number of blocks published so far
+        self.error = None
+        self._condition = threading.Condition()
+
+    def writable(self) -> np.ndarray:
+        """Slot the next publish() will expose. Only the producer may call this."""
+        return self.blocks[self.sequence % self.slots]
+
+    def publish(self, timestamp: float = None):
+        """Expose the block written into writable(), stamped with perf_counter time."""
+        with self._condition:
+            self.timestamps[self.sequence % self.slots] = time.perf_counter() if timestamp is None else timestamp
+            self.sequence += 1
+            self._condition.notify_all()
+
+    def fail(self, error: BaseException):
+        """Wake all consumers and make them raise `error`."""
+        with self._condition:
+            self.error = error
+            self._condition.notify_all()
+
+    def wait(self, after: int, timeout: float = None):
+        """Wait for a block newer than sequence `after`.
+
+        :return: (sequence, block, timestamp) of the newest block. The block is
+                 a view into the ring and is overwritten `slots` publishes later.
+        :raises TimeoutError: if nothing newer arrives within timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.sequence > after or self.error is not None, timeout):
+                raise TimeoutError("No new sample block within timeout")
+            if self.error is not None:
+                raise self.error
+            sequence = self.sequence
+            slot = (sequence - 1) % self.slots
+            return sequence, self.blocks[slot], float(self.timestamps[slot])
+
+
+class ButtonLatch:
+    """Per-tick button states from buffered digital input samples.
+
+    Every edge inside a drained block is seen, so a tap shorter than one
+    tick still reports as pressed on the next read. Optional debounce accepts
+    a new level only after it has held for `debounce_samples` consecutive
+    samples. Accepted edges are kept in `edges` as (line, pressed, timestamp).
+    """
+
+    def __init__(self, lines: int, debounce_samples: int = 0, max_edges: int = 256):
+        self.lines = lines
+        self.debounce_samples = max(1, int(debounce_samples))
+        self.state = np.zeros(lines, dtype=bool)       # debounced level
+        self._raw = np.zeros(lines, dtype=bool)        # last raw sample
+        self._run = np.zeros(lines, dtype=np.int64)    # samples the raw level has held
+        self._pressed = np.zeros(lines, dtype=bool)    # press seen since last tick
+        self._out = np.zeros(lines, dtype=bool)
+        self.edges = deque(maxlen=max_edges)
+
+    def reset(self, levels):
+        """Seed the debounced and raw states, e.g. from an on-demand read."""
+        self.state[:] = levels
+        self._raw[:] = levels
+        self._run[:] = self.debounce_samples
+        self._pressed[:] = False
+
+    def update(self, samples: np.ndarray, timestamps) -> np.ndarray:
+        """Consume a (lines, n) bool block and return this tick's button states.
+
+        :param timestamps: Callable mapping sample offsets in the block to
+                           times, or one time used for every sample (for
+                           change-detection data without a sample clock).
+        """
+        n = samples.shape[1]
+        if n:
+            previous = np.concatenate([self._raw[:, None], samples], axis=1)
+            changed = previous[:, 1:] != previous[:, :-1]
+            # Lines without changes and without a pending level skip the scan.
+            active = np.flatnonzero(changed.any(axis=1) | (self._raw != self.state))
+            for line in active:
+                self._scan_line(line, samples[line], np.flatnonzero(changed[line]), timestamps)
+            idle = np.ones(self.lines, dtype=bool)
+            idle[active] = False
+            self._run[idle] += n
+            self._raw[:] = samples[:, -1]
+
+        np.logical_or(self.state, self._pressed, out=self._out)
+        self._pressed[:] = False
+        return self._out
+
+    def _scan_line(self, line, values, change_points, timestamps):
+        starts = change_points.tolist()
+        # (segment start, samples the level already held before this block)
+        segments = []
+        if not starts or starts[0] != 0:
+            segments.append((0, int(self._run[line])))
+        segments.extend((start, 0) for start in starts)
+
+        run = 0
+        for i, (start, carried) in enumerate(segments):
+            end = segments[i + 1][0] if i + 1 < len(segments) else len(values)
+            level = bool(values[start])
+            run = carried + end - start
+            if level != self.state[line] and run >= self.debounce_samples:
+                self._accept(line, level, start - carried, timestamps)
+        self._run[line] = run
+
+    def _accept(self, line, level, edge_offset, timestamps):
+        self.state[line] = level
+        if level:
+            self._pressed[line] = True
+        when = timestamps(edge_offset) if callable(timestamps) else timestamps
+        self.edges.append((int(line), bool(level), when))
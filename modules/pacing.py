@@ -0,0 +1,133 @@
+"""
+Loop pacing helpers for the pipelined sender.
+
+- LatestValue: single-slot mailbox between a producer thread and a consumer
+  that only ever wants the newest value.
+- DeadlinePacer: fixed-rate loop clock on absolute deadlines, sleeping for
+  most of the wait and spinning the last part for sub-millisecond accuracy.
+- JitterStats: rolling period/jitter statistics for one loop stage.
+"""
+
+from collections import deque
+import math
+import time
+
+
+class LatestValue:
+    """Latest-value slot. Publishing replaces the previous value; readers never block.
+
+    The slot is one (sequence, value, timestamp) tuple that is swapped in by
+    a single attribute assignment, so readers always see a consistent triple
+    without taking a lock.
+    """
+
+    def __init__(self):
+        self._slot = (0, None, None)
+
+    def publish(self, value, timestamp=None):
+        sequence = self._slot[0] + 1
+        self._slot = (sequence, value, time.monotonic() if timestamp is None else timestamp)
+        return sequence
+
+    def get(self):
+        """Return (sequence, value, timestamp); sequence 0 means nothing published yet."""
+        return self._slot
+
+
+class DeadlinePacer:
+    """Absolute-deadline loop clock: deadline n is start + n * period.
+
+    Errors do not accumulate because each deadline is computed from the
+    start time, not from when the previous wait returned. If the loop falls
+    more than one period behind, the missed deadlines are skipped (counted
+    in `overruns`) instead of firing back to back.
+
+    :param rate_hz: Loop rate in Hz
+    :param spin_seconds: Final part of each wait that is busy-waited instead
+                         of slept. Covers the OS sleep overshoot (about 1 ms
+                         on Windows with timeBeginPeriod(1)); 0 sleeps only.
+    """
+
+    def __init__(self, rate_hz: float, spin_seconds: float = 0.002):
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be greater than 0")
+        if spin_seconds < 0:
+            raise ValueError("spin_seconds must be >= 0")
+        self.period = 1.0 / rate_hz
+        self.spin_seconds = spin_seconds
+        self.overruns = 0
+        self._start = None
+        self._tick = 0
+
+    def reset(self, now=None):
+        self._start = time.perf_counter() if now is None else now
+        self._tick = 0
+
+    def set_rate(self, rate_hz: float):
+        """Change the rate from the next deadline on, keeping deadlines absolute."""
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be greater than 0")
+        if self._start is not None:
+            # Rebase on the last deadline so the next one is one new period later.
+            self._start += self._tick * self.period
+            self._tick = 0
+        self.period = 1.0 / rate_hz
+
+    def wait(self) -> float:
+        """Block until the next deadline; return how late it was released, in seconds."""
+        if self._start is None:
+            self.reset()
+        self._tick += 1
+        deadline = self._start + self._tick * self.period
+        now = time.perf_counter()
+        if now - deadline > self.period:
+            missed = int((now - deadline) / self.period)
+            self.overruns += missed
+            self._tick += missed
+            deadline += missed * self.period
+
+        sleep_for = deadline - now - self.spin_seconds
+        if sleep_for > 0:
+            time.sleep(sleep_for)
+        now = time.perf_counter()
+        while now < deadline:
+            # sleep(0) releases the GIL, so spinning does not starve the
+            # acquisition thread for a whole interpreter switch interval.
+            time.sleep(0)
+            now = time.perf_counter()
+        return now - deadline
+
+
+class JitterStats:
+    """Rolling interval statistics for a periodic stage.
+
+    :param period: Nominal period in seconds
+    :param window: Number of most recent intervals kept
+    """
+
+    def __init__(self, period: float, window: int = 200):
+        self.period = period
+        self.intervals = deque(maxlen=window)
+        self.count = 0
+        self._last = None
+
+    def record(self, timestamp=None):
+        timestamp = time.perf_counter() if timestamp is None else timestamp
+        if self._last is not None:
+            self.intervals.append(timestamp - self._last)
+        self._last = timestamp
+        self.count += 1
+
+    def summary(self) -> dict:
+        """Rate and jitter over the window: mean/stdev/max deviation from the nominal period."""
+        intervals = list(self.intervals)
+        if not intervals:
+            return {"count": self.count, "rate_hz": 0.0, "stdev_s": 0.0, "max_jitter_s": 0.0}
+        mean = sum(intervals) / len(intervals)
+        variance = sum((d - mean) ** 2 for d in intervals) / len(intervals)
+        return {
+            "count": self.count,
+            "rate_hz": 1.0 / mean if mean > 0 else 0.0,
+            "stdev_s": math.sqrt(variance),
+            "max_jitter_s": max(abs(d - self.period) for d in intervals),
+        }
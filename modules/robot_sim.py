@@ -0,0 +1,243 @@
+"""
+Robot-side receiver simulator.
+
+A local stand-in for the robot's UDP receiver so main.py can be run end to
+end without the machine. It listens with UDPSocket in server mode,
+completes the handshake, consumes '<8bH' command packets and logs when each
+one arrived:
+
+    python -m modules.robot_sim --port 8080 --seq
+    python main.py --ip 127.0.0.1:8080 --no-nidaq --duration 10 --seq
+
+On loopback both ends share one clock, so send-to-receive latency comes
+straight from the packet timestamp (1 ms resolution). With --echo the
+simulator answers every packet with its sender timestamp as a '<I'
+packet, for senders that expect those inputs. With --telemetry it instead
+sends simulated robot state (modules/telemetry.py TELEMETRY_FORMAT): joints
+that move with the command axes, pressures that rise with them, and fault
+bit 0 while no fresh command is arriving.
+"""
+
+import argparse
+import csv
+import struct
+import threading
+import time
+from typing import List, Optional
+
+from modules.pacing import DeadlinePacer, JitterStats
+from modules.telemetry import TELEMETRY_FORMAT
+from modules.udp_socket import MAC_ALGORITHMS, MAC_TAG_SIZES, UDPSocket
+
+COMMAND_FORMAT = '<8bH'
+ECHO_FORMAT = '<I'
+
+# Simulated machine: joint speed at full stick and pressure model.
+_JOINT_SPEED_DEG_S = 30.0
+_JOINT_LIMIT_DEG = 120.0
+_IDLE_PRESSURE_BAR = 40.0
+_PRESSURE_PER_STEP_BAR = 1.2
+FAULT_NO_COMMAND = 1 << 0
+
+
+class _RecordingSocket(UDPSocket):
+    """UDPSocket that reports every accepted datagram to the simulator."""
+
+    def __init__(self, on_packet, **kwargs):
+        super().__init__(**kwargs)
+        self._on_packet = on_packet
+
+    def _handle_datagram(self, data, addr) -> Optional[List]:
+        values = super()._handle_datagram(data, addr)
+        if values is not None:
+            self._on_packet(data, values)
+        return values
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class RobotSimulator:
+    """Receive commands like the robot and record arrival timing.
+
+    :param nominal_rate_hz: Expected command rate, used for period jitter
+    :param echo: Reply to every packet with its sender timestamp ('<I')
+    :param telemetry_hz: Send simulated robot state at this rate instead
+    :param log_path: Optional CSV file with one row per accepted packet
+    :param udp_options: UDPSocket keyword arguments (hmac_key, mac_algorithm,
+                        sequence_numbers, multipath, accept_layouts,
+                        answer_probes, ...)
+    """
+
+    def __init__(self, local_id: int = 2, nominal_rate_hz: float = 100.0, max_age_seconds: float = 0.5,
+                 echo: bool = False, log_path: Optional[str] = None, telemetry_hz: Optional[float] = None,
+                 **udp_options):
+        if nominal_rate_hz <= 0:
+            raise ValueError("nominal_rate_hz must be greater than 0")
+        if telemetry_hz is not None and (telemetry_hz <= 0 or echo):
+            raise ValueError("telemetry_hz must be greater than 0 and cannot be combined with echo")
+        self.echo = echo
+        self.telemetry_hz = telemetry_hz
+        self.joints = [0.0] * 4
+        self._telemetry_thread = None
+        self._running = False
+        self.log_path = log_path
+        self.udp = _RecordingSocket(self._record, local_id=local_id, max_age_seconds=max_age_seconds,
+                                    nominal_rate_hz=nominal_rate_hz, **udp_options)
+        self.arrivals = JitterStats(1.0 / nominal_rate_hz, window=1 << 20)
+        self.latencies_ms: List[float] = []
+        self.latest = None
+        self._log_rows = []
+        self._lock = threading.Lock()
+        self._timestamp = None
+
+    @property
+    def port(self) -> int:
+        return self.udp.socket.getsockname()[1]
+
+    def setup(self, host: str = "0.0.0.0", port: int = 8080):
+        outputs = TELEMETRY_FORMAT if self.telemetry_hz else ECHO_FORMAT if self.echo else ''
+        self.udp.setup(host, port, inputs=COMMAND_FORMAT, outputs=outputs, is_server=True)
+        self._timestamp = struct.Struct(self.udp.recv_format[0] + 'I')
+
+    def wait_for_sender(self, timeout: float = 120.0) -> bool:
+        """Handshake with the first sender, then start receiving."""
+        if not self.udp.handshake(timeout=timeout):
+            return False
+        self.udp.start_receiving()
+        if self.telemetry_hz and self._telemetry_thread is None:
+            self._running = True
+            self._telemetry_thread = threading.Thread(target=self._telemetry_loop, daemon=True)
+            self._telemetry_thread.start()
+        return True
+
+    def _telemetry_loop(self):
+        pacer = DeadlinePacer(self.telemetry_hz, spin_seconds=0.0)
+        period = 1.0 / self.telemetry_hz
+        while self._running:
+            pacer.wait()
+            command = self.udp.get_latest()
+            axes = command[:4] if command is not None else [0] * 4
+            for i, axis in enumerate(axes):
+                angle = self.joints[i] + axis / 127.0 * _JOINT_SPEED_DEG_S * period
+                self.joints[i] = max(-_JOINT_LIMIT_DEG, min(_JOINT_LIMIT_DEG, angle))
+            # Boom, arm and bucket cylinders follow their axes; the pump supplies the highest load.
+            pressures = [_IDLE_PRESSURE_BAR + abs(axis) * _PRESSURE_PER_STEP_BAR for axis in axes[:3]]
+            pressures.insert(0, max(pressures))
+            faults = FAULT_NO_COMMAND if command is None else 0
+            self.udp.send([int(round(a * 100.0)) for a in self.joints]
+                          + [int(round(p * 10.0)) for p in pressures] + [faults])
+
+    def _record(self, data, values):
+        arrival = time.perf_counter()
+        wall_ms = time.time() * 1000.0
+        latency_ms = None
+        if self.udp._recv_layout is None:
+            sent_ms = self._timestamp.unpack_from(data)[0]
+            # 32-bit ms timestamps wrap every ~50 days; compare modulo 2**32.
+            latency_ms = (wall_ms - sent_ms) % (1 << 32)
+            if latency_ms > (1 << 31):
+                latency_ms -= 1 << 32
+        with self._lock:
+            self.arrivals.record(arrival)
+            self.latest = values
+            if latency_ms is not None:
+                self.latencies_ms.append(latency_ms)
+            if self.log_path:
+                self._log_rows.append((arrival, latency_ms, *values))
+        if self.echo and latency_ms is not None:
+            self.udp.send([self._timestamp.unpack_from(data)[0]])
+
+    def summary(self) -> dict:
+        """Arrival rate/jitter, latency percentiles and loss so far."""
+        with self._lock:
+            rate = self.arrivals.summary()
+            latencies = sorted(self.latencies_ms)
+        stats = self.udp.get_connection_stats()
+        summary = {
+            'packets_received': stats['packets_received'],
+            'packets_rejected': stats['packets_rejected'],
+            'rate_hz': rate['rate_hz'],
+            'period_stdev_ms': rate['stdev_s'] * 1000.0,
+            'period_max_jitter_ms': rate['max_jitter_s'] * 1000.0,
+            'latency_p50_ms': _percentile(latencies, 0.50),
+            'latency_p90_ms': _percentile(latencies, 0.90),
+            'latency_p99_ms': _percentile(latencies, 0.99),
+            'latency_max_ms': latencies[-1] if latencies else 0.0,
+        }
+        for key in ('packets_lost', 'loss_rate', 'packets_reordered', 'max_burst_loss'):
+            if key in stats:
+                summary[key] = stats[key]
+        return summary
+
+    def write_log(self):
+        if not self.log_path:
+            return
+        with self._lock:
+            rows = list(self._log_rows)
+        with open(self.log_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["arrival_s", "latency_ms"] + [f"a{i}" for i in range(8)] + ["buttons"])
+            writer.writerows(rows)
+        print(f"Wrote {len(rows)} packets to {self.log_path}")
+
+    def close(self):
+        self._running = False
+        if self._telemetry_thread is not None:
+            self._telemetry_thread.join(timeout=1.0)
+        self.udp.close()
+
+
+def format_summary(summary: dict) -> str:
+    text = (f"rx {summary['packets_received']} @ {summary['rate_hz']:.1f} Hz "
+            f"(period stdev {summary['period_stdev_ms']:.2f} ms, "
+            f"max jitter {summary['period_max_jitter_ms']:.2f} ms) | "
+            f"latency p50 {summary['latency_p50_ms']:.1f} p90 {summary['latency_p90_ms']:.1f} "
+            f"p99 {summary['latency_p99_ms']:.1f} max {summary['latency_max_ms']:.1f} ms")
+    if 'packets_lost' in summary:
+        text += f" | lost {summary['packets_lost']} ({summary['loss_rate'] * 100:.2f}%)"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Robot-side receiver simulator for main.py")
+    parser.add_argument("--host", default="0.0.0.0", help="Listen address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8080, help="Listen port (default: 8080)")
+    parser.add_argument("--rate", type=float, default=100.0, help="Expected command rate in Hz (default: 100)")
+    parser.add_argument("--echo", action="store_true", help="Echo sender timestamps back as '<I' packets")
+    parser.add_argument("--telemetry", type=float, default=None, metavar="HZ",
+                        help="Send simulated robot state at this rate (main.py --telemetry)")
+    parser.add_argument("--log", default=None, help="Write one CSV row per packet to this file on exit")
+    parser.add_argument("--hmac-key", default=None, help="Shared packet key (must match the sender)")
+    parser.add_argument("--mac", choices=tuple(MAC_ALGORITHMS), default="hmac-sha256", help="Packet MAC algorithm")
+    parser.add_argument("--mac-tag", type=int, choices=MAC_TAG_SIZES, default=32, help="MAC bytes per packet")
+    parser.add_argument("--seq", action="store_true", help="Accept sequence numbers (loss/reorder stats)")
+    parser.add_argument("--multipath", action="store_true", help="Accept redundant multi-path copies")
+    parser.add_argument("--compact", action="store_true", help="Accept compact bit-packed layouts")
+    parser.add_argument("--probes", action="store_true", help="Answer RTT/clock probes (main.py --probe-ms)")
+    args = parser.parse_args()
+
+    sim = RobotSimulator(nominal_rate_hz=args.rate, echo=args.echo, log_path=args.log, telemetry_hz=args.telemetry,
+                         hmac_key=args.hmac_key, mac_algorithm=args.mac, mac_tag_size=args.mac_tag,
+                         sequence_numbers=args.seq, multipath=args.multipath, accept_layouts=args.compact,
+                         answer_probes=args.probes)
+    sim.setup(args.host, args.port)
+    try:
+        while not sim.wait_for_sender(timeout=120.0):
+            pass
+        while True:
+            time.sleep(1.0)
+            print(format_summary(sim.summary()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.write_log()
+        sim.close()
+        print("Stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+"""
+Simulated nidaqmx backend.
+
+Implements the part of the nidaqmx API that NiDAQJoysticks uses (Task,
+channel collections, sample clock timing, in_stream, stream readers and
+DaqError) on top of the host clock, so the controller stack can run and be
+benchmarked on machines without NI hardware:
+
+    joy = NiDAQJoysticks(backend="sim")
+    joy = NiDAQJoysticks(backend=SimulatedDAQ(ai_waveform=sine_waveform(0.5)))
+
+The AI sample clock runs from task start at the configured rate into a ring
+buffer of samps_per_chan samples. avail_samp_per_chan grows with wall time,
+reads block until the requested samples exist, and falling more than one
+buffer behind raises DaqError -200279 like the real driver.
+
+DI is read on demand by default. A DI sample clock buffers the line states
+at every clock tick, and change detection buffers a sample whenever the
+line states change (after the digital glitch filter, if enabled). DI
+waveforms are functions of the time since the SimulatedDAQ was created.
+"""
+
+from collections import deque
+from enum import Enum
+import re
+import threading
+import time
+
+import numpy as np
+
+
+ERROR_BUFFER_OVERWRITTEN = -200279
+ERROR_SAMPLES_NOT_AVAILABLE = -200284
+READ_ALL_AVAILABLE = -1
+
+# Change detection is simulated by scanning the DI waveform at this rate.
+CHANGE_SCAN_RATE = 2000.0
+
+ADC_BITS = 16
+ADC_RANGE_VOLTS = 20.0  # +/-10 V input range, as on USB-600x devices
+NEUTRAL_VOLTS = 2.5
+
+
+class AcquisitionType(Enum):
+    FINITE = 10178
+    CONTINUOUS = 10123
+
+
+class TerminalConfiguration(Enum):
+    DEFAULT = -1
+    RSE = 10083
+    NRSE = 10078
+    DIFF = 10106
+
+
+class DaqError(Exception):
+    def __init__(self, message, error_code):
+        super().__init__(f"{message}\nStatus Code: {error_code}")
+        self.error_code = error_code
+
+
+# ----- Waveforms -----
+# An AI waveform maps sample times (1-D array, seconds since task start) to a
+# (channels, samples) array of volts. A DI waveform maps one time to a list of
+# line states.
+
+def constant_waveform(volts=NEUTRAL_VOLTS):
+    """Every channel held at `volts` (scalar or one value per channel)."""
+    def waveform(times, channels):
+        levels = np.broadcast_to(np.asarray(volts, dtype=np.float64), (channels,))
+        return np.repeat(levels[:, None], len(times), axis=1)
+    return waveform
+
+
+def sine_waveform(frequency_hz=0.5, amplitude=2.0, center=NEUTRAL_VOLTS, phase_step=0.25):
+    """Sine sweep per channel; channel i is phase shifted by i * phase_step cycles."""
+    def waveform(times, channels):
+        phases = np.arange(channels)[:, None] * phase_step
+        return center + amplitude * np.sin(2.0 * np.pi * (frequency_hz * times[None, :] + phases))
+    return waveform
+
+
+class RecordedWaveform:
+    """Replay recorded voltages, looping at the end.
+
+    :param samples: (samples, channels) array of volts
+    :param sample_rate: Rate the samples were recorded at, in Hz
+    """
+
+    def __init__(self, samples, sample_rate: float, loop: bool = True):
+        self.samples = np.atleast_2d(np.asarray(samples, dtype=np.float64))
+        if self.samples.shape[0] == 0:
+            raise ValueError("Recorded waveform is empty")
+        self.sample_rate = float(sample_rate)
+        self.loop = loop
+
+    @classmethod
+    def load(cls, path, sample_rate: float, loop: bool = True):
+        """Load a .npy file or a comma-separated text file with one row per sample."""
+        path = str(path)
+        if path.endswith(".npy"):
+            samples = np.load(path)
+        else:
+            samples = np.loadtxt(path, delimiter=",", ndmin=2)
+        return cls(samples, sample_rate, loop)
+
+    def __call__(self, times, channels):
+        index = (np.asarray(times) * self.sample_rate).astype(np.int64)
+        count = self.samples.shape[0]
+        index = index % count if self.loop else np.minimum(index, count - 1)
+        columns = self.samples[index].T
+        if columns.shape[0] < channels:
+            pad = np.full((channels - columns.shape[0], columns.shape[1]), NEUTRAL_VOLTS)
+            columns = np.vstack([columns, pad])
+        return columns[:channels]
+
+
+def idle_buttons(t, lines):
+    return [False] * lines
+
+
+# ----- Task surface -----
+
+class _Channel:
+    def __init__(self, name, min_val=None, max_val=None):
+        self.name = name
+        self.min_val = min_val
+        self.max_val = max_val
+        self.di_dig_fltr_enable = False
+        self.di_dig_fltr_min_pulse_width = 0.0
+        # volts = c0 + c1 * counts, matching a 16-bit ADC over ADC_RANGE_VOLTS.
+        self.ai_dev_scaling_coeff = [0.0, ADC_RANGE_VOLTS / (1 << ADC_BITS)]
+
+
+class _ChannelCollection:
+    def __init__(self):
+        self._channels = []
+
+    def __iter__(self):
+        return iter(self._channels)
+
+    def __len__(self):
+        return len(self._channels)
+
+    def __getitem__(self, index):
+        return self._channels[index]
+
+    def _add(self, physical_channel, **kwargs):
+        for name in _expand_channels(physical_channel):
+            self._channels.append(_Channel(name, **kwargs))
+
+
+class _AIChannels(_ChannelCollection):
+    def add_ai_voltage_chan(self, physical_channel, min_val=-5.0, max_val=5.0,
+                            terminal_config=TerminalConfiguration.DEFAULT, **kwargs):
+        self._add(physical_channel, min_val=min_val, max_val=max_val)
+
+
+class _DIChannels(_ChannelCollection):
+    def add_di_chan(self, lines, **kwargs):
+        self._add(lines)
+
+
+_RANGE_RE = re.compile(r"^(.*?)(\d+):(\d+)$")
+
+
+def _expand_channels(physical_channel):
+    """Expand 'Dev1/ai0:3' and comma lists into single channel names."""
+    names = []
+    for part in str(physical_channel).split(","):
+        part = part.strip()
+        match = _RANGE_RE.match(part)
+        if match:
+            prefix, first, last = match.group(1), int(match.group(2)), int(match.group(3))
+            step = 1 if last >= first else -1
+            names.extend(f"{prefix}{i}" for i in range(first, last + step, step))
+        elif part:
+            names.append(part)
+    return names
+
+
+class _SampleClock:
+    """Hardware-like sample clock feeding a fixed-size ring buffer."""
+
+    def __init__(self, rate: float, buffer_size: int):
+        self.rate = float(rate)
+        self.buffer_size = int(buffer_size)
+        self.start_time = None
+        self.read_position = 0
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.read_position = 0
+
+    def acquired(self, now=None) -> int:
+        if self.start_time is None:
+            return 0
+        now = time.monotonic() if now is None else now
+        return int((now - self.start_time) * self.rate)
+
+    def available(self) -> int:
+        return min(self.acquired() - self.read_position, self.buffer_size)
+
+    def wait_for(self, count: int, timeout: float):
+        """Block until `count` unread samples exist; return their sample indices."""
+        if self.start_time is None:
+            raise DaqError("Task must be started before reading.", -200473)
+        target = self.read_position + count
+        ready_at = self.start_time + target / self.rate
+        delay = ready_at - time.monotonic()
+        if delay > timeout:
+            time.sleep(max(0.0, timeout))
+            raise DaqError("Some or all of the samples requested have not yet been acquired.",
+                           ERROR_SAMPLES_NOT_AVAILABLE)
+        if delay > 0:
+            time.sleep(delay)
+        if self.acquired() - self.read_position > self.buffer_size:
+            raise DaqError("The application is not able to keep up with the hardware acquisition. "
+                           "Attempted to read samples that are no longer available.",
+                           ERROR_BUFFER_OVERWRITTEN)
+        first = self.read_position
+        self.read_position = target
+        return np.arange(first, target)
+
+
+class _Timing:
+    def __init__(self, task):
+        self._task = task
+
+    def cfg_samp_clk_timing(self, rate, source="", active_edge=None,
+                            sample_mode=AcquisitionType.FINITE, samps_per_chan=1000):
+        # An external source such as /Dev/ai/SampleClock is modelled as an
+        # independent clock at the same rate.
+        self._task._clock = _SampleClock(rate, samps_per_chan)
+
+    def cfg_change_detection_timing(self, rising_edge_chan="", falling_edge_chan="",
+                                    sample_mode=AcquisitionType.FINITE, samps_per_chan=1000):
+        self._task._change_detector = _ChangeDetector(self._task, samps_per_chan)
+
+
+class _ChangeDetector:
+    """Buffers a DI sample each time the (glitch-filtered) line states change."""
+
+    def __init__(self, task, buffer_size: int):
+        self._task = task
+        self.buffer = deque(maxlen=int(buffer_size))
+        self._scan_time = None
+        self._state = None
+        self._candidate = None  # (state, first seen time) awaiting the filter width
+
+    def start(self):
+        self._scan_time = self._task._daq.elapsed()
+        self._state = self._levels(self._scan_time)
+        self._candidate = None
+
+    def _levels(self, t):
+        lines = len(self._task.di_channels)
+        return tuple(bool(v) for v in list(self._task._daq.di_waveform(t, lines))[:lines])
+
+    def _min_pulse_width(self):
+        widths = [ch.di_dig_fltr_min_pulse_width for ch in self._task.di_channels if ch.di_dig_fltr_enable]
+        return max(widths) if widths else 0.0
+
+    def drain(self):
+        now = self._task._daq.elapsed()
+        width = self._min_pulse_width()
+        step = 1.0 / CHANGE_SCAN_RATE
+        t = self._scan_time
+        while t + step <= now:
+            t += step
+            levels = self._levels(t)
+            if levels == self._state:
+                self._candidate = None
+            elif self._candidate is None or self._candidate[0] != levels:
+                self._candidate = (levels, t)
+            if self._candidate and t - self._candidate[1] >= width:
+                self._state = self._candidate[0]
+                self._candidate = None
+                self.buffer.append(self._state)
+        self._scan_time = t
+        samples = list(self.buffer)
+        self.buffer.clear()
+        return samples
+
+
+class _InStream:
+    def __init__(self, task):
+        self._task = task
+
+    @property
+    def avail_samp_per_chan(self):
+        clock = self._task._clock
+        return clock.available() if clock else 0
+
+
+class Task:
+    def __init__(self, daq: "SimulatedDAQ", new_task_name=""):
+        self.name = new_task_name
+        self._daq = daq
+        self._clock = None
+        self._running = False
+        self.ai_channels = _AIChannels()
+        self.di_channels = _DIChannels()
+        self.timing = _Timing(self)
+        self.in_stream = _InStream(self)
+        self._change_detector = None
+        self._every_n = None
+        self._event_thread = None
+        self._stop_event = threading.Event()
+
+    def register_every_n_samples_acquired_into_buffer_event(self, sample_interval, callback_method):
+        """Call callback_method(task_handle, event_type, n, callback_data) every n acquired samples.
+
+        Like DAQmx, the callback runs on a driver thread and must register
+        before start(); None unregisters.
+        """
+        self._every_n = (int(sample_interval), callback_method) if callback_method else None
+
+    def start(self):
+        if self._clock:
+            self._clock.start()
+        if self._change_detector:
+            self._change_detector.start()
+        self._running = True
+        if self._every_n and self._clock:
+            self._stop_event.clear()
+            self._event_thread = threading.Thread(target=self._run_every_n_events, daemon=True)
+            self._event_thread.start()
+
+    def _run_every_n_events(self):
+        interval, callback = self._every_n
+        clock = self._clock
+        fired = 0
+        while self._running:
+            fired += interval
+            delay = clock.start_time + fired / clock.rate - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                return
+            if not self._running:
+                return
+            callback(0, 1, interval, None)
+
+    def stop(self):
+        self._running = False
+        self._stop_event.set()
+        thread = self._event_thread
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+
+    def close(self):
+        self.stop()
+        self._clock = None
+
+    def read(self, number_of_samples_per_channel=None, timeout=10.0):
+        """Read DI line states.
+
+        Without timing this is an on-demand read of the current states (one
+        value per line). With a sample clock or change detection, returns one
+        list of samples per line; READ_ALL_AVAILABLE drains the buffer.
+        """
+        lines = len(self.di_channels)
+        if self._change_detector is not None:
+            samples = self._change_detector.drain()
+            if number_of_samples_per_channel not in (None, READ_ALL_AVAILABLE):
+                samples = samples[:number_of_samples_per_channel]
+            return [[sample[line] for sample in samples] for line in range(lines)]
+        if self._clock is not None:
+            count = number_of_samples_per_channel
+            if count in (None, READ_ALL_AVAILABLE):
+                count = self._clock.available()
+            offset = self._clock.start_time - self._daq._start_time
+            times = offset + self._clock.wait_for(count, timeout) / self._clock.rate
+            samples = [list(self._daq.di_waveform(t, lines))[:lines] for t in times]
+            return [[bool(sample[line]) for sample in samples] for line in range(lines)]
+        values = list(self._daq.di_waveform(self._daq.elapsed(), lines))[:lines]
+        if number_of_samples_per_channel is not None:
+            return [[bool(v)] for v in values]
+        return values[0] if lines == 1 else values
+
+    def _read_ai(self, count, timeout):
+        indices = self._clock.wait_for(count, timeout)
+        return self._daq.ai_waveform(indices / self._clock.rate, len(self.ai_channels))
+
+
+def _check_buffer(data, channels, count):
+    if data.shape[0] != channels or data.shape[1] < count:
+        raise DaqError(f"Read buffer shape {data.shape} does not fit {channels} channels x {count} samples.",
+                       -200229)
+
+
+class AnalogMultiChannelReader:
+    def __init__(self, task_in_stream: _InStream):
+        self._task = task_in_stream._task
+
+    def read_many_sample(self, data, number_of_samples_per_channel=1, timeout=10.0):
+        channels = len(self._task.ai_channels)
+        _check_buffer(data, channels, number_of_samples_per_channel)
+        data[:, :number_of_samples_per_channel] = self._task._read_ai(number_of_samples_per_channel, timeout)
+        return number_of_samples_per_channel
+
+
+class AnalogUnscaledReader(AnalogMultiChannelReader):
+    def read_int16(self, data, number_of_samples_per_channel=1, timeout=10.0):
+        channels = len(self._task.ai_channels)
+        _check_buffer(data, channels, number_of_samples_per_channel)
+        volts = self._task._read_ai(number_of_samples_per_channel, timeout)
+        counts = np.empty_like(volts)
+        for i, channel in enumerate(self._task.ai_channels):
+            offset, gain = channel.ai_dev_scaling_coeff[:2]
+            np.rint((volts[i] - offset) / gain, out=counts[i])
+        np.clip(counts, -(1 << 15), (1 << 15) - 1, out=counts)
+        data[:, :number_of_samples_per_channel] = counts
+        return number_of_samples_per_channel
+
+
+def waveform_from_spec(spec: str, sample_rate: float):
+    """'neutral', 'sine' or a path to a recorded .npy/.csv file sampled at sample_rate."""
+    if spec in (None, "", "neutral"):
+        return constant_waveform()
+    if spec == "sine":
+        return sine_waveform()
+    return RecordedWaveform.load(spec, sample_rate)
+
+
+class SimulatedDAQ:
+    """A simulated device that hands out nidaqmx-like tasks.
+
+    :param ai_waveform: callable(times, channels) -> (channels, samples) volts
+    :param di_waveform: callable(t, lines) -> sequence of line states
+    """
+
+    AcquisitionType = AcquisitionType
+    TerminalConfiguration = TerminalConfiguration
+    DaqError = DaqError
+    AnalogMultiChannelReader = AnalogMultiChannelReader
+    AnalogUnscaledReader = AnalogUnscaledReader
+    READ_ALL_AVAILABLE = READ_ALL_AVAILABLE
+
+    def __init__(self, ai_waveform=None, di_waveform=None):
+        self.ai_waveform = ai_waveform or constant_waveform()
+        self.di_waveform = di_waveform or idle_buttons
+        self._start_time = time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._start_time
+
+    def Task(self, new_task_name=""):  # noqa: N802 - mirrors nidaqmx.Task
+        return Task(self, new_task_name)
@@ -0,0 +1,177 @@
+"""
+Robot telemetry ingest for the operator station.
+
+The robot sends its state (joint angles, hydraulic pressures, fault bits)
+as the operator socket's inputs. TelemetrySocket stores every accepted
+sample in a TelemetryRing, a preallocated NumPy ring buffer indexed by
+arrival time, so the UI, logging and latency analysis can read history
+instead of only get_latest():
+
+    udp = TelemetrySocket(capacity=6000, local_id=1)
+    udp.setup(host, port, inputs=TELEMETRY_FORMAT, outputs="<8bH")
+    udp.handshake()
+    udp.start_receiving()
+    times, values = udp.telemetry.last(2.0)
+    boom = values[:, udp.telemetry.field_index("boom_deg")]
+
+Appends are O(1) and allocate nothing. Readers take no lock: the receive
+thread is the only writer, and a reader that raced with a wrap-around of
+the range it copied simply copies again.
+"""
+
+import bisect
+import time
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from modules.udp_socket import UDPSocket
+
+# Robot feedback packet: joint angles in 0.01 deg, hydraulic pressures in
+# 0.1 bar and a fault bitmask. The robot's outputs format must match.
+TELEMETRY_FORMAT = '<4h4HI'
+TELEMETRY_FIELDS = ('boom_deg', 'arm_deg', 'bucket_deg', 'slew_deg',
+                    'pump_bar', 'boom_bar', 'arm_bar', 'bucket_bar', 'faults')
+TELEMETRY_SCALES = (0.01,) * 4 + (0.1,) * 4 + (1.0,)
+
+_READ_RETRIES = 4
+
+
+class TelemetryRing:
+    """Fixed-capacity ring of (arrival time, values) rows for one writer and any number of readers.
+
+    Rows are written in place and published by bumping `count` afterwards.
+    One spare slot is allocated, so the row being written is never one of
+    the `capacity` published rows. A reader copies the rows it wants and
+    then re-reads `count`: if the writer has meanwhile come round to any of
+    those rows, the copy may be torn and is taken again. Arrival times never decrease, so windows are
+    found by binary search.
+
+    :param capacity: Rows kept; older rows are overwritten
+    :param fields: Column names
+    :param scales: Per-column factor applied on append (raw wire units to
+                   engineering units); None stores values as given
+    """
+
+    def __init__(self, capacity: int, fields: Sequence[str], scales: Optional[Sequence[float]] = None):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        if scales is not None and len(scales) != len(fields):
+            raise ValueError("scales must have one entry per field")
+        self.capacity = int(capacity)
+        self.fields = tuple(fields)
+        self.scales = np.asarray(scales, dtype=np.float64) if scales is not None else None
+        self._slots = self.capacity + 1
+        self.times = np.zeros(self._slots, dtype=np.float64)
+        self.values = np.zeros((self._slots, len(self.fields)), dtype=np.float64)
+        self.count = 0  # rows ever appended; row n lives in slot n % (capacity + 1)
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def field_index(self, name: str) -> int:
+        return self.fields.index(name)
+
+    def append(self, values, timestamp: Optional[float] = None):
+        """Store one sample (writer thread only). timestamp defaults to time.monotonic()."""
+        slot = self.count % self._slots
+        row = self.values[slot]
+        row[:] = values
+        if self.scales is not None:
+            row *= self.scales
+        self.times[slot] = time.monotonic() if timestamp is None else timestamp
+        self.count += 1
+
+    def latest(self, n: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the newest n rows (fewer if not yet filled): (times, values), oldest first."""
+        return self._read(lambda count, first: (max(first, count - n), count))
+
+    def window(self, start: float, end: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the rows that arrived in [start, end), oldest first; end=None means up to now."""
+        def bounds(count, first):
+            lo = self._search(start, first, count)
+            hi = count if end is None else self._search(end, first, count)
+            return lo, max(lo, hi)
+        return self._read(bounds)
+
+    def last(self, seconds: float, now: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows from the last `seconds` (arrival times on the time.monotonic() clock)."""
+        return self.window((time.monotonic() if now is None else now) - seconds)
+
+    def rate_hz(self, seconds: float = 1.0, now: Optional[float] = None) -> float:
+        """Samples per second over the last `seconds`, without copying rows."""
+        count = self.count
+        start = (time.monotonic() if now is None else now) - seconds
+        return (count - self._search(start, max(0, count - self.capacity), count)) / seconds
+
+    def save(self, path: str):
+        """Write the buffered rows to a .npz file: 'time' plus one array per field."""
+        times, values = self.latest(self.capacity)
+        np.savez(path, time=times, **{name: values[:, i] for i, name in enumerate(self.fields)})
+        print(f"Wrote {len(times)} telemetry samples to {path}")
+
+    def _search(self, t: float, first: int, count: int) -> int:
+        """Logical index of the first row in [first, count) with time >= t."""
+        slots = self._slots
+        times = self.times
+        # The logical range is at most two physical runs, each sorted.
+        split = first + min(count - first, slots - first % slots)
+        if split > first and t <= times[(split - 1) % slots]:
+            base = first % slots
+            return first + bisect.bisect_left(times, t, base, base + split - first) - base
+        if count > split:
+            return split + bisect.bisect_left(times, t, 0, count - split)
+        return count
+
+    def _read(self, bounds) -> Tuple[np.ndarray, np.ndarray]:
+        capacity = self.capacity
+        for _ in range(_READ_RETRIES):
+            count = self.count
+            first = max(0, count - capacity)
+            lo, hi = bounds(count, first)
+            times, values = self._copy(lo, hi)
+            # The writer fills row `count` before publishing it, which
+            # overwrites row count - capacity - 1.
+            if self.count - capacity <= lo:
+                return times, values
+        # Lapped by the writer on every try: return just the newest row.
+        count = self.count
+        return self._copy(max(0, count - 1), count)
+
+    def _copy(self, lo: int, hi: int) -> Tuple[np.ndarray, np.ndarray]:
+        slots = self._slots
+        start, n = lo % slots, hi - lo
+        if start + n <= slots:
+            return self.times[start:start + n].copy(), self.values[start:start + n].copy()
+        head = slots - start
+        return (np.concatenate((self.times[start:], self.times[:n - head])),
+                np.concatenate((self.values[start:], self.values[:n - head])))
+
+
+class TelemetrySocket(UDPSocket):
+    """UDPSocket that also records every accepted input packet in a TelemetryRing.
+
+    Takes UDPSocket's keyword arguments. The 'each' receive mode records
+    every packet; 'drain_newest' would record only the newest of a backlog.
+
+    :param capacity: Samples kept (e.g. 6000 = 2 minutes at 50 Hz)
+    :param fields: Column names, one per inputs value
+    :param scales: Raw-to-engineering-unit factor per value
+    """
+
+    def __init__(self, capacity: int = 6000, fields: Sequence[str] = TELEMETRY_FIELDS,
+                 scales: Optional[Sequence[float]] = TELEMETRY_SCALES, **kwargs):
+        super().__init__(**kwargs)
+        self.telemetry = TelemetryRing(capacity, fields, scales)
+
+    def _configure_formats(self, inputs: str, outputs: str):
+        super()._configure_formats(inputs, outputs)
+        if self._num_inputs != len(self.telemetry.fields):
+            raise ValueError(f"inputs format '{self.inputs_fmt}' has {self._num_inputs} values, "
+                             f"telemetry has {len(self.telemetry.fields)} fields")
+
+    def _handle_datagram(self, data, addr):
+        values = super()._handle_datagram(data, addr)
+        if values is not None:
+            self.telemetry.append(values, self.last_packet_time)
+        return values
@@ -0,0 +1,198 @@
+"""
+Transmission policies for the command sender.
+
+DeltaKeepalivePolicy sends a command only when it differs from the last
+sent command by more than a per-value threshold, and otherwise repeats the
+last command at a low keepalive rate so the receiver's max-age check still
+sees a live link. With centered sticks this cuts the packet rate from the
+full TX rate down to the keepalive rate.
+
+AdaptiveRateController moves the TX rate between a floor and a ceiling
+from link feedback (receiver-reported loss, RTT growth and send-buffer
+drops), backing off when the link queues or drops and probing upwards
+again once it has been clean for a while.
+"""
+
+from collections import deque
+from typing import Optional, Sequence
+
+
+class DeltaKeepalivePolicy:
+    """Send on change, otherwise keepalive.
+
+    :param keepalive_period: Longest gap between sends in seconds
+    :param thresholds: Per-value change (in wire units) needed to send
+                       immediately; a value must change by more than its
+                       threshold. None, or a missing entry, means any change
+                       sends, which is what button masks need. A value
+                       returning to exactly 0 always sends, so releasing a
+                       stick stops the machine without waiting for a keepalive.
+    """
+
+    def __init__(self, keepalive_period: float, thresholds: Optional[Sequence[int]] = None):
+        if keepalive_period <= 0:
+            raise ValueError("keepalive_period must be greater than 0")
+        if thresholds is not None and any(t < 0 for t in thresholds):
+            raise ValueError("thresholds must be >= 0")
+        self.keepalive_period = float(keepalive_period)
+        self.thresholds = tuple(thresholds) if thresholds is not None else ()
+        self.reset()
+
+    def reset(self):
+        self._last_values = None
+        self._last_send = 0.0
+        self.changes_sent = 0
+        self.keepalives_sent = 0
+        self.suppressed = 0
+
+    def should_send(self, values, now: float, force: bool = False) -> bool:
+        """Return True if values should be sent at time now (seconds, monotonic).
+
+        force records a send regardless of the policy, e.g. for the neutral
+        packets sent on shutdown.
+        """
+        last = self._last_values
+        if last is None or len(last) != len(values) or self._changed(last, values):
+            self.changes_sent += 1
+        elif force or now - self._last_send >= self.keepalive_period:
+            self.keepalives_sent += 1
+        else:
+            self.suppressed += 1
+            return False
+        self._last_values = tuple(values)
+        self._last_send = now
+        return True
+
+    def _changed(self, last, values) -> bool:
+        # Compared against the last *sent* values, so a slow drift still
+        # triggers a send once it exceeds the threshold.
+        thresholds = self.thresholds
+        n_thresholds = len(thresholds)
+        for i, value in enumerate(values):
+            threshold = thresholds[i] if i < n_thresholds else 0
+            if abs(value - last[i]) > threshold or (value == 0 and last[i] != 0):
+                return True
+        return False
+
+
+class AdaptiveRateController:
+    """Additive-increase/multiplicative-decrease TX rate control from link feedback.
+
+    Congestion signals, read from UDPSocket.get_connection_stats():
+    - send drops: packets_dropped grew (the socket send buffer was full)
+    - loss: recent_loss_rate (loss since the previous probe reply) above loss_threshold
+    - delay: the latest probe RTT exceeds the lowest RTT of the last
+      min_rtt_window_s by more than delay_threshold_ms, i.e. packets are
+      queueing somewhere on the path
+
+    A signal multiplies the rate by `decrease`, at most once per cooldown_s
+    so one congestion episode is not counted twice while its feedback is
+    still arriving. After hold_s without a signal the rate rises by
+    increase_hz. Loss and delay are only read when a new probe reply has
+    arrived, so the controller needs probes (probe_interval_s) to see them.
+
+    :param floor_hz: Lowest rate; keep it high enough for the robot's max_age
+    :param ceiling_hz: Highest rate
+    :param initial_hz: Starting rate (default: ceiling_hz), clamped to the range
+    :param loss_threshold: Loss fraction treated as congestion; LTE links
+                           lose a few percent at random without congestion
+    """
+
+    def __init__(self, floor_hz: float, ceiling_hz: float, initial_hz: Optional[float] = None,
+                 loss_threshold: float = 0.05, delay_threshold_ms: float = 50.0, increase_hz: float = 5.0,
+                 decrease: float = 0.75, hold_s: float = 3.0, cooldown_s: float = 1.0,
+                 min_rtt_window_s: float = 10.0):
+        if floor_hz <= 0 or ceiling_hz < floor_hz:
+            raise ValueError("need 0 < floor_hz <= ceiling_hz")
+        if not 0.0 < decrease < 1.0:
+            raise ValueError("decrease must be between 0 and 1")
+        if increase_hz <= 0 or hold_s <= 0 or cooldown_s < 0 or min_rtt_window_s <= 0:
+            raise ValueError("increase_hz, hold_s and min_rtt_window_s must be > 0, cooldown_s >= 0")
+        self.floor_hz = float(floor_hz)
+        self.ceiling_hz = float(ceiling_hz)
+        self.initial_hz = float(initial_hz) if initial_hz is not None else self.ceiling_hz
+        self.loss_threshold = loss_threshold
+        self.delay_threshold_ms = delay_threshold_ms
+        self.increase_hz = increase_hz
+        self.decrease = decrease
+        self.hold_s = hold_s
+        self.cooldown_s = cooldown_s
+        self.min_rtt_window_s = min_rtt_window_s
+        self.reset()
+
+    def reset(self):
+        self.rate_hz = min(self.ceiling_hz, max(self.floor_hz, self.initial_hz))
+        self.reason = None
+        self.loss = None
+        self.queue_delay_ms = None
+        self.increases = 0
+        self.decreases = 0
+        self._rtts = deque()  # (time, rtt_ms) with increasing rtt_ms: a sliding-window minimum
+        self._last_drops = None
+        self._last_replies = 0
+        self._last_signal = None
+        self._last_decrease = None
+        self._last_change = None
+
+    def update(self, stats: dict, now: float) -> Optional[float]:
+        """Feed the latest connection stats; return the new rate if it changed, else None.
+
+        :param now: Monotonic time in seconds
+        """
+        if self._last_change is None:
+            self._last_change = now
+        signal = None
+
+        drops = stats.get('packets_dropped', 0)
+        if self._last_drops is not None and drops > self._last_drops:
+            signal = f"{drops - self._last_drops} send drops"
+        self._last_drops = drops
+
+        replies = stats.get('probe_replies', 0)
+        if replies != self._last_replies:
+            self._last_replies = replies
+            # Loss over the last probe interval only: a smoothed value would
+            # keep cutting the rate after one lossy interval has passed.
+            self.loss = stats.get('recent_loss_rate')
+            rtt = stats.get('rtt_ms')
+            if rtt is not None:
+                self.queue_delay_ms = rtt - self._windowed_min_rtt(rtt, now)
+            if signal is None and self.loss is not None and self.loss > self.loss_threshold:
+                signal = f"loss {self.loss * 100:.1f}%"
+            elif signal is None and self.queue_delay_ms is not None and self.queue_delay_ms > self.delay_threshold_ms:
+                signal = f"RTT +{self.queue_delay_ms:.0f}ms"
+
+        if signal is not None:
+            self._last_signal = now
+            if self._last_decrease is not None and now - self._last_decrease < self.cooldown_s:
+                return None
+            return self._set_rate(max(self.floor_hz, self.rate_hz * self.decrease), signal, now, decrease=True)
+
+        quiet_since = max(self._last_change, self._last_signal or self._last_change)
+        if now - quiet_since >= self.hold_s:
+            return self._set_rate(min(self.ceiling_hz, self.rate_hz + self.increase_hz), "link clear", now)
+        return None
+
+    def _windowed_min_rtt(self, rtt: float, now: float) -> float:
+        """Minimum RTT over the last min_rtt_window_s, so a route change resets the baseline."""
+        rtts = self._rtts
+        while rtts and rtts[-1][1] >= rtt:
+            rtts.pop()
+        rtts.append((now, rtt))
+        while now - rtts[0][0] > self.min_rtt_window_s:
+            rtts.popleft()
+        return rtts[0][1]
+
+    def _set_rate(self, rate_hz: float, reason: str, now: float, decrease: bool = False) -> Optional[float]:
+        self._last_change = now
+        if decrease:
+            self._last_decrease = now
+        if rate_hz == self.rate_hz:
+            return None
+        self.rate_hz = rate_hz
+        self.reason = reason
+        if decrease:
+            self.decreases += 1
+        else:
+            self.increases += 1
+        return rate_hz
@@ -0,0 +1,203 @@
+"""
+asyncio transport for the UDPSocket protocol.
+
+AsyncUDPSocket speaks the same wire protocol as UDPSocket (handshake and
+extensions, formats, MAC, sequence numbers, max-age) but runs on an
+asyncio.DatagramProtocol instead of a blocking socket and receive thread,
+so one event loop can serve many sockets, timers and telemetry streams:
+
+    udp = AsyncUDPSocket(local_id=2)
+    await udp.setup("0.0.0.0", 8080, inputs="<8bH", is_server=True)
+    if await udp.handshake(timeout=30.0):
+        async for values in udp.packets():
+            ...
+
+get_latest(), get_connection_stats() and the conversion helpers are
+inherited unchanged.
+"""
+
+import asyncio
+import socket
+from typing import Callable, List, Optional
+
+from modules.udp_socket import UDPSocket
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, owner: "AsyncUDPSocket"):
+        self.owner = owner
+
+    def datagram_received(self, data, addr):
+        self.owner._datagram_received(data, addr)
+
+    def error_received(self, exc):
+        print(f"Receive error: {exc}")
+
+
+class AsyncUDPSocket(UDPSocket):
+    """UDPSocket protocol on asyncio. Takes the same constructor arguments.
+
+    Incoming packets are verified and published to get_latest() as they
+    arrive; subscribe() callbacks and packets() iterators are fed from the
+    event loop with no extra threads. receive_mode does not apply: the event
+    loop delivers every datagram, and packets(max_queue=1) gives consumers
+    drain-to-newest behaviour.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transport = None
+        self._handshake_waiter: Optional[asyncio.Future] = None
+        self._subscribers: List[Callable[[List], None]] = []
+        self._streams: List[asyncio.Queue] = []
+
+    async def setup(self, host, port, inputs: str = '', outputs: str = '', is_server=False):
+        """Create the datagram endpoint. Same formats and semantics as UDPSocket.setup()."""
+        self._configure_formats(inputs, outputs)
+        loop = asyncio.get_running_loop()
+        if is_server:
+            local_addr = (host, port)
+        else:
+            infos = await loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            self.remote_addr = infos[0][4]
+            local_addr = ('0.0.0.0', 0)
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), local_addr=local_addr, family=socket.AF_INET)
+        self.socket = self.transport.get_extra_info('socket')
+        if self.recv_buffer_bytes:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, int(self.recv_buffer_bytes))
+        if is_server:
+            print(f"UDP Server listening on {host}:{port}")
+        else:
+            print(f"UDP Client ready to send to {host}:{port}")
+        return True
+
+    async def handshake(self, timeout=5.0):
+        """Awaitable handshake; see UDPSocket.handshake() for the packet layout."""
+        loop = asyncio.get_running_loop()
+        self._handshake_waiter = loop.create_future()
+        our_info = self._handshake_packet()
+        is_client = self.remote_addr is not None
+        try:
+            if is_client:
+                self.transport.sendto(our_info, self.remote_addr)
+            else:
+                print("Waiting for handshake...")
+            try:
+                data, addr = await asyncio.wait_for(self._handshake_waiter, timeout)
+            except asyncio.TimeoutError:
+                print("Handshake timeout!")
+                return False
+            self.remote_addr = addr
+            if not is_client:
+                self.transport.sendto(our_info, addr)
+        finally:
+            self._handshake_waiter = None
+        return self._complete_handshake(data)
+
+    def send(self, values, force: bool = False):
+        """Send values with timestamp. Never blocks: the transport buffers if the socket is full."""
+        if self._use_probes and self.probe_interval_s:
+            self._maybe_probe()
+        if self._suppressed(values, force):
+            return True
+        data = self._pack_packet(values)
+        if data is None:
+            return False
+        # sendto copies the buffer if it cannot be sent immediately.
+        self.transport.sendto(data, self.remote_addr)
+        self.packets_sent += 1
+        if self._use_paths:
+            self._send_redundant()
+        return True
+
+    def _send_copy(self, sock, data, addr):
+        if sock is None:
+            self.transport.sendto(data, addr or self.remote_addr)
+            self.redundant_sent += 1
+        else:
+            super()._send_copy(sock, data, addr)
+
+    def _send_control(self, payload: bytes, addr):
+        self.transport.sendto(self._probe_packet(payload), addr)
+
+    def _schedule_copy(self, delay, sock, data, addr):
+        """Time-spaced copies are event loop timers instead of a sender thread."""
+        asyncio.get_running_loop().call_later(delay, self._send_copy, sock, data, addr)
+
+    def subscribe(self, callback: Callable[[List], None]) -> Callable[[], None]:
+        """Call callback(values) from the event loop for every accepted packet.
+
+        Returns a function that removes the subscription.
+        """
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback) if callback in self._subscribers else None
+
+    async def packets(self, max_queue: int = 1):
+        """Async iterator over accepted packets' values.
+
+        With a full queue the oldest packet is dropped, so a slow consumer
+        always resumes at the newest command (max_queue=1 is latest-only).
+        """
+        queue = asyncio.Queue(maxsize=max_queue)
+        self._streams.append(queue)
+        try:
+            while True:
+                values = await queue.get()
+                if values is None:
+                    return
+                yield values
+        finally:
+            self._streams.remove(queue)
+
+    async def next_packet(self, timeout: Optional[float] = None) -> Optional[List]:
+        """Wait for the next accepted packet; None on timeout."""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        def deliver(values):
+            if not waiter.done():
+                waiter.set_result(values)
+
+        unsubscribe = self.subscribe(deliver)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            unsubscribe()
+
+    def _datagram_received(self, data, addr):
+        waiter = self._handshake_waiter
+        if waiter is not None:
+            if not waiter.done():
+                waiter.set_result((data, addr))
+            return
+        values = self._handle_datagram(data, addr)
+        if values is None:
+            return
+        for callback in tuple(self._subscribers):
+            callback(values)
+        for queue in self._streams:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(values)
+
+    def start_receiving(self):
+        """Packets are received by the event loop; nothing to start."""
+
+    def stop_receiving(self):
+        for queue in self._streams:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def close(self):
+        """Close the transport and end packets() iterators."""
+        self.stop_receiving()
+        for sock, _ in self._paths:
+            sock.close()
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+            print("Socket closed")
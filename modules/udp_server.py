@@ -0,0 +1,248 @@
+"""
+Multi-client UDP server with a per-peer session table.
+
+UDPSocket in server mode latches the first peer it hears from. UDPSessionServer
+serves any number of peers from one socket and one receive thread: each peer
+address maps to its own session holding the handshake result, freshness,
+statistics and latest data. Sessions are UDPSocket instances that share the
+server's socket, so get_latest(), get_connection_stats() and send() behave
+exactly as they do for a single-peer UDPSocket.
+
+    server = UDPSessionServer(local_id=2, idle_timeout=5.0)
+    server.setup("0.0.0.0", 8080, inputs="<8bH")
+    server.start_receiving()
+    for addr, values in server.latest_by_peer().items():
+        ...
+"""
+
+from collections import OrderedDict
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from modules.udp_socket import _HANDSHAKE_MAX_SIZE, _HANDSHAKE_SIZE, UDPSocket
+
+
+class UDPSessionServer:
+    """One socket, one receive thread, a session per peer address.
+
+    The session table is an OrderedDict kept in last-activity order: lookup
+    is a dict access, and idle eviction pops from the least recently active
+    end, so both are O(1) per packet regardless of the number of peers.
+
+    :param idle_timeout: Seconds without a valid packet before a session is evicted
+    :param max_sessions: Handshakes from new peers are refused beyond this
+    :param on_connect: Optional callback(addr, session) after a successful handshake
+    :param on_evict: Optional callback(addr, session) when a session is evicted;
+                     the session is closed after it returns
+    :param session_options: UDPSocket keyword arguments applied to every session
+                            (max_age_seconds, hmac_key, mac_algorithm,
+                            sequence_numbers, ...)
+    """
+
+    def __init__(self, local_id=0, idle_timeout: float = 5.0, max_sessions: int = 1024,
+                 on_connect: Optional[Callable] = None, on_evict: Optional[Callable] = None,
+                 recv_buffer_bytes: Optional[int] = None, **session_options):
+        if idle_timeout <= 0:
+            raise ValueError("idle_timeout must be greater than 0")
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be >= 1")
+        self.local_id = local_id
+        self.idle_timeout = float(idle_timeout)
+        self.max_sessions = int(max_sessions)
+        self.on_connect = on_connect
+        self.on_evict = on_evict
+        self.recv_buffer_bytes = recv_buffer_bytes
+        self.session_options = session_options
+        self.inputs_fmt = ''
+        self.outputs_fmt = ''
+        self.socket = None
+        self.sessions: "OrderedDict[tuple, UDPSocket]" = OrderedDict()
+        self._last_seen: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        self.recv_thread = None
+        self.running = False
+
+        # Statistics
+        self.handshakes = 0
+        self.handshakes_failed = 0
+        self.sessions_refused = 0
+        self.sessions_evicted = 0
+        self.packets_unknown_peer = 0
+
+    def setup(self, host, port, inputs: str = '', outputs: str = ''):
+        """Bind the shared socket. Formats are the same for every peer."""
+        # Validate the formats once with a template session.
+        self._new_session()._configure_formats(inputs, outputs)
+        self.inputs_fmt = inputs
+        self.outputs_fmt = outputs
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.settimeout(min(1.0, self.idle_timeout / 2.0))
+        if self.recv_buffer_bytes:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, int(self.recv_buffer_bytes))
+        self.socket.bind((host, port))
+        print(f"UDP session server listening on {host}:{port}")
+        return True
+
+    def _new_session(self) -> UDPSocket:
+        return UDPSocket(local_id=self.local_id, **self.session_options)
+
+    # ================================
+    # Session access
+    # ================================
+    def get_session(self, addr) -> Optional[UDPSocket]:
+        return self.sessions.get(addr)
+
+    def get_latest(self, addr) -> Optional[List]:
+        """Latest fresh data from one peer, else None."""
+        session = self.sessions.get(addr)
+        return session.get_latest() if session else None
+
+    def latest_by_peer(self) -> Dict[tuple, List]:
+        """{addr: values} for every peer with fresh data."""
+        with self._lock:
+            sessions = list(self.sessions.items())
+        latest = {}
+        for addr, session in sessions:
+            values = session.get_latest()
+            if values is not None:
+                latest[addr] = values
+        return latest
+
+    def send(self, addr, values) -> bool:
+        """Send values to one peer using its negotiated packet format."""
+        session = self.sessions.get(addr)
+        if session is None:
+            print(f"No session for {addr}")
+            return False
+        return session.send(values)
+
+    def broadcast(self, values) -> int:
+        """Send values to every session; return how many sends succeeded."""
+        with self._lock:
+            sessions = list(self.sessions.values())
+        return sum(1 for session in sessions if session.send(values))
+
+    def get_connection_stats(self) -> dict:
+        with self._lock:
+            active = len(self.sessions)
+        return {
+            'sessions': active,
+            'handshakes': self.handshakes,
+            'handshakes_failed': self.handshakes_failed,
+            'sessions_refused': self.sessions_refused,
+            'sessions_evicted': self.sessions_evicted,
+            'packets_unknown_peer': self.packets_unknown_peer,
+        }
+
+    # ================================
+    # Receive loop
+    # ================================
+    def start_receiving(self):
+        """Start the receive thread."""
+        if not self.recv_thread or not self.recv_thread.is_alive():
+            self.running = True
+            self.recv_thread = threading.Thread(target=self._receive_loop, daemon=True)
+            self.recv_thread.start()
+            print("Started receive thread")
+
+    def stop_receiving(self):
+        """Stop the receive thread."""
+        self.running = False
+        if self.recv_thread:
+            self.recv_thread.join(timeout=2.0)
+            print("Stopped receive thread")
+
+    def _receive_loop(self):
+        while self.running:
+            try:
+                data, addr = self.socket.recvfrom(_HANDSHAKE_MAX_SIZE)
+                self._handle(data, addr)
+            except socket.timeout:
+                pass
+            except Exception as e:
+                if self.running:
+                    print(f"Receive error: {e}")
+            self._evict_idle(time.monotonic())
+
+    def _handle(self, data, addr):
+        session = self.sessions.get(addr)
+        if session is not None and len(data) == session._expected_datagram_size():
+            if session._handle_datagram(data, addr) is not None:
+                self._touch(addr)
+            return
+        if session is not None and session._is_probe(data):
+            # Probes are answered by the session but do not count as activity.
+            # Signed probes are as long as a handshake, so match them exactly.
+            session._handle_datagram(data, addr)
+            return
+        if len(data) >= _HANDSHAKE_SIZE:
+            # A new peer, or a known peer that restarted and handshakes again.
+            self._handshake(data, addr)
+        elif session is None:
+            self.packets_unknown_peer += 1
+
+    def _handshake(self, data, addr):
+        if addr not in self.sessions and len(self.sessions) >= self.max_sessions:
+            self.sessions_refused += 1
+            print(f"Refusing handshake from {addr}: {self.max_sessions} sessions active")
+            return
+        session = self._new_session()
+        session._configure_formats(self.inputs_fmt, self.outputs_fmt)
+        session.socket = self.socket
+        session.remote_addr = addr
+        # Reply before validating, like UDPSocket.handshake(), so the peer
+        # sees our settings and reports the mismatch on its side too.
+        self.socket.sendto(session._handshake_packet(), addr)
+        if not session._complete_handshake(data):
+            self.handshakes_failed += 1
+            return
+        with self._lock:
+            replaced = self.sessions.get(addr)
+            self.sessions[addr] = session
+            self._last_seen[addr] = time.monotonic()
+            self.sessions.move_to_end(addr)
+        if replaced is not None:
+            self._close_session(replaced)
+        self.handshakes += 1
+        if self.on_connect:
+            self.on_connect(addr, session)
+
+    def _touch(self, addr):
+        with self._lock:
+            self._last_seen[addr] = time.monotonic()
+            self.sessions.move_to_end(addr)
+
+    def _evict_idle(self, now):
+        evicted = []
+        with self._lock:
+            while self.sessions:
+                addr = next(iter(self.sessions))
+                if now - self._last_seen[addr] <= self.idle_timeout:
+                    break
+                evicted.append((addr, self.sessions.pop(addr)))
+                del self._last_seen[addr]
+        for addr, session in evicted:
+            self.sessions_evicted += 1
+            print(f"Session {addr} evicted after {self.idle_timeout:.1f}s idle")
+            if self.on_evict:
+                self.on_evict(addr, session)
+            self._close_session(session)
+
+    @staticmethod
+    def _close_session(session):
+        """Stop a session's delayed sender and close its extra path sockets; the shared socket stays open."""
+        session.socket = None
+        session.close()
+
+    def close(self):
+        """Clean shutdown."""
+        self.stop_receiving()
+        with self._lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            self._close_session(session)
+        if self.socket:
+            self.socket.close()
+            print("Socket closed")
@@ -1,15 +1,162 @@
 import hashlib
+import heapq
 import hmac
+import itertools
+import select
 import socket
 import struct
 import threading
 import time
 from typing import Optional, List
 
+from modules.link_stats import SEQ_MOD, TIMESTAMP_MOD, ClockSync, PathStats, SequenceTracker
+from modules.packet_layout import PacketLayout
+from modules.tx_policy import DeltaKeepalivePolicy
+
 HMAC_DIGEST_SIZE = 32  # SHA-256
 _HANDSHAKE_SIZE = 69   # BHH32s32s
+_HANDSHAKE_MAX_SIZE = 512
 _ENDIAN_CHARS = frozenset('@=<>!')
 
+# Packet MAC algorithms (wire id) and allowed tag lengths in bytes.
+MAC_ALGORITHMS = {'hmac-sha256': 0, 'blake2s': 1}
+MAC_TAG_SIZES = (8, 16, 32)
+
+RECEIVE_MODES = ('each', 'drain_newest')
+
+# Handshake extensions: [type:B][length:B][value] records after the 69-byte base.
+_EXT_MAC = 1
+_EXT_SEQUENCE = 2
+_EXT_PATHS = 3
+_EXT_KEEPALIVE = 4
+_EXT_LAYOUT = 5
+_EXT_PROBE = 6
+
+# RTT/clock probes share the data socket. Layout: magic, kind, probe id,
+# t1 (request sent), t2 (request received), t3 (reply sent), then in replies
+# the timestamp_ms of the responder's latest command, its arrival time and
+# the responder's count of received data packets. In requests the last field
+# is the sender's current nominal rate in cHz. Times are wall-clock seconds.
+_PROBE_STRUCT = struct.Struct('<4sBHdddIdI')
+_PROBE_MAGIC = b'PRB1'
+_PROBE_REQUEST = 0
+_PROBE_REPLY = 1
+_PROBE_HISTORY = 64  # packets_sent at each recent probe, indexed by probe id
+
+# IPv4 + UDP header bytes per datagram, counted in bytes_saved.
+IP_UDP_OVERHEAD = 28
+
+# Redundant copies are tagged with a one-byte path id: path * copies + copy.
+MAX_PATH_IDS = 256
+
+
+def _pack_extension(ext_type: int, value: bytes) -> bytes:
+    return struct.pack('<BB', ext_type, len(value)) + value
+
+
+def _parse_extensions(data: bytes) -> dict:
+    """Return {type: value} from handshake extension records; unknown types are kept but unused."""
+    extensions = {}
+    offset = 0
+    while offset + 2 <= len(data):
+        ext_type, length = struct.unpack_from('<BB', data, offset)
+        offset += 2
+        if offset + length > len(data):
+            raise ValueError("truncated handshake extension")
+        extensions[ext_type] = bytes(data[offset:offset + length])
+        offset += length
+    return extensions
+
+
+def _make_signer(algorithm: str, key: bytes, tag_size: int):
+    """Return sign(data) -> tag. The keyed context is built once and copied per packet.
+
+    hmac.new() per packet redoes the key padding and both inner/outer
+    compression setups; copying the prepared state skips that work.
+    """
+    if algorithm == 'hmac-sha256':
+        base = hmac.new(key, digestmod=hashlib.sha256)
+
+        def sign(data):
+            mac = base.copy()
+            mac.update(data)
+            return mac.digest()[:tag_size]
+        return sign
+    if algorithm == 'blake2s':
+        # Keyed BLAKE2s is a MAC on its own; keys longer than 32 bytes are hashed down.
+        if len(key) > 32:
+            key = hashlib.blake2s(key).digest()
+        base = hashlib.blake2s(key=key, digest_size=tag_size)
+
+        def sign(data):
+            mac = base.copy()
+            mac.update(data)
+            return mac.digest()
+        return sign
+    raise ValueError(f"Unknown MAC algorithm '{algorithm}', expected one of {tuple(MAC_ALGORITHMS)}")
+
+
+class DelayedSender:
+    """Sends datagrams after a delay from one background thread.
+
+    Used for time-spaced redundant copies and by modules/netem.py. Pending
+    datagrams are kept in a heap ordered by due time, so the caller never
+    sleeps and one thread serves any number of them. `send(sock, data,
+    addr)` is called from that thread when each one is due.
+    """
+
+    def __init__(self, send):
+        self._send = send
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def schedule(self, delay: float, sock, data: bytes, addr):
+        with self._cond:
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._order), sock, data, addr))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if not self._running:
+                    return
+                _, _, sock, data, addr = heapq.heappop(self._heap)
+            self._send(sock, data, addr)
+
+    def cancel(self, sock):
+        """Drop pending datagrams for sock; a datagram already being sent still goes out."""
+        with self._cond:
+            self._heap = [entry for entry in self._heap if entry[2] is not sock]
+            heapq.heapify(self._heap)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._heap.clear()
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+def _rate_c_hz(rate_hz: Optional[float]) -> int:
+    """Rate in centi-Hz as sent on the wire (uint16); 0 means unknown."""
+    return max(0, min(65535, int(round(rate_hz * 100.0)))) if rate_hz else 0
+
+
+def _value_count(fmt: str) -> int:
+    """Number of values a struct format packs."""
+    return len(struct.unpack(fmt, bytes(struct.calcsize(fmt))))
+
 
 def _parse_fmt(fmt: str) -> tuple:
     """Return (endian, data_part) from a struct format string. Default endian is '<'."""
@@ -30,7 +177,81 @@ class UDPSocket:
     """
 
     def __init__(self, local_id=0, max_age_seconds=0.5, hmac_key: Optional[str] = None,
-                 nominal_rate_hz: Optional[float] = None):
+                 nominal_rate_hz: Optional[float] = None, mac_algorithm: str = 'hmac-sha256',
+                 mac_tag_size: int = HMAC_DIGEST_SIZE, sequence_numbers: bool = False,
+                 receive_mode: str = 'each', recv_buffer_bytes: Optional[int] = None, drain_batch: int = 64,
+                 multipath: bool = False, copies: int = 1, copy_spacing_s: float = 0.002,
+                 keepalive_rate_hz: Optional[float] = None, delta_thresholds: Optional[List[int]] = None,
+                 packet_layout: Optional[PacketLayout] = None, accept_layouts: bool = False,
+                 probe_interval_s: Optional[float] = None, answer_probes: bool = False):
+        """
+        :param hmac_key: Shared key; enables a MAC on every packet.
+        :param mac_algorithm: 'hmac-sha256' or 'blake2s' (keyed BLAKE2s).
+        :param mac_tag_size: MAC bytes appended per packet, one of MAC_TAG_SIZES.
+                             Algorithm and tag size are checked in handshake().
+        :param sequence_numbers: Request a 16-bit sequence number after the
+                                 timestamp. Used only if the peer requests it
+                                 too; the receiver then drops late/duplicate
+                                 packets and tracks loss, reordering and jitter.
+        :param receive_mode: 'each' applies every datagram in arrival order.
+                             'drain_newest' empties the socket queue on each
+                             wakeup without blocking and publishes only the
+                             newest valid packet; older queued packets are not
+                             verified and are counted in packets_skipped.
+                             The socket is non-blocking in this mode.
+        :param recv_buffer_bytes: SO_RCVBUF size. A small buffer bounds how much
+                                  stale backlog can queue up during a stall.
+        :param drain_batch: Newest datagrams kept per drain pass in
+                            'drain_newest' mode (in preallocated buffers).
+        :param multipath: Request redundant-send support (implies
+                          sequence_numbers). Used only if the peer requests
+                          it too; every packet then carries a path id, the
+                          receiver keeps the first copy of each sequence
+                          number and reports which path delivered first.
+        :param copies: Send every packet this many times per path (multipath only).
+        :param copy_spacing_s: Delay between consecutive copies on one path,
+                               so a short loss burst does not take them all.
+        :param keepalive_rate_hz: Enable delta/keepalive sending: send() only
+                                  transmits when a value changed by more than
+                                  its delta_thresholds entry (any change for
+                                  values without one, e.g. button masks), and
+                                  otherwise at this rate. Advertised in the
+                                  handshake and raised if needed so a
+                                  keepalive arrives at least twice per peer
+                                  max_age.
+        :param delta_thresholds: Per-value change needed to send immediately.
+        :param packet_layout: Send outputs bit-packed with this PacketLayout
+                              instead of the struct format, if the peer can
+                              decode layouts. Its rolling sequence number
+                              replaces the timestamp. Not used with multipath:
+                              the layout has no path id, so the handshake
+                              announces an empty spec and the struct is sent.
+        :param accept_layouts: Decode a bit-packed layout announced by the peer.
+                               The layout is self-describing, so the receiver
+                               needs no copy of the sender's config.
+        :param probe_interval_s: Send an NTP-style RTT/clock probe this often
+                                 from send(), if the peer answers probes.
+                                 Replies are handled by the receive thread,
+                                 so start_receiving() must be running.
+        :param answer_probes: Answer the peer's probes. The reply also
+                              reports the age of the latest command, so the
+                              sender learns how old commands are on arrival.
+        """
+        if receive_mode not in RECEIVE_MODES:
+            raise ValueError(f"receive_mode must be one of {RECEIVE_MODES}")
+        if drain_batch < 1:
+            raise ValueError("drain_batch must be >= 1")
+        if copies < 1 or copies > MAX_PATH_IDS:
+            raise ValueError(f"copies must be between 1 and {MAX_PATH_IDS}")
+        if copy_spacing_s < 0:
+            raise ValueError("copy_spacing_s must be >= 0")
+        if keepalive_rate_hz is not None and keepalive_rate_hz <= 0:
+            raise ValueError("keepalive_rate_hz must be greater than 0")
+        if probe_interval_s is not None and probe_interval_s <= 0:
+            raise ValueError("probe_interval_s must be greater than 0")
+        self.receive_mode = receive_mode
+        self.recv_buffer_bytes = recv_buffer_bytes
+        self.drain_batch = int(drain_batch)
         self.socket = None
         self.remote_addr = None
         self.local_id = local_id
@@ -41,31 +262,120 @@ class UDPSocket:
         self.max_age_seconds = max_age_seconds
         self.nominal_rate_hz = float(nominal_rate_hz) if nominal_rate_hz is not None else None
         self.remote_nominal_rate_hz: Optional[float] = None
+        self.remote_max_age_seconds: Optional[float] = None
 
-        # For receiving data
-        self.latest_data = None
-        self.latest_timestamp = 0.0
-        self.data_lock = threading.Lock()
+        # For receiving data. The receive thread is the only writer: it
+        # publishes each accepted packet as one immutable (values, arrival
+        # time, peer timestamp_ms) tuple by a single attribute assignment,
+        # so readers get a consistent snapshot without taking a lock.
+        self._latest = (None, 0.0, None)
         self.recv_thread = None
         self.running = False
 
-        # Statistics
+        # Statistics. Each counter has one writer thread and is read without
+        # a lock; packets_expired is counted by reader threads, so it has its
+        # own lock, which the receive thread never takes.
         self.packets_received = 0
+        self.packets_skipped = 0  # older queued packets superseded in 'drain_newest' mode
         self.packets_expired = 0
-        self.last_packet_time = 0.0
+        self._expired_lock = threading.Lock()
 
-        # Pre-computed format strings (filled after setup)
+        # Pre-computed format strings and Structs (filled after setup)
         self.send_format = None
         self.recv_format = None
+        self._in_parts = ('<', '')
+        self._out_parts = ('<', '')
+        self._send_struct = None
+        self._recv_struct = None
+        self._send_buffer = None
+        self._send_view = None
         self._nonblocking_send = False
+        self.packets_sent = 0
+        self.packets_dropped = 0  # sends dropped because the socket buffer was full
 
         # HMAC authentication (optional)
-        self._hmac_key = hmac_key.encode('utf-8') if isinstance(hmac_key, str) else hmac_key
+        self._hmac_key = None
+        self._sign = None
+        self.mac_algorithm = 'hmac-sha256'
+        self.mac_tag_size = HMAC_DIGEST_SIZE
         self.packets_rejected = 0
+        self.set_hmac(hmac_key, mac_algorithm, mac_tag_size)
+
+        # Sequence numbers (optional, negotiated in handshake)
+        self.sequence_numbers = bool(sequence_numbers) or bool(multipath)
+        self._use_sequence = self.sequence_numbers
+        self._send_sequence = 0
+        self.sequence_tracker = SequenceTracker()
+
+        # Redundant multi-path sending (optional, negotiated in handshake)
+        self.multipath = bool(multipath)
+        self._use_paths = self.multipath
+        self.copies = int(copies)
+        self.copy_spacing_s = float(copy_spacing_s)
+        self._paths = []  # extra (socket, addr) paths; path 0 is self.socket to remote_addr
+        self._path_id_offset = 0
+        self._header_count = 1
+        self._delayed = None
+        self.path_stats = PathStats()
+        self.redundant_sent = 0
+        self.redundant_dropped = 0
+
+        # Bit-packed layouts (optional, negotiated in handshake)
+        self.packet_layout = packet_layout
+        self.accept_layouts = bool(accept_layouts)
+        self._send_layout: Optional[PacketLayout] = None
+        self._recv_layout: Optional[PacketLayout] = None
+        self._track_sequence = self._use_sequence
+
+        # Delta/keepalive sending (optional; the rate is advertised in handshake)
+        self.keepalive_rate_hz = float(keepalive_rate_hz) if keepalive_rate_hz else None
+        self.remote_keepalive_rate_hz: Optional[float] = None
+        self.tx_policy = (DeltaKeepalivePolicy(1.0 / self.keepalive_rate_hz, delta_thresholds)
+                          if self.keepalive_rate_hz else None)
 
-    def set_hmac(self, key: str):
-        """Set HMAC key for packet authentication. Must be called on both sides with the same key."""
+        # RTT/clock probes (optional, negotiated in handshake)
+        self.probe_interval_s = float(probe_interval_s) if probe_interval_s else None
+        self.answer_probes = bool(answer_probes)
+        self._use_probes = False
+        self._probe_size = _PROBE_STRUCT.size
+        self._next_probe = 0.0
+        self._probe_id = 0
+        self._probe_sent_counts = [0] * _PROBE_HISTORY
+        self.clock_sync = ClockSync()
+        self.probes_sent = 0
+        self.probe_replies = 0
+        self.probes_answered = 0
+        self.command_age_ms: Optional[float] = None
+        self.remote_received = 0
+        self.remote_loss_rate: Optional[float] = None
+        self.recent_loss_rate: Optional[float] = None
+        self._last_delivery = None  # (sent, received) at the previous probe reply
+        self._probe_stats = self._probe_stats_snapshot()
+
+    def set_hmac(self, key: str, algorithm: Optional[str] = None, tag_size: Optional[int] = None):
+        """Set MAC key (and optionally algorithm/tag size) for packet authentication.
+
+        Must be called on both sides with the same settings before handshake().
+        """
+        algorithm = self.mac_algorithm if algorithm is None else algorithm
+        tag_size = self.mac_tag_size if tag_size is None else int(tag_size)
+        if algorithm not in MAC_ALGORITHMS:
+            raise ValueError(f"Unknown MAC algorithm '{algorithm}', expected one of {tuple(MAC_ALGORITHMS)}")
+        if tag_size not in MAC_TAG_SIZES:
+            raise ValueError(f"mac_tag_size must be one of {MAC_TAG_SIZES}")
         self._hmac_key = key.encode('utf-8') if isinstance(key, str) else key
+        self.mac_algorithm = algorithm
+        self.mac_tag_size = tag_size
+        self._sign = _make_signer(algorithm, self._hmac_key, tag_size) if self._hmac_key else None
+        self._allocate_send_buffer()
+
+    def _allocate_send_buffer(self):
+        """Size the reusable send buffer for payload + MAC."""
+        if self._send_struct is None:
+            return
+        mac_size = self.mac_tag_size if self._hmac_key else 0
+        self._send_buffer = bytearray(self._send_struct.size + mac_size)
+        self._send_view = memoryview(self._send_buffer)
 
     def setup(self, host, port, inputs: str = '', outputs: str = '', is_server=False):
         """Set up UDP socket.
@@ -74,6 +384,24 @@ class UDPSocket:
         outputs: struct format for data sent     (e.g. '10b', '<12f').  '' = send-nothing.
         Endianness prefix is optional — defaults to '<' if omitted.
         """
+        self._configure_formats(inputs, outputs)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.settimeout(1.0)
+        if self.recv_buffer_bytes:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, int(self.recv_buffer_bytes))
+
+        if is_server:
+            self.socket.bind((host, port))
+            print(f"UDP Server listening on {host}:{port}")
+        else:
+            self.remote_addr = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+            print(f"UDP Client ready to send to {host}:{port}")
+
+        return True
+
+    def _configure_formats(self, inputs: str, outputs: str):
+        """Validate and normalize the inputs/outputs formats and build the packet Structs."""
         for name, fmt in (('inputs', inputs), ('outputs', outputs)):
             if len(fmt) > 32:
                 raise ValueError(f"{name} format exceeds 32-char handshake limit: '{fmt}'")
@@ -90,32 +418,86 @@ class UDPSocket:
         self.inputs_fmt = (in_endian + in_data) if inputs else ''
         self.outputs_fmt = (out_endian + out_data) if outputs else ''
 
-        self._num_inputs = len(struct.unpack(self.inputs_fmt, bytes(struct.calcsize(self.inputs_fmt)))) if inputs else 0
-        self._num_outputs = len(struct.unpack(self.outputs_fmt, bytes(struct.calcsize(self.outputs_fmt)))) if outputs else 0
+        self._num_inputs = _value_count(self.inputs_fmt) if inputs else 0
+        self._num_outputs = _value_count(self.outputs_fmt) if outputs else 0
 
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.settimeout(1.0)
+        self._in_parts = (in_endian, in_data if inputs else '')
+        self._out_parts = (out_endian, out_data if outputs else '')
+        if self.packet_layout is not None and self.packet_layout.num_values != self._num_outputs:
+            raise ValueError(f"packet_layout has {self.packet_layout.num_values} values, "
+                             f"outputs format '{self.outputs_fmt}' has {self._num_outputs}")
+        self._build_structs()
 
-        if is_server:
-            self.socket.bind((host, port))
-            print(f"UDP Server listening on {host}:{port}")
-        else:
-            self.remote_addr = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
-            print(f"UDP Client ready to send to {host}:{port}")
+    def _build_structs(self):
+        """Packet format: endian + timestamp (uint32) [+ sequence (uint16) [+ path id (uint8)]] + data elements."""
+        header = 'IHB' if self._use_paths else 'IH' if self._use_sequence else 'I'
+        self._header_count = len(header)
+        self._path_id_offset = struct.calcsize(self._out_parts[0] + 'IH')
+        self.recv_format = self._in_parts[0] + header + self._in_parts[1]
+        self.send_format = self._out_parts[0] + header + self._out_parts[1]
+        self._recv_struct = struct.Struct(self.recv_format)
+        self._send_struct = struct.Struct(self.send_format)
+        # A negotiated bit-packed layout replaces the Struct: (seq, *values) on the wire.
+        if self._recv_layout is not None:
+            self._recv_struct = self._recv_layout
+            self._header_count = 1
+        if self._send_layout is not None:
+            self._send_struct = self._send_layout
+        self._track_sequence = self._use_sequence or self._recv_layout is not None
+        # Probes are told apart from data by size: pad them until no data
+        # packet in either direction has the same size. Both peers know both
+        # sizes after the handshake, so they pick the same padding.
+        self._probe_size = _PROBE_STRUCT.size
+        while self._probe_size in (self._send_struct.size, self._recv_struct.size):
+            self._probe_size += 1
+        self._allocate_send_buffer()
 
-        # Format: endian + timestamp (uint32) + data elements
-        self.recv_format = (in_endian + 'I' + in_data) if inputs else (in_endian + 'I')
-        self.send_format = (out_endian + 'I' + out_data) if outputs else (out_endian + 'I')
+    def add_path(self, host: Optional[str] = None, port: Optional[int] = None,
+                 bind_host: Optional[str] = None) -> int:
+        """Add a redundant send path; return the number of paths (including the primary).
 
-        return True
+        Each path gets its own non-blocking socket, optionally bound to a
+        local address (e.g. the IP of a second modem) so the OS routes it
+        over another interface. host/port default to the primary remote
+        address. Copies are only sent once multipath has been negotiated.
+        """
+        if (len(self._paths) + 2) * self.copies > MAX_PATH_IDS:
+            raise ValueError(f"at most {MAX_PATH_IDS} path ids (paths x copies)")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if bind_host is not None:
+            sock.bind((bind_host, 0))
+        sock.setblocking(False)
+        addr = None
+        if host is not None:
+            addr = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+        self._paths.append((sock, addr))
+        print(f"Redundant path {len(self._paths)}: {sock.getsockname()[0] if bind_host else 'default route'}"
+              f" -> {host or 'remote'}:{port or ''}")
+        return len(self._paths) + 1
 
     def set_nominal_rate_hz(self, nominal_rate_hz: Optional[float]):
-        """Set local nominal application send/update rate advertised in handshake."""
+        """Set local nominal application send/update rate advertised in handshake.
+
+        After the handshake the new rate reaches the peer in probe requests,
+        if probes are in use; the next send() sends one right away.
+        """
         self.nominal_rate_hz = float(nominal_rate_hz) if nominal_rate_hz is not None else None
+        if self._use_probes and self.probe_interval_s:
+            self._next_probe = 0.0
 
     def set_nonblocking_send(self, enabled: bool = True):
-        """Drop a packet instead of blocking the caller if sendto would block."""
+        """Drop a packet instead of blocking the caller if sendto would block.
+
+        The socket is switched to non-blocking once, not around every send.
+        Dropped packets are counted in packets_dropped; the receive thread
+        waits with select() while the socket is non-blocking.
+        """
         self._nonblocking_send = bool(enabled)
+        if self.socket:
+            if self._nonblocking_send:
+                self.socket.setblocking(False)
+            else:
+                self.socket.settimeout(1.0)
 
     def get_handshake_info(self) -> dict:
         """Return local/remote handshake metadata."""
@@ -125,8 +507,17 @@ class UDPSocket:
             'remote_addr': self.remote_addr,
             'remote_nominal_rate_hz': self.remote_nominal_rate_hz,
             'max_age_seconds': self.max_age_seconds,
+            'remote_max_age_seconds': self.remote_max_age_seconds,
             'inputs_fmt': self.inputs_fmt,
             'outputs_fmt': self.outputs_fmt,
+            'mac': (self.mac_algorithm, self.mac_tag_size) if self._hmac_key else None,
+            'sequence_numbers': self._use_sequence,
+            'multipath': self._use_paths,
+            'keepalive_rate_hz': self.keepalive_rate_hz,
+            'remote_keepalive_rate_hz': self.remote_keepalive_rate_hz,
+            'send_layout': self._send_layout.spec if self._send_layout else None,
+            'recv_layout': self._recv_layout.spec if self._recv_layout else None,
+            'probes': self._use_probes,
         }
 
     # ================================
@@ -163,18 +554,17 @@ class UDPSocket:
         """Perform handshake exchanging format strings and rate info.
 
         Packet layout (69 bytes): [local_id:B][max_age_ms:H][nominal_rate_cHz:H][out_fmt:32s][in_fmt:32s]
+        followed by optional [type:B][length:B][value] extension records.
+        Extensions are only sent for non-default settings, so peers running
+        the plain 69-byte handshake still interoperate with default settings.
         """
-        max_age_ms = int(self.max_age_seconds * 1000)
-        nominal_rate_c_hz = max(0, min(65535, int(round(self.nominal_rate_hz * 100.0)))) if self.nominal_rate_hz else 0
-        out_fmt_bytes = self.outputs_fmt.encode('ascii').ljust(32, b'\x00')
-        in_fmt_bytes = self.inputs_fmt.encode('ascii').ljust(32, b'\x00')
-        our_info = struct.pack('<BHH32s32s', self.local_id, max_age_ms, nominal_rate_c_hz, out_fmt_bytes, in_fmt_bytes)
+        our_info = self._handshake_packet()
 
         if self.remote_addr:  # Client mode
             self.socket.sendto(our_info, self.remote_addr)
             self.socket.settimeout(timeout)
             try:
-                data, addr = self.socket.recvfrom(_HANDSHAKE_SIZE)
+                data, addr = self.socket.recvfrom(_HANDSHAKE_MAX_SIZE)
                 self.remote_addr = addr
             except socket.timeout:
                 print("Handshake timeout!")
@@ -183,21 +573,42 @@ class UDPSocket:
             print("Waiting for handshake...")
             self.socket.settimeout(timeout)
             try:
-                data, addr = self.socket.recvfrom(_HANDSHAKE_SIZE)
+                data, addr = self.socket.recvfrom(_HANDSHAKE_MAX_SIZE)
                 self.remote_addr = addr
                 self.socket.sendto(our_info, self.remote_addr)
             except socket.timeout:
                 print("Handshake timeout!")
                 return False
 
-        if len(data) != _HANDSHAKE_SIZE:
-            print(f"Handshake packet wrong size: expected {_HANDSHAKE_SIZE}, got {len(data)}")
+        if not self._complete_handshake(data):
             return False
+        self.set_nonblocking_send(self._nonblocking_send)
+        return True
+
+    def _handshake_packet(self) -> bytes:
+        max_age_ms = int(self.max_age_seconds * 1000)
+        nominal_rate_c_hz = _rate_c_hz(self.nominal_rate_hz)
+        out_fmt_bytes = self.outputs_fmt.encode('ascii').ljust(32, b'\x00')
+        in_fmt_bytes = self.inputs_fmt.encode('ascii').ljust(32, b'\x00')
+        our_info = struct.pack('<BHH32s32s', self.local_id, max_age_ms, nominal_rate_c_hz, out_fmt_bytes, in_fmt_bytes)
+        return our_info + self._handshake_extensions()
 
-        remote_id, remote_max_age_ms, remote_rate_c_hz, raw_out, raw_in = struct.unpack('<BHH32s32s', data)
+    def _complete_handshake(self, data: bytes) -> bool:
+        """Validate the peer's handshake packet and apply the negotiated settings."""
+        if len(data) < _HANDSHAKE_SIZE:
+            print(f"Handshake packet wrong size: expected at least {_HANDSHAKE_SIZE}, got {len(data)}")
+            return False
+        try:
+            extensions = _parse_extensions(data[_HANDSHAKE_SIZE:])
+        except ValueError as e:
+            print(f"Handshake packet malformed: {e}")
+            return False
+
+        remote_id, remote_max_age_ms, remote_rate_c_hz, raw_out, raw_in = struct.unpack_from('<BHH32s32s', data)
         remote_out_fmt = raw_out.rstrip(b'\x00').decode('ascii')
         remote_in_fmt = raw_in.rstrip(b'\x00').decode('ascii')
         self.remote_nominal_rate_hz = remote_rate_c_hz / 100.0 if remote_rate_c_hz > 0 else None
+        self.remote_max_age_seconds = remote_max_age_ms / 1000.0
 
         if remote_in_fmt != self.outputs_fmt:
             print(f"Mismatch: They expect inputs '{remote_in_fmt}', we send '{self.outputs_fmt}'")
@@ -205,75 +616,409 @@ class UDPSocket:
         if remote_out_fmt != self.inputs_fmt:
             print(f"Mismatch: They send outputs '{remote_out_fmt}', we expect '{self.inputs_fmt}'")
             return False
+        if not self._accept_extensions(extensions):
+            return False
+        self._use_sequence = self.sequence_numbers and _EXT_SEQUENCE in extensions
+        if self.sequence_numbers and not self._use_sequence:
+            print("Peer does not support sequence numbers; continuing without them")
+        self._use_paths = self.multipath and self._use_sequence and _EXT_PATHS in extensions
+        if self.multipath and not self._use_paths:
+            print("Peer does not support multipath; sending a single copy")
+        if not self._negotiate_layouts(extensions):
+            return False
+        self._send_sequence = 0
+        self.sequence_tracker.reset()
+        self.path_stats = PathStats()
+        self._negotiate_keepalive(extensions, remote_max_age_ms / 1000.0)
+        self._negotiate_probes(extensions)
+        self._build_structs()
 
         rate_msg = f", rate: {self.remote_nominal_rate_hz:.2f}Hz" if self.remote_nominal_rate_hz is not None else ""
+        if self._hmac_key:
+            rate_msg += f", mac: {self.mac_algorithm}/{self.mac_tag_size}B"
+        if self._use_sequence:
+            rate_msg += ", seq"
+        if self._use_paths:
+            rate_msg += f", multipath ({len(self._paths) + 1} paths x {self.copies})"
+        if self.remote_keepalive_rate_hz:
+            rate_msg += f", keepalive: {self.remote_keepalive_rate_hz:.2f}Hz"
+        if self._send_layout:
+            rate_msg += f", compact out: {self._send_layout.size}B"
+        if self._recv_layout:
+            rate_msg += f", compact in: {self._recv_layout.size}B"
+        if self._use_probes:
+            rate_msg += ", probes"
         print(f"Handshake OK with device ID {remote_id} (max_age: {remote_max_age_ms}ms, "
               f"in: '{self.inputs_fmt}', out: '{self.outputs_fmt}'{rate_msg})")
-        self.socket.settimeout(1.0)
         return True
 
-    def send(self, values):
-        """Send values with timestamp. Values must match the outputs format."""
-        if not self.remote_addr:
-            print("No remote address set!")
-            return False
+    def _handshake_extensions(self) -> bytes:
+        extensions = b''
+        if self._hmac_key and (self.mac_algorithm, self.mac_tag_size) != ('hmac-sha256', HMAC_DIGEST_SIZE):
+            extensions += _pack_extension(
+                _EXT_MAC, struct.pack('<BB', MAC_ALGORITHMS[self.mac_algorithm], self.mac_tag_size))
+        if self.sequence_numbers:
+            extensions += _pack_extension(_EXT_SEQUENCE, b'')
+        if self.multipath:
+            extensions += _pack_extension(_EXT_PATHS, b'')
+        if self.packet_layout is not None or self.accept_layouts:
+            # Empty value: we decode layouts but send the struct format. Layouts
+            # have no path id field, so multipath always sends the struct format.
+            spec = self.packet_layout.spec if self.packet_layout is not None and not self.multipath else ''
+            extensions += _pack_extension(_EXT_LAYOUT, spec.encode('ascii'))
+        if self.keepalive_rate_hz:
+            keepalive_c_hz = max(1, min(65535, int(round(self.keepalive_rate_hz * 100.0))))
+            extensions += _pack_extension(_EXT_KEEPALIVE, struct.pack('<H', keepalive_c_hz))
+        if self.probe_interval_s or self.answer_probes:
+            # Advertised by both roles: a peer that sends this answers probes.
+            extensions += _pack_extension(_EXT_PROBE, b'')
+        return extensions
 
-        if len(values) != self._num_outputs:
-            print(f"Expected {self._num_outputs} values, got {len(values)}")
-            return False
+    def _negotiate_layouts(self, extensions: dict) -> bool:
+        """Use our layout if the peer decodes layouts; decode the peer's if it sends one."""
+        self._send_layout = None
+        self._recv_layout = None
+        if _EXT_LAYOUT not in extensions:
+            if self.packet_layout is not None:
+                print("Peer does not support compact layouts; sending the struct format")
+            return True
+        if self.packet_layout is not None:
+            if self.multipath:
+                print("Compact layouts are not used with multipath; sending the struct format")
+            else:
+                self._send_layout = self.packet_layout
+        remote_spec = extensions[_EXT_LAYOUT].decode('ascii', errors='replace')
+        if remote_spec and (self.accept_layouts or self.packet_layout is not None):
+            try:
+                layout = PacketLayout.from_spec(remote_spec)
+            except ValueError as e:
+                print(f"Mismatch: cannot decode their layout: {e}")
+                return False
+            if layout.num_values != self._num_inputs:
+                print(f"Mismatch: They send layout '{remote_spec}' with {layout.num_values} values, "
+                      f"we expect inputs '{self.inputs_fmt}'")
+                return False
+            self._recv_layout = layout
+        return True
 
-        timestamp_ms = int(time.time() * 1000) & 0xFFFFFFFF
-        data = struct.pack(self.send_format, timestamp_ms, *values)
+    def _negotiate_keepalive(self, extensions: dict, remote_max_age: float):
+        """Record the peer's keepalive rate and fit ours inside the peer's max_age."""
+        self.remote_keepalive_rate_hz = None
+        if _EXT_KEEPALIVE in extensions:
+            self.remote_keepalive_rate_hz = struct.unpack('<H', extensions[_EXT_KEEPALIVE][:2])[0] / 100.0
+            if self.remote_keepalive_rate_hz and 1.0 / self.remote_keepalive_rate_hz > self.max_age_seconds:
+                print(f"Warning: peer keepalive every {1000.0 / self.remote_keepalive_rate_hz:.0f}ms exceeds "
+                      f"our max_age {self.max_age_seconds * 1000:.0f}ms; data will expire between packets")
+        if self.tx_policy is None:
+            return
+        self.tx_policy.reset()
+        self.tx_policy.keepalive_period = 1.0 / self.keepalive_rate_hz
+        if remote_max_age > 0 and self.tx_policy.keepalive_period > remote_max_age / 2.0:
+            self.tx_policy.keepalive_period = remote_max_age / 2.0
+            print(f"Keepalive raised to {1.0 / self.tx_policy.keepalive_period:.2f}Hz "
+                  f"to stay inside peer max_age {remote_max_age * 1000:.0f}ms")
+
+    def _negotiate_probes(self, extensions: dict):
+        """Enable probes if both sides support them; reset the estimates."""
+        wanted = bool(self.probe_interval_s or self.answer_probes)
+        self._use_probes = wanted and _EXT_PROBE in extensions
+        if self.probe_interval_s and not self._use_probes:
+            print("Peer does not answer probes; RTT and command age are not measured")
+        self._next_probe = 0.0
+        values, arrival_time, _ = self._latest
+        self._latest = (values, arrival_time, None)
+        self.clock_sync.reset()
+        self.probes_sent = 0
+        self.probe_replies = 0
+        self.probes_answered = 0
+        self.command_age_ms = None
+        self.remote_received = 0
+        self.remote_loss_rate = None
+        self.recent_loss_rate = None
+        self._last_delivery = None
+        self._probe_stats = self._probe_stats_snapshot()
+
+    def _accept_extensions(self, extensions: dict) -> bool:
+        """Check the remote's extension records against local settings."""
         if self._hmac_key:
-            data += hmac.new(self._hmac_key, data, hashlib.sha256).digest()
-        previous_timeout = None
+            remote_mac = ('hmac-sha256', HMAC_DIGEST_SIZE)
+            if _EXT_MAC in extensions:
+                algorithm_id, tag_size = struct.unpack('<BB', extensions[_EXT_MAC][:2])
+                names = {v: k for k, v in MAC_ALGORITHMS.items()}
+                remote_mac = (names.get(algorithm_id, f"unknown({algorithm_id})"), tag_size)
+            if remote_mac != (self.mac_algorithm, self.mac_tag_size):
+                print(f"Mismatch: They use MAC {remote_mac[0]}/{remote_mac[1]}B, "
+                      f"we use {self.mac_algorithm}/{self.mac_tag_size}B")
+                return False
+        return True
+
+    def send(self, values, force: bool = False):
+        """Send values with timestamp. Values must match the outputs format.
+
+        With keepalive_rate_hz set, unchanged values are not transmitted
+        (send still returns True) unless force is set.
+        """
+        if self._use_probes and self.probe_interval_s:
+            self._maybe_probe()
+        if self._suppressed(values, force):
+            return True
+        data = self._pack_packet(values)
+        if data is None:
+            return False
         try:
-            if self._nonblocking_send:
-                previous_timeout = self.socket.gettimeout()
-                self.socket.setblocking(False)
             self.socket.sendto(data, self.remote_addr)
         except (BlockingIOError, socket.timeout):
-            return True
-        finally:
-            if previous_timeout is not None:
-                self.socket.settimeout(previous_timeout)
+            self.packets_dropped += 1
+        else:
+            self.packets_sent += 1
+        if self._use_paths:
+            self._send_redundant()
         return True
 
+    def _suppressed(self, values, force: bool) -> bool:
+        policy = self.tx_policy
+        return policy is not None and not policy.should_send(values, time.monotonic(), force)
+
+    def _send_redundant(self):
+        """Send the extra copies of the packet in the send buffer.
+
+        The buffer holds path id 0; each copy rewrites the path id byte and
+        its MAC in place. Copy 0 of every path goes out now, later copies
+        are handed to the delayed sender.
+        """
+        copies = self.copies
+        if copies == 1 and not self._paths:
+            return
+        packer = self._send_struct
+        view = self._send_view
+        paths = [(None, None)] + self._paths
+        for index, (sock, addr) in enumerate(paths):
+            for copy in range(copies):
+                path_id = index * copies + copy
+                if path_id == 0:
+                    continue
+                self._send_buffer[self._path_id_offset] = path_id
+                if self._sign:
+                    view[packer.size:] = self._sign(view[:packer.size])
+                if copy == 0:
+                    self._send_copy(sock, self._send_buffer, addr)
+                else:
+                    self._schedule_copy(copy * self.copy_spacing_s, sock, bytes(self._send_buffer), addr)
+
+    def _send_copy(self, sock, data, addr):
+        try:
+            (sock or self.socket).sendto(data, addr or self.remote_addr)
+        except (BlockingIOError, socket.timeout):
+            self.redundant_dropped += 1
+            return
+        except OSError as e:
+            # A failed secondary path (e.g. a modem going down) must not stop the primary.
+            self.redundant_dropped += 1
+            print(f"Redundant send failed: {e}")
+            return
+        self.redundant_sent += 1
+
+    def _schedule_copy(self, delay, sock, data, addr):
+        if self._delayed is None:
+            self._delayed = DelayedSender(self._send_copy)
+        self._delayed.schedule(delay, sock, data, addr)
+
+    def _maybe_probe(self):
+        """Send a probe request if one is due. Called from send(), so probes need no thread."""
+        now = time.monotonic()
+        if now < self._next_probe or not self.remote_addr:
+            return
+        self._next_probe = now + self.probe_interval_s
+        probe_id = self._probe_id
+        self._probe_id = (probe_id + 1) & 0xFFFF
+        self._probe_sent_counts[probe_id % _PROBE_HISTORY] = self.packets_sent
+        self.probes_sent += 1
+        self._send_control(_PROBE_STRUCT.pack(_PROBE_MAGIC, _PROBE_REQUEST, probe_id, time.time(),
+                                              0.0, 0.0, 0, 0.0, _rate_c_hz(self.nominal_rate_hz)),
+                           self.remote_addr)
+
+    def _probe_packet(self, payload: bytes) -> bytes:
+        """Pad a probe to the negotiated probe size and sign it."""
+        payload = payload.ljust(self._probe_size, b'\x00')
+        if self._sign:
+            payload += self._sign(payload)
+        return payload
+
+    def _send_control(self, payload: bytes, addr):
+        """Send a probe; a full send buffer drops it."""
+        try:
+            self.socket.sendto(self._probe_packet(payload), addr)
+        except (BlockingIOError, socket.timeout):
+            pass
+
+    def _handle_probe(self, data, addr):
+        """Answer a probe request, or fold a reply into the RTT/offset estimates."""
+        received_at = time.time()
+        if self._sign:
+            payload = data[:self._probe_size]
+            if not hmac.compare_digest(data[self._probe_size:], self._sign(payload)):
+                self.packets_rejected += 1
+                return
+            data = payload
+        magic, kind, probe_id, t1, t2, t3, sent_ms, arrival, received = _PROBE_STRUCT.unpack_from(data)
+        if magic != _PROBE_MAGIC:
+            return
+
+        if kind == _PROBE_REQUEST:
+            rate_c_hz = received  # requests carry the sender's nominal rate here
+            if rate_c_hz and rate_c_hz != _rate_c_hz(self.remote_nominal_rate_hz):
+                self._remote_rate_changed(rate_c_hz / 100.0)
+            _, arrival_time, sent_ms = self._latest
+            received = self.packets_received + self.packets_skipped
+            if self._track_sequence:
+                received += self.sequence_tracker.reordered
+            # Arrival of the latest command on our wall clock.
+            arrival = received_at - (time.monotonic() - arrival_time) if sent_ms is not None else 0.0
+            self.probes_answered += 1
+            self._send_control(_PROBE_STRUCT.pack(_PROBE_MAGIC, _PROBE_REPLY, probe_id, t1, received_at,
+                                                  time.time(), sent_ms or 0, arrival, received & 0xFFFFFFFF),
+                               addr)
+        elif kind == _PROBE_REPLY:
+            self.probe_replies += 1
+            self.clock_sync.add(t1, t2, t3, received_at)
+            if arrival:
+                # 32-bit ms timestamps wrap every ~50 days; compare modulo 2**32.
+                age_ms = (self.clock_sync.to_local(arrival) * 1000.0 - sent_ms) % TIMESTAMP_MOD
+                self.command_age_ms = age_ms - TIMESTAMP_MOD if age_ms > TIMESTAMP_MOD // 2 else age_ms
+            sent = self._probe_sent_counts[probe_id % _PROBE_HISTORY]
+            self.remote_received = received
+            if sent:
+                self.remote_loss_rate = max(0.0, 1.0 - received / sent)
+                # Loss since the previous reply, for rate control.
+                if self._last_delivery is not None and sent > self._last_delivery[0]:
+                    delta_sent = sent - self._last_delivery[0]
+                    delta_received = received - self._last_delivery[1]
+                    self.recent_loss_rate = min(1.0, max(0.0, 1.0 - delta_received / delta_sent))
+                self._last_delivery = (sent, received)
+            self._probe_stats = self._probe_stats_snapshot()
+
+    def _probe_stats_snapshot(self) -> dict:
+        """Estimates from the latest probe reply as one dict that is replaced, never modified."""
+        stats = self.clock_sync.stats()
+        stats['command_age_ms'] = self.command_age_ms
+        stats['remote_loss_rate'] = self.remote_loss_rate
+        stats['recent_loss_rate'] = self.recent_loss_rate
+        return stats
+
+    def _remote_rate_changed(self, rate_hz: float):
+        """The peer announced a new nominal rate after the handshake."""
+        self.remote_nominal_rate_hz = rate_hz
+        print(f"Peer nominal rate now {rate_hz:.2f}Hz")
+        if 1.0 / rate_hz > self.max_age_seconds:
+            print(f"Warning: peer period {1000.0 / rate_hz:.0f}ms exceeds our max_age "
+                  f"{self.max_age_seconds * 1000:.0f}ms; data will expire between packets")
+
+    def _pack_packet(self, values):
+        """Pack values into the reusable send buffer; return it, or None if values are invalid."""
+        if not self.remote_addr:
+            print("No remote address set!")
+            return None
+
+        if len(values) != self._num_outputs:
+            print(f"Expected {self._num_outputs} values, got {len(values)}")
+            return None
+
+        timestamp_ms = int(time.time() * 1000) & 0xFFFFFFFF
+        # Pack into the reusable buffer; the MAC is written in place after the payload.
+        packer = self._send_struct
+        if self._send_layout is not None:
+            packer.pack_into(self._send_buffer, 0, self._send_sequence, *values)
+            self._send_sequence = (self._send_sequence + 1) % SEQ_MOD
+        elif self._use_paths:
+            packer.pack_into(self._send_buffer, 0, timestamp_ms, self._send_sequence, 0, *values)
+            self._send_sequence = (self._send_sequence + 1) % SEQ_MOD
+        elif self._use_sequence:
+            packer.pack_into(self._send_buffer, 0, timestamp_ms, self._send_sequence, *values)
+            self._send_sequence = (self._send_sequence + 1) % SEQ_MOD
+        else:
+            packer.pack_into(self._send_buffer, 0, timestamp_ms, *values)
+        if self._sign:
+            view = self._send_view
+            view[packer.size:] = self._sign(view[:packer.size])
+        return self._send_buffer
+
+    @property
+    def latest_data(self) -> Optional[List]:
+        """Values of the latest accepted packet regardless of age, or None."""
+        values = self._latest[0]
+        return list(values) if values is not None else None
+
+    @property
+    def latest_timestamp(self) -> float:
+        """time.monotonic() arrival time of the latest accepted packet; 0.0 before the first."""
+        return self._latest[1]
+
+    last_packet_time = latest_timestamp
+
     def get_latest(self) -> Optional[List]:
-        """Get latest received data if fresh, else None."""
-        with self.data_lock:
-            if self.latest_data is None:
-                return None
+        """Get latest received data if fresh, else None. Never blocks the receive thread."""
+        values, arrival_time, _ = self._latest
+        if values is None:
+            return None
 
-            age = time.monotonic() - self.latest_timestamp
-            if age > self.max_age_seconds:
+        age = time.monotonic() - arrival_time
+        if age > self.max_age_seconds:
+            with self._expired_lock:
                 self.packets_expired += 1
-                return None
+            return None
 
-            return self.latest_data.copy()
+        return list(values)
 
     def get_connection_stats(self) -> dict:
-        """Get connection statistics for monitoring."""
-        with self.data_lock:
-            current_time = time.monotonic()
-            age = current_time - self.latest_timestamp if self.latest_timestamp > 0 else float('inf')
-            time_since_last = current_time - self.last_packet_time if self.last_packet_time > 0 else float('inf')
-
-            return {
-                'packets_received': self.packets_received,
-                'packets_expired': self.packets_expired,
-                'packets_rejected': self.packets_rejected,
-                'data_age_seconds': age,
-                'time_since_last_packet': time_since_last,
-                'is_connected': age < self.max_age_seconds,
-                'has_data': self.latest_data is not None
-            }
+        """Get connection statistics for monitoring.
+
+        Takes no lock. Counters are read one by one while packets keep
+        arriving, so two counters may be one packet apart.
+        """
+        values, arrival_time, _ = self._latest
+        current_time = time.monotonic()
+        age = current_time - arrival_time if arrival_time > 0 else float('inf')
+
+        stats = {
+            'packets_received': self.packets_received,
+            'packets_skipped': self.packets_skipped,
+            'packets_expired': self.packets_expired,
+            'packets_rejected': self.packets_rejected,
+            'packets_sent': self.packets_sent,
+            'packets_dropped': self.packets_dropped,
+            'data_age_seconds': age,
+            'time_since_last_packet': age,
+            'is_connected': age < self.max_age_seconds,
+            'has_data': values is not None
+        }
+        if self._track_sequence:
+            stats.update(self.sequence_tracker.stats())
+        if self.tx_policy is not None:
+            policy = self.tx_policy
+            datagram_size = len(self._send_buffer) + IP_UDP_OVERHEAD if self._send_buffer else 0
+            stats['packets_suppressed'] = policy.suppressed
+            stats['keepalives_sent'] = policy.keepalives_sent
+            stats['bytes_saved'] = policy.suppressed * datagram_size
+        if self._use_paths:
+            stats['redundant_sent'] = self.redundant_sent
+            stats['redundant_dropped'] = self.redundant_dropped
+            stats.update(self.path_stats.stats())
+        if self._use_probes:
+            stats['probes_sent'] = self.probes_sent
+            stats['probe_replies'] = self.probe_replies
+            stats['probes_answered'] = self.probes_answered
+            stats.update(self._probe_stats)
+        return stats
 
     def start_receiving(self):
         """Start the receive thread."""
         if not self.recv_thread or not self.recv_thread.is_alive():
             self.running = True
-            self.recv_thread = threading.Thread(target=self._receive_loop, daemon=True)
+            target = self._receive_loop
+            if self.receive_mode == 'drain_newest':
+                self.set_nonblocking_send(True)
+                target = self._drain_loop
+            self.recv_thread = threading.Thread(target=target, daemon=True)
             self.recv_thread.start()
             print("Started receive thread")
 
@@ -284,45 +1029,220 @@ class UDPSocket:
             self.recv_thread.join(timeout=2.0)
             print("Stopped receive thread")
 
+    def _expected_datagram_size(self) -> int:
+        return self._recv_struct.size + (self.mac_tag_size if self._sign else 0)
+
+    def _probe_datagram_size(self) -> int:
+        return self._probe_size + (self.mac_tag_size if self._sign else 0)
+
+    def _is_probe(self, data) -> bool:
+        """True for a datagram with the size and magic of a probe, when probes were negotiated."""
+        return self._use_probes and len(data) == self._probe_datagram_size() and data[:4] == _PROBE_MAGIC
+
     def _receive_loop(self):
         """Background thread to continuously receive data with timestamps."""
-        payload_size = struct.calcsize(self.recv_format)
-        expected_size = payload_size + (HMAC_DIGEST_SIZE if self._hmac_key else 0)
+        expected_size = self._expected_datagram_size()
+        # Room for probes, which may be larger than data packets.
+        read_size = max(expected_size, self._probe_datagram_size())
 
         while self.running:
             try:
-                data, addr = self.socket.recvfrom(expected_size)
+                if self._nonblocking_send:
+                    # Non-blocking socket: wait for data here instead of in recvfrom.
+                    readable, _, _ = select.select([self.socket], [], [], 1.0)
+                    if not readable:
+                        continue
+                data, addr = self.socket.recvfrom(read_size)
+                self._handle_datagram(data, addr)
 
-                if not self.remote_addr:
-                    self.remote_addr = addr
-
-                if len(data) == expected_size:
-                    if self._hmac_key:
-                        payload = data[:payload_size]
-                        received_mac = data[payload_size:]
-                        expected_mac = hmac.new(self._hmac_key, payload, hashlib.sha256).digest()
-                        if not hmac.compare_digest(received_mac, expected_mac):
-                            self.packets_rejected += 1
-                            continue
-                        data = payload
-
-                    unpacked = struct.unpack(self.recv_format, data)
-                    values = list(unpacked[1:])
-
-                    # Use arrival time — simpler and more reliable than handling 32-bit ms wraparound
-                    arrival_time = time.monotonic()
-
-                    with self.data_lock:
-                        self.latest_data = values
-                        self.latest_timestamp = arrival_time
-                        self.packets_received += 1
-                        self.last_packet_time = arrival_time
+            except (socket.timeout, BlockingIOError):
+                continue
+            except Exception as e:
+                if self.running:
+                    print(f"Receive error: {e}")
+
+    def _handle_datagram(self, data, addr) -> Optional[List]:
+        """Verify, unpack and publish one datagram; return its values if it became latest."""
+        if not self.remote_addr:
+            self.remote_addr = addr
+
+        unpacker = self._recv_struct
+        payload_size = unpacker.size
+        sign = self._sign
+        expected_size = payload_size + (self.mac_tag_size if sign else 0)
+        if len(data) != expected_size:
+            if self._use_probes and len(data) == self._probe_datagram_size():
+                self._handle_probe(data, addr)
+                return None
+            print(f"Wrong packet size: expected {expected_size}, got {len(data)}")
+            return None
+        if sign:
+            payload = data[:payload_size]
+            if not hmac.compare_digest(data[payload_size:], sign(payload)):
+                self.packets_rejected += 1
+                return None
+            data = payload
 
+        unpacked = unpacker.unpack(data)
+
+        # Use arrival time — simpler and more reliable than handling 32-bit ms wraparound
+        arrival_time = time.monotonic()
+
+        # Late or duplicate packets must not replace a newer command.
+        if self._track_sequence and not self._accept_sequence(unpacked, arrival_time * 1000.0):
+            return None
+        values = unpacked[self._header_count:]
+        self._latest = (values, arrival_time, unpacked[0] if self._recv_layout is None else None)
+        self.packets_received += 1
+        return list(values)
+
+    def _accept_sequence(self, unpacked, arrival_ms: float, skipped: int = 0) -> bool:
+        """Sequence checks for one packet: drop redundant copies, then late packets."""
+        if self._recv_layout is not None:
+            seq = self._unwrap_sequence(unpacked[0], arrival_ms / 1000.0)
+            return self.sequence_tracker.update(seq, None, arrival_ms, skipped=skipped)
+        if self._use_paths and not self.path_stats.first_arrival(unpacked[1], unpacked[2], arrival_ms):
+            return False
+        return self.sequence_tracker.update(unpacked[1], unpacked[0], arrival_ms, skipped=skipped)
+
+    def _unwrap_sequence(self, short_seq: int, arrival_time: float) -> int:
+        """Extend a layout's rolling sequence number to 16 bits around the newest one seen.
+
+        After a silence longer than max_age the sender is assumed to have
+        moved forward, so a long outage cannot make new packets look late.
+        """
+        newest = self.sequence_tracker.max_seq
+        if newest is None:
+            return short_seq
+        modulus = 1 << self._recv_layout.sequence_bits
+        delta = (short_seq - newest) % modulus
+        if delta >= modulus // 2 and arrival_time - self.last_packet_time <= self.max_age_seconds:
+            delta -= modulus
+        return (newest + delta) % SEQ_MOD
+
+    def _drain_order(self, buffers, sizes, count, expected_size, arrival_time) -> List[int]:
+        """Ring slots of one drain pass in the order to verify them when sequence numbers are on.
+
+        Datagrams of the wrong size come first so they are reported. The
+        rest are sorted by sequence number, newest first, relative to the
+        newest sequence accepted so far; copies with the same number keep
+        their arrival order, so the earliest copy gets the first-arrival
+        credit in PathStats. The sequence field is read before the MAC is
+        checked, but only to choose the order: each candidate is still
+        verified before it is used.
+        """
+        batch = len(buffers)
+        slots = [i % batch for i in range(max(0, count - batch), count)]
+        if len(slots) == 1:
+            return slots
+        unpacker = self._recv_struct
+        wrong = [slot for slot in slots if sizes[slot] != expected_size]
+        slots = [slot for slot in slots if sizes[slot] == expected_size]
+        if self._recv_layout is not None:
+            seqs = [self._unwrap_sequence(unpacker.unpack_from(buffers[slot])[0], arrival_time) for slot in slots]
+        else:
+            seqs = [unpacker.unpack_from(buffers[slot])[1] for slot in slots]
+        reference = self.sequence_tracker.max_seq
+        if reference is None and seqs:
+            reference = seqs[-1]
+        half = SEQ_MOD // 2
+        # Signed distance from the reference; sorted() is stable, so equal numbers stay in arrival order.
+        keys = [half - (seq - reference + half) % SEQ_MOD for seq in seqs]
+        return wrong + [slot for _, slot in sorted(zip(keys, slots), key=lambda item: item[0])]
+
+    def _drain_loop(self):
+        """Drain-to-newest receive: empty the socket queue, publish only the newest valid packet.
+
+        Datagrams are read with recvfrom_into into a ring of preallocated
+        buffers until the socket would block (Python has no recvmmsg, so
+        this is one syscall per datagram but no allocation). Verification
+        then walks from the newest datagram backwards and stops at the
+        first valid one, so a backlog costs one MAC check and one unpack
+        instead of one per packet. With sequence numbers "newest" means
+        the highest sequence number rather than the last arrival (see
+        _drain_order), and a candidate rejected as late or duplicate
+        falls through to the next one. A pass reads at most one receive
+        buffer's worth of datagrams, so a sustained flood still publishes
+        and stop_receiving() still takes effect.
+
+        self.socket is read on every pass, so netem.impair() may wrap it
+        while receiving. Formats and the MAC key are fixed when the thread
+        starts; call stop_receiving() before handshaking again.
+        """
+        unpacker = self._recv_struct
+        payload_size = unpacker.size
+        sign = self._sign
+        expected_size = payload_size + (self.mac_tag_size if sign else 0)
+        use_sequence = self._track_sequence
+        header_count = self._header_count
+        timestamp_ms = self._recv_layout is None
+        batch = self.drain_batch
+        # One spare byte per buffer so oversized datagrams are detected.
+        buffers = [bytearray(max(expected_size, self._probe_datagram_size()) + 1) for _ in range(batch)]
+        views = [memoryview(buffer) for buffer in buffers]
+        sizes = [0] * batch
+        addrs = [None] * batch
+        sock = limit = None
+
+        while self.running:
+            try:
+                if sock is not self.socket:
+                    sock = self.socket
+                    limit = max(batch, sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // expected_size)
+                probe_size = self._probe_datagram_size() if self._use_probes else -1
+                readable, _, _ = select.select([sock], [], [], 1.0)
+                if not readable:
+                    continue
+                count = reads = 0
+                while reads < limit:
+                    reads += 1
+                    slot = count % batch
+                    try:
+                        sizes[slot], addrs[slot] = sock.recvfrom_into(buffers[slot])
+                    except BlockingIOError:
+                        break
+                    if sizes[slot] == probe_size:
+                        # Probes are answered at once and do not take a slot.
+                        self._handle_probe(bytes(views[slot][:probe_size]), addrs[slot])
+                        continue
+                    count += 1
+                if not count:
+                    continue
+                arrival_time = time.monotonic()
+
+                if use_sequence:
+                    order = self._drain_order(buffers, sizes, count, expected_size, arrival_time)
                 else:
-                    print(f"Wrong packet size: expected {expected_size}, got {len(data)}")
+                    order = [(count - 1 - back) % batch for back in range(min(count, batch))]
+                examined = 0
+                newest = None
+                for slot in order:
+                    examined += 1
+                    if sizes[slot] != expected_size:
+                        print(f"Wrong packet size: expected {expected_size}, got {sizes[slot]}")
+                        continue
+                    view = views[slot]
+                    if sign and not hmac.compare_digest(view[payload_size:expected_size],
+                                                        sign(view[:payload_size])):
+                        self.packets_rejected += 1
+                        continue
+                    unpacked = unpacker.unpack_from(buffers[slot])
+                    # A late or duplicate datagram falls through to the next candidate.
+                    # Skipped datagrams may include redundant copies; they still count as received.
+                    if use_sequence and not self._accept_sequence(unpacked, arrival_time * 1000.0,
+                                                                  skipped=count - examined):
+                        continue
+                    newest = slot
+                    break
+
+                self.packets_skipped += count - examined
+                if newest is None:
+                    continue
+                if not self.remote_addr:
+                    self.remote_addr = addrs[newest]
+                self._latest = (unpacked[header_count:], arrival_time, unpacked[0] if timestamp_ms else None)
+                self.packets_received += 1
 
-            except socket.timeout:
-                continue
             except Exception as e:
                 if self.running:
                     print(f"Receive error: {e}")
@@ -330,6 +1250,10 @@ class UDPSocket:
     def close(self):
         """Clean shutdown."""
         self.stop_receiving()
+        if self._delayed:
+            self._delayed.stop()
+        for sock, _ in self._paths:
+            sock.close()
         if self.socket:
             self.socket.close()
             print("Socket closed")
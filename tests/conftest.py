@@ -0,0 +1,26 @@
+"""
+The timing benchmarks (tests/test_*_timing.py) take minutes and measure the
+machine as much as the code, so a plain `pytest` skips them. Run them with
+`pytest --benchmark`, or one at a time with `python tests/test_<name>_timing.py`.
+"""
+
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", default=False,
+                     help="also run the timing benchmarks in tests/test_*_timing.py")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: timing benchmark, skipped unless --benchmark is given")
+
+
+def pytest_collection_modifyitems(config, items):
+    run_benchmarks = config.getoption("--benchmark")
+    skip = pytest.mark.skip(reason="timing benchmark; run with --benchmark")
+    for item in items:
+        if item.path.name.endswith("_timing.py"):
+            item.add_marker(pytest.mark.benchmark)
+            if not run_benchmarks:
+                item.add_marker(skip)
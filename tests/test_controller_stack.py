@@ -1,6 +1,11 @@
+import random
+
 import pytest
 
 from modules.controller_stack import (
+    DEFAULT_CONFIG_PATH,
+    GAMEPAD_BUTTON_NAMES,
+    PacketRoutes,
     _axis_directions,
     _axis_deadzones,
     _axis_enabled,
@@ -13,11 +18,62 @@ from modules.controller_stack import (
     apply_axis_deadzones,
     apply_axis_enabled,
     apply_axis_settings,
+    apply_axis_source,
     apply_deadzone,
+    compile_response_curve,
+    load_controller_config,
     to_mask,
 )
 
 
+PACKET_CONFIG_VARIANTS = [
+    load_controller_config(DEFAULT_CONFIG_PATH),
+    {
+        "axes": [
+            {
+                "index": 0,
+                "gamepad": {"name": "right_stick_x", "direction": 1, "deadzone_percent": 0},
+                "nidaq": {"index": 2, "direction": -1, "deadzone_percent": 0},
+            },
+            {"index": 1, "gamepad": None, "nidaq": None},
+        ],
+        "buttons": [
+            {"index": 0, "gamepad": {"name": "A"}, "nidaq": {"index": 2}},
+            {"index": 1, "gamepad": {"name": "B"}, "nidaq": None},
+            {"index": 15, "gamepad": None, "nidaq": None},
+        ],
+    },
+    {
+        "axes": [
+            {"index": "3", "gamepad": {"name": "left_trigger", "direction": "-1", "deadzone_percent": "12.5"}},
+            {"index": 4, "nidaq": {"index": 99, "direction": "bad", "deadzone_percent": None}},
+            {"index": 5, "gamepad": {"name": "none"}, "nidaq": {"index": "x"}},
+            {"index": 9, "nidaq": {"index": 0}},
+            "not a slot",
+        ],
+        "buttons": [
+            {"index": 2, "gamepad": {"name": "NotAButton"}, "nidaq": {"index": 11}},
+            {"index": 3, "gamepad": {"name": "Start"}, "nidaq": {"index": -1}},
+        ],
+    },
+    {
+        "axes": [
+            {
+                "index": 1,
+                "gamepad": {"name": "right_stick_y", "deadzone_percent": 30, "curve": {"type": "expo", "expo": 0.6}},
+                "nidaq": {"index": 1, "direction": -1, "deadzone_percent": 1.5,
+                          "curve": {"type": "piecewise", "points": [[0.5, 0.2], [0.8, 0.5]]}},
+            },
+            {
+                "index": 3,
+                "nidaq": {"index": 3, "curve": {"type": "polynomial", "coefficients": [0, 0.25, 0, 0.75]}},
+            },
+        ],
+    },
+    {},
+]
+
+
 def test_apply_deadzone_matches_nidaq_shape():
     assert apply_deadzone(0.014, 0.015) == 0.0
     assert apply_deadzone(-0.014, 0.015) == 0.0
@@ -221,3 +277,67 @@ def test_gamepad_button_routes_use_xbox_names_as_source_truth():
     assert routed[13] is True
     assert routed[1] is False
     assert to_mask(routed) == 0b11001000000001
+
+
+@pytest.mark.parametrize("lut", [False, True])
+@pytest.mark.parametrize("config", PACKET_CONFIG_VARIANTS)
+def test_compiled_routes_match_packet_route_functions(config, lut):
+    routes = PacketRoutes(config, lut=lut)
+    rng = random.Random(1234)
+
+    for _ in range(500):
+        nidaq_ai = [rng.randint(-128, 127) for _ in range(8)]
+        gp_ai = [rng.randint(-128, 127) for _ in range(8)]
+        nidaq_di = [rng.random() < 0.3 for _ in range(12)]
+        gp = {name: rng.random() < 0.3 for name in GAMEPAD_BUTTON_NAMES}
+
+        assert routes.route_axes(nidaq_ai, gp_ai) == _route_packet_axes(nidaq_ai, gp_ai, config)
+        assert routes.route_buttons(nidaq_di, gp) == _route_packet_buttons(nidaq_di, gp, config)
+
+
+def test_axis_lut_matches_axis_source_for_every_int8_input():
+    config = load_controller_config(DEFAULT_CONFIG_PATH)
+    routes = PacketRoutes(config, lut=True)
+
+    for value in range(-128, 128):
+        values = [value] * 8
+        assert routes.route_axes(values, values) == _route_packet_axes(values, values, config)
+
+
+def test_response_curves_soften_center_and_keep_endpoints():
+    expo = compile_response_curve({"type": "expo", "expo": 0.5})
+    polynomial = compile_response_curve({"type": "polynomial", "coefficients": [0, 0.5, 0, 0.5]})
+    piecewise = compile_response_curve({"type": "piecewise", "points": [[0.5, 0.25]]})
+
+    for curve in (expo, polynomial, piecewise):
+        assert curve(0.0) == pytest.approx(0.0)
+        assert curve(1.0) == pytest.approx(1.0)
+        assert curve(0.5) < 0.5
+    assert piecewise(0.5) == pytest.approx(0.25)
+    assert piecewise(0.75) == pytest.approx(0.625)
+    assert compile_response_curve(None) is None
+    assert compile_response_curve({"type": "linear"}) is None
+
+
+def test_axis_source_curve_is_symmetric_and_applied_after_deadzone():
+    source = {"direction": 1, "deadzone_percent": 10, "curve": {"type": "expo", "expo": 1.0}}
+
+    assert apply_axis_source(10, source) == 0
+    assert apply_axis_source(127, source) == 127
+    assert apply_axis_source(-127, source) == -127
+    assert apply_axis_source(70, source) == -apply_axis_source(-70, source)
+    assert 0 < apply_axis_source(70, source) < apply_axis_source(70, {"deadzone_percent": 10})
+
+
+@pytest.mark.parametrize("curve", [
+    {"type": "cubic"},
+    {"type": "expo", "expo": 1.5},
+    {"type": "polynomial", "coefficients": []},
+    {"type": "piecewise", "points": [[0.5, 2.0]]},
+    "expo",
+])
+def test_invalid_response_curves_are_rejected_at_compile_time(curve):
+    config = {"axes": [{"index": 0, "nidaq": {"index": 0, "curve": curve}}]}
+
+    with pytest.raises(ValueError):
+        PacketRoutes(config, lut=True)
@@ -0,0 +1,55 @@
+"""
+End-to-end sender benchmark on loopback.
+
+Run: python tests/test_e2e_timing.py
+Starts the robot receiver simulator (modules/robot_sim.py) in-process and
+runs the full main.py sender against it with the simulated DAQ, in the
+serial loop and in --pipeline mode, then reports send-to-receive latency
+percentiles, receive rate stability and lost packets.
+"""
+
+from pathlib import Path
+import subprocess
+import sys
+import threading
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from modules.robot_sim import RobotSimulator, format_summary
+
+RATE_HZ = 100
+DURATION_S = 3.0
+
+
+def _run_sender(extra_args):
+    sim = RobotSimulator(nominal_rate_hz=RATE_HZ, sequence_numbers=True)
+    sim.setup("127.0.0.1", 0)
+    receiver = threading.Thread(target=sim.wait_for_sender, kwargs={"timeout": 30.0}, daemon=True)
+    receiver.start()
+    try:
+        subprocess.run(
+            [sys.executable, "main.py", "--ip", f"127.0.0.1:{sim.port}", "--sim-daq", "sine",
+             "--rate", str(RATE_HZ), "--duration", str(DURATION_S), "--seq", *extra_args],
+            cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60, check=True,
+        )
+        receiver.join(timeout=1.0)
+        return sim.summary()
+    finally:
+        sim.close()
+
+
+def test_end_to_end_latency_and_rate():
+    print()
+    for label, extra_args in (("serial", []), ("pipeline", ["--pipeline"])):
+        summary = _run_sender(extra_args)
+        print(f"  {label:8s} {format_summary(summary)}")
+        # The sender runs for DURATION_S plus three neutral packets on shutdown.
+        assert summary["packets_received"] >= 0.8 * RATE_HZ * DURATION_S
+        assert summary["packets_lost"] <= 0.01 * summary["packets_received"]
+        assert abs(summary["rate_hz"] - RATE_HZ) < 0.1 * RATE_HZ
+
+
+if __name__ == "__main__":
+    test_end_to_end_latency_and_rate()
@@ -0,0 +1,105 @@
+import pytest
+
+from modules.link_stats import SEQ_MOD, ClockSync, PathStats, SequenceTracker
+
+
+def _feed(tracker, sequence, period_ms=10.0, arrival_jitter=None):
+    accepted = []
+    for i, seq in enumerate(sequence):
+        arrival = seq * period_ms + (arrival_jitter[i] if arrival_jitter else 0.0)
+        accepted.append(tracker.update(seq % SEQ_MOD, int(seq * period_ms), arrival))
+    return accepted
+
+
+def test_in_order_stream_has_no_loss_or_jitter():
+    tracker = SequenceTracker()
+    assert all(_feed(tracker, range(100)))
+    stats = tracker.stats()
+    assert stats["packets_expected"] == 100
+    assert stats["packets_lost"] == 0
+    assert stats["jitter_ms"] == 0.0
+
+
+def test_gaps_are_counted_as_loss_bursts():
+    tracker = SequenceTracker()
+    _feed(tracker, [0, 1, 2, 5, 6, 10, 11])
+    stats = tracker.stats()
+    assert stats["packets_expected"] == 12
+    assert stats["packets_lost"] == 5
+    assert stats["loss_bursts"] == 2
+    assert stats["max_burst_loss"] == 3
+    assert stats["mean_burst_loss"] == 2.5
+
+
+def test_late_and_duplicate_packets_are_rejected():
+    tracker = SequenceTracker()
+    accepted = _feed(tracker, [0, 1, 3, 2, 3, 4])
+    assert accepted == [True, True, True, False, False, True]
+    stats = tracker.stats()
+    assert stats["packets_reordered"] == 1
+    assert stats["packets_duplicate"] == 1
+    # The late packet still arrived, so it is not lost.
+    assert stats["packets_lost"] == 0
+
+
+def test_sequence_wraparound_extends_expected_count():
+    tracker = SequenceTracker()
+    assert all(_feed(tracker, range(SEQ_MOD - 5, SEQ_MOD + 5)))
+    assert tracker.cycles == SEQ_MOD
+    assert tracker.stats()["packets_expected"] == 10
+    assert tracker.stats()["packets_lost"] == 0
+
+
+def test_sender_restart_resyncs_after_two_consecutive_packets():
+    tracker = SequenceTracker()
+    _feed(tracker, range(10, 20))
+    assert tracker.update(30000, 0, 0.0) is False
+    assert tracker.update(30001, 10, 10.0) is True
+    assert tracker.stats()["sequence_resyncs"] == 1
+    assert tracker.stats()["packets_expected"] == 1
+
+
+def test_jitter_tracks_arrival_variation():
+    tracker = SequenceTracker()
+    jitter = [0.0, 4.0] * 200
+    _feed(tracker, range(400), arrival_jitter=jitter)
+    # |D| is 4 ms for every packet, so the RFC 3550 estimator converges to 4.
+    assert abs(tracker.stats()["jitter_ms"] - 4.0) < 0.01
+
+
+def test_path_stats_keep_first_copy_and_measure_lag():
+    paths = PathStats(window=64)
+    assert paths.first_arrival(7, 1, 100.0) is True
+    assert paths.first_arrival(7, 0, 103.0) is False
+    assert paths.first_arrival(8, 0, 110.0) is True
+    assert paths.first_arrival(8, 1, 111.0) is False
+    stats = paths.stats()
+    assert stats["path_first_arrivals"] == {0: 1, 1: 1}
+    assert stats["path_duplicates"] == {0: 1, 1: 1}
+    assert stats["path_mean_lag_ms"] == {0: 3.0, 1: 1.0}
+    # A sequence number one window later reuses the slot as a new packet.
+    assert paths.first_arrival(7 + 64, 0, 200.0) is True
+    with pytest.raises(ValueError):
+        PathStats(window=1000)
+
+
+def test_clock_sync_estimates_rtt_and_offset_from_least_delayed_probe():
+    sync = ClockSync(window=4)
+    offset = 5.0  # remote clock runs 5 s ahead
+    # Probes every 100 ms: 10 ms each way, 1 ms turnaround at the remote.
+    for i, queued in enumerate([0.0, 0.030, 0.0, 0.050]):
+        t1 = i * 0.1
+        t2 = t1 + 0.010 + queued + offset
+        t3 = t2 + 0.001
+        t4 = t3 - offset + 0.010
+        sync.add(t1, t2, t3, t4)
+    stats = sync.stats()
+    # Queueing on the forward leg inflates the RTT but not the filtered offset.
+    assert stats["rtt_ms"] == pytest.approx(70.0)
+    assert stats["min_rtt_ms"] == pytest.approx(20.0)
+    assert stats["clock_offset_ms"] == pytest.approx(5000.0)
+    assert stats["one_way_delay_ms"] == pytest.approx(60.0)
+    assert sync.to_local(offset + 1.0) == pytest.approx(1.0)
+    assert 20.0 < stats["srtt_ms"] < 70.0
+    with pytest.raises(ValueError):
+        ClockSync(window=0)
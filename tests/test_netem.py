@@ -0,0 +1,127 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from modules.netem import LINK_PRESETS, ImpairedSocket, LinkModel, impair
+from modules.udp_socket import UDPSocket
+
+
+def _plans(model, n=20000, size=50, period=0.01):
+    return [model.plan(size, i * period) for i in range(n)]
+
+
+def test_same_seed_gives_same_impairment():
+    options = dict(LINK_PRESETS["lte_poor"])
+    assert _plans(LinkModel(**options, seed=7), 2000) == _plans(LinkModel(**options, seed=7), 2000)
+    assert _plans(LinkModel(**options, seed=7), 2000) != _plans(LinkModel(**options, seed=8), 2000)
+
+
+def test_gilbert_elliott_losses_come_in_bursts():
+    model = LinkModel(burst_enter=0.01, burst_exit=0.25, seed=1)
+    lost = [not plan for plan in _plans(model)]
+    bursts = [i for i in range(1, len(lost)) if lost[i] and not lost[i - 1]]
+    mean_burst = sum(lost) / len(bursts)
+    # Mean burst length 1 / burst_exit = 4; stationary loss p / (p + r) ~ 3.8 %.
+    assert 3.0 < mean_burst < 5.0
+    assert 0.02 < model.stats()["loss_rate"] < 0.06
+
+
+def test_delay_jitter_and_order():
+    model = LinkModel(delay_ms=20.0, jitter_ms=5.0, distribution="normal", seed=2)
+    dues = [i * 0.001 + plan[0] for i, plan in enumerate(_plans(model, 2000, period=0.001))]
+    assert dues == sorted(dues)
+    assert 19.0 < model.stats()["mean_delay_ms"] < 26.0
+    unordered = LinkModel(delay_ms=20.0, jitter_ms=5.0, preserve_order=False, seed=2)
+    dues = [i * 0.001 + plan[0] for i, plan in enumerate(_plans(unordered, 2000, period=0.001))]
+    assert dues != sorted(dues)
+
+
+def test_bandwidth_cap_queues_then_tail_drops():
+    # 78 B on the wire at 62.4 kbit/s is 10 ms per packet; send every 5 ms.
+    model = LinkModel(rate_kbps=62.4, queue_ms=50.0)
+    plans = _plans(model, 40, size=50, period=0.005)
+    assert plans[0] == [pytest.approx(0.010)]
+    assert plans[5][0] > plans[1][0]
+    assert model.stats()["queue_drops"] > 0
+    with pytest.raises(ValueError):
+        LinkModel(loss=1.5)
+    with pytest.raises(ValueError):
+        LinkModel(distribution="lognormal")
+
+
+def test_impaired_socket_delays_and_drops_for_udp_socket():
+    server = UDPSocket(local_id=2, sequence_numbers=True)
+    server.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    shim = impair(server, rx=LinkModel(delay_ms=30.0, loss=0.2, seed=3))
+    client = UDPSocket(local_id=1, sequence_numbers=True)
+    client.setup("127.0.0.1", server.socket.getsockname()[1], outputs="<8bH")
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault("ok", server.handshake(timeout=5.0)))
+    thread.start()
+    # The handshake itself crosses the impaired link and may be lost.
+    for _ in range(20):
+        if client.handshake(timeout=0.5):
+            break
+    thread.join()
+    assert results["ok"]
+    server.start_receiving()
+    try:
+        sent_at = time.monotonic()
+        client.send([1] * 9)
+        while server.get_latest() is None and time.monotonic() - sent_at < 1.0:
+            time.sleep(0.001)
+        if server.get_latest() is not None:
+            assert time.monotonic() - sent_at >= 0.029
+        for i in range(200):
+            client.send([i % 100] * 9)
+            time.sleep(0.001)
+        time.sleep(0.1)
+        stats = server.get_connection_stats()
+        rx = shim.stats()["rx"]
+        assert rx["lost"] > 0
+        assert stats["packets_lost"] > 0
+    finally:
+        client.close()
+        server.close()
+
+
+def test_tx_drops_are_counted_on_the_impaired_socket():
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sink.settimeout(0.2)
+    shim = ImpairedSocket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM), tx=LinkModel(loss=0.3, seed=5))
+    try:
+        for i in range(100):
+            shim.sendto(bytes([i]), sink.getsockname())
+        received = 0
+        try:
+            while True:
+                sink.recvfrom(16)
+                received += 1
+        except socket.timeout:
+            pass
+        assert 0 < shim.tx_dropped == shim.stats()["tx"]["lost"]
+        assert received == 100 - shim.tx_dropped
+    finally:
+        shim.close()
+        sink.close()
+
+
+def test_stop_tx_drops_pending_delayed_sends_and_sends_directly():
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sink.settimeout(0.2)
+    shim = ImpairedSocket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM), tx=LinkModel(delay_ms=50.0))
+    try:
+        shim.sendto(b"command", sink.getsockname())
+        shim.stop_tx()
+        shim.sendto(b"stop", sink.getsockname())
+        assert sink.recvfrom(16)[0] == b"stop"
+        time.sleep(0.1)
+        with pytest.raises(socket.timeout):
+            sink.recvfrom(16)
+    finally:
+        shim.close()
+        sink.close()
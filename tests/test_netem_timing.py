@@ -0,0 +1,136 @@
+"""
+Command freshness under emulated links.
+
+Run: python tests/test_netem_timing.py
+Sends 100 Hz commands through the in-process impairment shim
+(modules/netem.py) for each link preset, with and without sequence
+numbers, and samples the receiver every millisecond: how old the command
+it would act on is, how often get_latest() reports expired data, and how
+often a late packet replaced a newer command. Also reports how close the
+probe estimates (RTT, clock offset, one-way delay, command age) come to
+the delays the shim adds.
+"""
+
+from pathlib import Path
+import statistics
+import sys
+import threading
+import time
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from modules.netem import LINK_PRESETS, LinkModel, impair
+from modules.udp_socket import UDPSocket
+
+RATE_HZ = 100
+DURATION_S = 2.0
+MAX_AGE_S = 0.2
+
+
+def _freshness(preset, sequence_numbers, seed=1):
+    server = UDPSocket(local_id=2, max_age_seconds=MAX_AGE_S, sequence_numbers=sequence_numbers)
+    server.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    client = UDPSocket(local_id=1, sequence_numbers=sequence_numbers)
+    client.setup("127.0.0.1", server.socket.getsockname()[1], outputs="<8bH")
+    thread = threading.Thread(target=server.handshake, kwargs={"timeout": 2.0})
+    thread.start()
+    client.handshake(timeout=2.0)
+    thread.join()
+    # Impair only the command direction, after the handshake.
+    link = impair(client, tx=LinkModel(**LINK_PRESETS[preset], seed=seed))
+    server.start_receiving()
+
+    send_times = []
+    ages, expired, regressions = [], 0, 0
+    stop = threading.Event()
+
+    def sender():
+        period = 1.0 / RATE_HZ
+        start = time.monotonic()
+        for i in range(int(DURATION_S * RATE_HZ)):
+            send_times.append(time.monotonic())
+            client.send([0] * 8 + [i])
+            time.sleep(max(0.0, start + (i + 1) * period - time.monotonic()))
+        stop.set()
+
+    sending = threading.Thread(target=sender)
+    sending.start()
+    last_index = -1
+    try:
+        time.sleep(0.2)  # let the first packets cross the link
+        while not stop.is_set():
+            latest = server.get_latest()
+            if latest is None:
+                expired += 1
+            else:
+                index = latest[-1]
+                ages.append((time.monotonic() - send_times[index]) * 1000.0)
+                regressions += index < last_index
+                last_index = index
+            time.sleep(0.001)
+    finally:
+        sending.join()
+        client.close()
+        server.close()
+    ages.sort()
+    samples = len(ages) + expired
+    return {
+        "loss": link.stats()["tx"]["loss_rate"],
+        "age_p50": statistics.median(ages) if ages else float("inf"),
+        "age_p99": ages[int(len(ages) * 0.99) - 1] if ages else float("inf"),
+        "expired": expired / samples if samples else 1.0,
+        "regressions": regressions,
+    }
+
+
+def test_command_freshness_under_link_presets():
+    print()
+    for preset in LINK_PRESETS:
+        for sequence_numbers in (False, True):
+            r = _freshness(preset, sequence_numbers)
+            label = f"{preset}{' +seq' if sequence_numbers else ''}"
+            print(f"  {label:14s} loss {r['loss'] * 100:5.2f}%   command age p50 {r['age_p50']:6.1f} ms  "
+                  f"p99 {r['age_p99']:6.1f} ms   expired {r['expired'] * 100:5.2f}%   "
+                  f"older command applied {r['regressions']}x")
+            if sequence_numbers:
+                assert r["regressions"] == 0
+    assert _freshness("lan", True)["expired"] < 0.05
+
+
+def _probe_estimates(tx_delay_ms, rx_delay_ms):
+    server = UDPSocket(local_id=2, answer_probes=True)
+    server.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    client = UDPSocket(local_id=1, probe_interval_s=0.02)
+    client.setup("127.0.0.1", server.socket.getsockname()[1], outputs="<8bH")
+    thread = threading.Thread(target=server.handshake, kwargs={"timeout": 2.0})
+    thread.start()
+    client.handshake(timeout=2.0)
+    thread.join()
+    impair(client, tx=LinkModel(delay_ms=tx_delay_ms), rx=LinkModel(delay_ms=rx_delay_ms))
+    server.start_receiving()
+    client.start_receiving()
+    try:
+        for i in range(int(DURATION_S * RATE_HZ)):
+            client.send([0] * 8 + [i])
+            time.sleep(1.0 / RATE_HZ)
+        return client.get_connection_stats()
+    finally:
+        client.close()
+        server.close()
+
+
+def test_probe_estimates_against_configured_delay():
+    print()
+    for tx_delay_ms, rx_delay_ms in ((5.0, 5.0), (15.0, 15.0), (5.0, 25.0)):
+        s = _probe_estimates(tx_delay_ms, rx_delay_ms)
+        print(f"  delay {tx_delay_ms:4.1f}/{rx_delay_ms:4.1f} ms   srtt {s['srtt_ms']:6.2f} ms "
+              f"(set {tx_delay_ms + rx_delay_ms:4.1f})   offset {s['clock_offset_ms']:+6.2f} ms   "
+              f"one-way {s['one_way_delay_ms']:6.2f} ms   command age {s['command_age_ms']:6.2f} ms "
+              f"(set {tx_delay_ms:4.1f})   replies {s['probe_replies']}")
+
+
+if __name__ == "__main__":
+    test_command_freshness_under_link_presets()
+    test_probe_estimates_against_configured_delay()
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from modules.nidaq_processing import (
+    AINormalizer,
+    BlockRing,
+    ButtonLatch,
+    FIRLowPass,
+    IIRLowPass,
+    design_lowpass_taps,
+    make_block_filter,
+)
+
+
+def _block(*rows):
+    return np.array(rows, dtype=np.float64)
+
+
+def test_latest_mean_and_median_reduce_newest_window():
+    block = _block([1.0, 2.0, 3.0, 10.0], [4.0, 4.0, 4.0, 4.0])
+
+    assert make_block_filter("latest", 2, 1000, 2).reduce(block).tolist() == [10.0, 4.0]
+    assert make_block_filter("mean", 2, 1000, 2).reduce(block).tolist() == [6.5, 4.0]
+    assert make_block_filter("median", 2, 1000, 3).reduce(block).tolist() == [3.0, 4.0]
+
+
+def test_iir_block_matches_sample_by_sample_recursion():
+    rng = np.random.default_rng(3)
+    samples = rng.uniform(0.5, 4.5, size=(2, 40))
+    filt = IIRLowPass(2, sample_rate=1000, cutoff_hz=[20.0, 5.0])
+
+    expected = samples[:, 0].copy()
+    for k in range(samples.shape[1]):
+        expected = filt.alpha * expected + (1.0 - filt.alpha) * samples[:, k]
+
+    for start in range(0, 40, 10):
+        result = filt.reduce(samples[:, start:start + 10])
+
+    np.testing.assert_allclose(result, expected)
+
+
+def test_iir_weight_cache_is_bounded_for_variable_block_sizes():
+    rng = np.random.default_rng(4)
+    samples = rng.uniform(0.5, 4.5, size=(1, 1275))
+    filt = IIRLowPass(1, sample_rate=1000, cutoff_hz=10.0)
+
+    expected = samples[:, 0].copy()
+    for k in range(samples.shape[1]):
+        expected = filt.alpha * expected + (1.0 - filt.alpha) * samples[:, k]
+
+    start = 0
+    for n in range(1, 51):
+        result = filt.reduce(samples[:, start:start + n])
+        start += n
+
+    assert len(filt._weights) <= 8
+    np.testing.assert_allclose(result, expected)
+
+
+def test_iir_and_fir_start_from_first_sample_not_zero():
+    block = np.full((1, 5), 2.5)
+
+    assert IIRLowPass(1, 1000, 10.0).reduce(block)[0] == pytest.approx(2.5)
+    assert FIRLowPass(1, 1000, 10.0, taps=31).reduce(block)[0] == pytest.approx(2.5)
+
+
+def test_fir_suppresses_noise_above_cutoff():
+    t = np.arange(1000) / 1000.0
+    signal = 2.5 + 0.5 * np.sin(2 * np.pi * 200 * t)
+    filt = FIRLowPass(1, 1000, 20.0, taps=51)
+
+    outputs = [filt.reduce(signal[None, i:i + 10])[0] for i in range(0, 1000, 10)]
+
+    assert max(abs(v - 2.5) for v in outputs[10:]) < 0.05
+    assert design_lowpass_taps(1000, 20.0, 51).sum() == pytest.approx(1.0)
+
+
+def test_unknown_filter_and_missing_cutoff_are_rejected():
+    with pytest.raises(ValueError):
+        make_block_filter("boxcar", 8, 1000, 10)
+    with pytest.raises(ValueError):
+        make_block_filter("iir", 8, 1000, 10)
+
+
+def test_count_scaling_folds_device_polynomial_into_normalization():
+    coefficients = [[-0.0012, 0.000312], [0.0008, 0.000305, 1e-12, 0.0]]
+    rng = np.random.default_rng(5)
+    counts = rng.integers(-2000, 16000, size=(500, 2)).astype(np.int16)
+    by_volts = AINormalizer(2, 0.5, 4.5, deadzone=0.015, padding=0.025)
+    by_counts = AINormalizer(2, 0.5, 4.5, deadzone=0.015, padding=0.025)
+    by_counts.set_count_scaling(coefficients)
+
+    for column in counts:
+        volts = np.array([np.polynomial.polynomial.polyval(float(column[i]), coefficients[i]) for i in range(2)])
+        np.testing.assert_allclose(by_counts.to_float(column), by_volts.to_float(volts), atol=1e-9)
+
+
+def test_block_filters_accept_int16_count_blocks():
+    block = np.array([[100, 200, 300, 400]], dtype=np.int16)
+
+    assert make_block_filter("mean", 1, 1000, 4).reduce(block)[0] == 250.0
+    assert make_block_filter("median", 1, 1000, 3).reduce(block)[0] == 300.0
+    assert make_block_filter("iir", 1, 1000, 4, cutoff_hz=50.0).reduce(block)[0] > 100.0
+
+
+def test_block_ring_wait_returns_newest_block_and_times_out():
+    ring = BlockRing(channels=2, block_size=3, slots=2)
+
+    for value in (1.0, 2.0, 3.0):
+        ring.writable()[:] = value
+        ring.publish(timestamp=value * 10)
+
+    sequence, block, timestamp = ring.wait(after=0, timeout=0.1)
+    assert sequence == 3
+    assert block.tolist() == [[3.0] * 3] * 2
+    assert timestamp == 30.0
+    with pytest.raises(TimeoutError):
+        ring.wait(after=3, timeout=0.01)
+
+    ring.fail(RuntimeError("driver stopped"))
+    with pytest.raises(RuntimeError):
+        ring.wait(after=3, timeout=0.01)
+
+
+def test_button_latch_reports_tap_shorter_than_one_tick():
+    latch = ButtonLatch(lines=2)
+    tap = np.zeros((2, 10), dtype=bool)
+    tap[1, 3:5] = True
+
+    assert latch.update(tap, lambda offset: offset * 0.001).tolist() == [False, True]
+    assert latch.update(np.zeros((2, 10), dtype=bool), 1.0).tolist() == [False, False]
+    assert list(latch.edges) == [(1, True, 0.003), (1, False, 0.005)]
+
+
+def test_button_latch_debounce_rejects_glitch_and_spans_blocks():
+    latch = ButtonLatch(lines=1, debounce_samples=3)
+    glitch = np.array([[False, True, True, False, False]])
+    assert latch.update(glitch, lambda offset: offset).tolist() == [False]
+
+    # A press that starts at the end of one block is accepted in the next
+    # block, timestamped where it started.
+    assert latch.update(np.array([[False, False, False, False, True]]), lambda offset: 10 + offset).tolist() == [False]
+    assert latch.update(np.array([[True, True, True]]), lambda offset: 20 + offset).tolist() == [True]
+    assert list(latch.edges) == [(0, True, 19)]
@@ -0,0 +1,80 @@
+"""
+NiDAQ normalization micro-benchmark.
+
+Run: python tests/test_nidaq_timing.py
+Compares the per-channel Python loop with the vectorized AINormalizer path
+at 8, 16 and 32 channels, and checks both give identical output.
+"""
+
+from pathlib import Path
+import sys
+import time
+
+import numpy as np
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from modules.NiDAQ_controller import MAX_VOLTAGE, MIN_VOLTAGE, NiDAQJoysticks, OutputFormat
+from modules.nidaq_processing import AINormalizer
+
+N_ITERS = 5000
+CHANNEL_COUNTS = (8, 16, 32)
+
+
+def _loop_reader(output_format, deadzone, padding):
+    """NiDAQJoysticks with only the state the normalization methods use."""
+    joy = NiDAQJoysticks.__new__(NiDAQJoysticks)
+    joy.task_ai = joy.task_di = None
+    joy.output_format = output_format
+    joy.deadzone = deadzone
+    joy.padding = padding
+    return joy
+
+
+def _columns(channels, count):
+    rng = np.random.default_rng(11)
+    columns = rng.uniform(MIN_VOLTAGE - 0.2, MAX_VOLTAGE + 0.2, size=(count, channels))
+    # Exact range edges and centre, where clamp/deadzone/rounding branch.
+    columns[:3] = np.array([MIN_VOLTAGE, (MIN_VOLTAGE + MAX_VOLTAGE) / 2, MAX_VOLTAGE])[:, None]
+    return columns
+
+
+@pytest.mark.parametrize("output_format", [OutputFormat.INT8, OutputFormat.FLOAT])
+@pytest.mark.parametrize("deadzone,padding", [(0.0, 0.0), (0.015, 0.025), (0.3, 0.1)])
+def test_vectorized_normalization_matches_loop(output_format, deadzone, padding):
+    joy = _loop_reader(output_format, deadzone, padding)
+    normalizer = AINormalizer(8, MIN_VOLTAGE, MAX_VOLTAGE, deadzone=deadzone, padding=padding)
+    convert = normalizer.to_int8 if output_format == OutputFormat.INT8 else normalizer.to_float
+
+    for column in _columns(8, 2000):
+        expected = joy._quantize(joy._normalize_ai(column.tolist()), [])
+        assert convert(column).tolist() == expected.ai
+
+
+def test_normalization_speed():
+    print(f"\n--- AI normalization to int8, {N_ITERS} reads ---")
+    for channels in CHANNEL_COUNTS:
+        joy = _loop_reader(OutputFormat.INT8, 0.015, 0.025)
+        normalizer = AINormalizer(channels, MIN_VOLTAGE, MAX_VOLTAGE, deadzone=0.015, padding=0.025)
+        columns = _columns(channels, N_ITERS)
+
+        t0 = time.perf_counter()
+        for column in columns:
+            joy._quantize(joy._normalize_ai(column.tolist()), [])
+        loop_us = (time.perf_counter() - t0) / N_ITERS * 1e6
+
+        t0 = time.perf_counter()
+        for column in columns:
+            normalizer.to_int8(column)
+        vector_us = (time.perf_counter() - t0) / N_ITERS * 1e6
+
+        print(f"  {channels:2d} channels: loop {loop_us:6.2f} us  vectorized {vector_us:6.2f} us"
+              f"  ({loop_us / vector_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    test_normalization_speed()
+    print("\nDone.")
@@ -0,0 +1,135 @@
+"""
+Pipeline pacing tests.
+
+Run: python tests/test_pacing.py
+Compares TX jitter when the send is clocked by a hiccuping acquisition read
+(serial loop) against a DeadlinePacer TX loop fed through a LatestValue slot.
+"""
+
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import pytest
+
+from modules.pacing import DeadlinePacer, JitterStats, LatestValue
+
+RATE_HZ = 100
+N_ITERS = 100
+HICCUP_EVERY = 10
+HICCUP_S = 0.015
+
+
+def _acquire(i):
+    """Stand-in for a blocking DAQ read that occasionally stalls."""
+    time.sleep(1.0 / RATE_HZ + (HICCUP_S if i % HICCUP_EVERY == 0 else 0.0))
+    return i
+
+
+def _serial_intervals():
+    sends = []
+    for i in range(N_ITERS):
+        _acquire(i)
+        sends.append(time.perf_counter())
+    return [b - a for a, b in zip(sends, sends[1:])]
+
+
+def _pipeline_intervals():
+    slot = LatestValue()
+    stop = threading.Event()
+
+    def acquisition():
+        i = 0
+        while not stop.is_set():
+            slot.publish(_acquire(i))
+            i += 1
+
+    thread = threading.Thread(target=acquisition, daemon=True)
+    thread.start()
+    pacer = DeadlinePacer(RATE_HZ, spin_seconds=0.002)
+    sends = []
+    try:
+        for _ in range(N_ITERS):
+            pacer.wait()
+            slot.get()
+            sends.append(time.perf_counter())
+    finally:
+        stop.set()
+        thread.join()
+    return [b - a for a, b in zip(sends, sends[1:])]
+
+
+def test_latest_value_keeps_newest_with_sequence():
+    slot = LatestValue()
+    assert slot.get() == (0, None, None)
+    slot.publish("a", timestamp=1.0)
+    slot.publish("b", timestamp=2.0)
+    assert slot.get() == (2, "b", 2.0)
+
+
+def test_pacer_holds_rate_on_absolute_deadlines():
+    pacer = DeadlinePacer(200, spin_seconds=0.002)
+    start = time.perf_counter()
+    pacer.reset(start)
+    lateness = [pacer.wait() for _ in range(40)]
+    elapsed = time.perf_counter() - start
+    # Absolute deadlines: total time is 40 periods, not 40 * (period + overshoot).
+    assert 0.195 <= elapsed < 0.23
+    assert min(lateness) >= 0.0
+
+
+def test_pacer_skips_missed_deadlines_instead_of_bursting():
+    pacer = DeadlinePacer(100, spin_seconds=0.0)
+    pacer.reset()
+    time.sleep(0.055)
+    pacer.wait()
+    assert pacer.overruns >= 4
+    before = time.perf_counter()
+    pacer.wait()
+    assert time.perf_counter() - before > 0.002
+
+
+def test_pacer_rate_change_keeps_deadlines_absolute():
+    pacer = DeadlinePacer(100, spin_seconds=0.002)
+    start = time.perf_counter()
+    pacer.reset(start)
+    for _ in range(5):
+        pacer.wait()
+    pacer.set_rate(200)
+    for _ in range(10):
+        pacer.wait()
+    # 5 periods of 10 ms, then 10 of 5 ms.
+    assert 0.099 <= time.perf_counter() - start < 0.13
+    with pytest.raises(ValueError):
+        pacer.set_rate(0)
+
+
+def test_jitter_stats_summary():
+    stats = JitterStats(period=0.01)
+    for t in (0.0, 0.01, 0.02, 0.035):
+        stats.record(t)
+    summary = stats.summary()
+    assert summary["count"] == 4
+    assert abs(summary["rate_hz"] - 1 / (0.035 / 3)) < 1e-6
+    assert abs(summary["max_jitter_s"] - 0.005) < 1e-9
+
+
+def test_pipeline_tx_jitter_vs_serial():
+    """Acquisition stalls show up directly in serial TX intervals but not in paced TX."""
+    serial = _serial_intervals()
+    pipeline = _pipeline_intervals()
+    for label, intervals in (("serial", serial), ("pipeline", pipeline)):
+        worst = max(abs(d - 1.0 / RATE_HZ) for d in intervals) * 1000
+        print(f"\n  {label:8s} TX: mean {1 / statistics.mean(intervals):6.1f} Hz  "
+              f"stdev {statistics.stdev(intervals) * 1000:5.2f} ms  worst {worst:5.2f} ms")
+    assert statistics.stdev(pipeline) < statistics.stdev(serial)
+
+
+if __name__ == "__main__":
+    test_pipeline_tx_jitter_vs_serial()
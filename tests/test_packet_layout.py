@@ -0,0 +1,58 @@
+import itertools
+
+import pytest
+
+from modules.controller_stack import DEFAULT_CONFIG_PATH, load_controller_config
+from modules.packet_layout import PacketLayout, layout_from_config
+
+
+def test_round_trip_rescales_and_keeps_selected_buttons():
+    layout = PacketLayout([('s', 8), ('s', 7), ('s', 6), ('u', 7), ('x', 0), ('m', 0x3FFF)], sequence_bits=12)
+    assert layout.bits == 12 + 8 + 7 + 6 + 7 + 14
+    assert layout.size == 7
+    for a, b, c in itertools.product((-128, -65, -1, 0, 1, 63, 127), repeat=3):
+        seq, *values = layout.unpack(layout.pack(4097, a, b, c, 127, 55, 0xFFFF))
+        assert seq == 4097 % 4096
+        assert values[0] == a and values[3:] == [127, 0, 0x3FFF]
+        # Within half a quantization step (127 / 63 or 127 / 31), same sign.
+        assert abs(values[1] - max(b, -127)) <= 1 and abs(values[2] - max(c, -127)) <= 2
+        assert values[1] * b >= 0 and values[2] * c >= 0
+
+
+@pytest.mark.parametrize("kind, bits", [('s', 7), ('s', 6), ('s', 4), ('u', 6), ('u', 3)])
+def test_full_scale_and_neutral_round_trip(kind, bits):
+    layout = PacketLayout([(kind, bits)], sequence_bits=8)
+    inputs = range(-128, 128) if kind == 's' else range(0, 128)
+    decoded = [layout.unpack(layout.pack(0, v))[1] for v in inputs]
+    assert decoded == sorted(decoded)
+    assert decoded[-1] == 127
+    assert layout.unpack(layout.pack(0, 0))[1] == 0
+    if kind == 's':
+        assert decoded[0] == decoded[1] == -127
+        assert layout.unpack(layout.pack(0, -1))[1] == 0
+
+
+def test_spec_round_trip_and_validation():
+    layout = PacketLayout([('s', 7), ('u', 6), ('x', 0), ('m', 0b1011)], sequence_bits=8)
+    assert layout.spec == "v2;q8:s7,u6,x,mb"
+    parsed = PacketLayout.from_spec(layout.spec)
+    assert parsed.spec == layout.spec and parsed.size == layout.size
+    data = layout.pack(3, -40, 127, 9, 0b1111)
+    assert parsed.unpack(data) == (3, -40, 127, 0, 0b1011)
+    # Unversioned specs are v1 layouts, which sent values unscaled.
+    for spec in ("s7,s7", "q8:s7", "v1;q8:s7", "v2;s7", "v2;q3:s7", "v2;q8:s9", "v2;q8:z4", "v2;q8:m0"):
+        with pytest.raises(ValueError):
+            PacketLayout.from_spec(spec)
+
+
+def test_layout_from_config_drops_unused_buttons():
+    config = load_controller_config(DEFAULT_CONFIG_PATH)
+    layout = layout_from_config(config)
+    assert layout.num_values == 9
+    # Button bits 14 and 15 have no sources in the shipped config.
+    assert layout.fields[-1] == ('m', 0x3FFF)
+    # Smaller than the '<I8bH' struct packet (14 bytes).
+    assert layout.size < 14
+    config["axes"][2]["gamepad"] = None
+    config["axes"][2]["nidaq"] = None
+    assert layout_from_config(config, sequence_bits=8).fields[2] == ('x', 0)
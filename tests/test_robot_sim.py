@@ -0,0 +1,57 @@
+import threading
+import time
+
+from modules.robot_sim import RobotSimulator, format_summary
+from modules.udp_socket import UDPSocket
+
+
+def _sender(sim, inputs=""):
+    client = UDPSocket(local_id=1, sequence_numbers=True)
+    client.setup("127.0.0.1", sim.port, inputs=inputs, outputs="<8bH")
+    thread = threading.Thread(target=sim.wait_for_sender, kwargs={"timeout": 2.0})
+    thread.start()
+    assert client.handshake(timeout=2.0)
+    thread.join()
+    return client
+
+
+def test_simulator_records_latency_rate_and_loss(tmp_path):
+    sim = RobotSimulator(nominal_rate_hz=200.0, sequence_numbers=True, log_path=str(tmp_path / "rx.csv"))
+    sim.setup("127.0.0.1", 0)
+    client = _sender(sim)
+    try:
+        for i in range(50):
+            client.send([i % 100] * 8 + [i])
+            time.sleep(0.005)
+        deadline = time.monotonic() + 1.0
+        while sim.summary()["packets_received"] < 50 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        summary = sim.summary()
+        assert summary["packets_received"] == 50
+        assert summary["packets_lost"] == 0
+        assert 0.0 <= summary["latency_p50_ms"] < 50.0
+        assert 50.0 < summary["rate_hz"] < 250.0
+        assert "lost 0" in format_summary(summary)
+        sim.write_log()
+        assert len((tmp_path / "rx.csv").read_text().splitlines()) == 51
+    finally:
+        client.close()
+        sim.close()
+
+
+def test_simulator_echoes_sender_timestamps():
+    sim = RobotSimulator(echo=True, sequence_numbers=True)
+    sim.setup("127.0.0.1", 0)
+    client = _sender(sim, inputs="<I")
+    client.start_receiving()
+    try:
+        client.send([0] * 9)
+        deadline = time.monotonic() + 1.0
+        while client.get_latest() is None and time.monotonic() < deadline:
+            time.sleep(0.005)
+        echoed = client.get_latest()
+        assert echoed is not None
+        assert abs(echoed[0] - (int(time.time() * 1000) & 0xFFFFFFFF)) < 1000
+    finally:
+        client.close()
+        sim.close()
@@ -0,0 +1,153 @@
+import statistics
+import time
+
+import numpy as np
+import pytest
+
+from modules.NiDAQ_controller import MAX_VOLTAGE, MIN_VOLTAGE, NiDAQJoysticks, OutputFormat
+from modules.sim_daq import (
+    ERROR_BUFFER_OVERWRITTEN,
+    AcquisitionType,
+    AnalogMultiChannelReader,
+    DaqError,
+    RecordedWaveform,
+    SimulatedDAQ,
+    constant_waveform,
+)
+
+
+def _ai_task(daq, rate, buffer_size, channels=2):
+    task = daq.Task()
+    task.ai_channels.add_ai_voltage_chan(f"Sim/ai0:{channels - 1}", min_val=MIN_VOLTAGE, max_val=MAX_VOLTAGE)
+    task.timing.cfg_samp_clk_timing(rate=rate, sample_mode=AcquisitionType.CONTINUOUS, samps_per_chan=buffer_size)
+    task.start()
+    return task
+
+
+def test_sample_clock_fills_available_samples_and_blocking_read_paces():
+    task = _ai_task(SimulatedDAQ(), rate=1000, buffer_size=1000)
+    reader = AnalogMultiChannelReader(task.in_stream)
+    buffer = np.empty((2, 20))
+
+    time.sleep(0.03)
+    assert task.in_stream.avail_samp_per_chan >= 20
+    reader.read_many_sample(buffer, number_of_samples_per_channel=20)
+
+    drained = task.in_stream.avail_samp_per_chan
+    t0 = time.monotonic()
+    reader.read_many_sample(np.empty((2, drained + 20)), number_of_samples_per_channel=drained + 20)
+    assert time.monotonic() - t0 >= 0.015
+
+
+def test_falling_behind_one_buffer_raises_overwrite_error():
+    task = _ai_task(SimulatedDAQ(), rate=1000, buffer_size=20)
+    reader = AnalogMultiChannelReader(task.in_stream)
+
+    time.sleep(0.05)
+    assert task.in_stream.avail_samp_per_chan == 20
+    with pytest.raises(DaqError) as excinfo:
+        reader.read_many_sample(np.empty((2, 1)), number_of_samples_per_channel=1)
+    assert excinfo.value.error_code == ERROR_BUFFER_OVERWRITTEN
+
+
+def test_recorded_waveform_replays_by_sample_time_and_loops():
+    waveform = RecordedWaveform([[1.0, 2.0], [3.0, 4.0]], sample_rate=10)
+
+    np.testing.assert_array_equal(waveform(np.array([0.0, 0.1, 0.2]), 3), [[1, 3, 1], [2, 4, 2], [2.5, 2.5, 2.5]])
+
+
+@pytest.mark.parametrize("raw_counts", [False, True])
+def test_nidaq_joysticks_run_on_simulated_backend(raw_counts):
+    volts = [MIN_VOLTAGE, 2.5, MAX_VOLTAGE, 3.5, 2.5, 2.5, 2.5, 1.5]
+    lines = [True, False] * 6
+    daq = SimulatedDAQ(ai_waveform=constant_waveform(volts), di_waveform=lambda t, n: lines[:n])
+    joy = NiDAQJoysticks(output_format=OutputFormat.INT8, deadzone=0.0, padding=0.0, sample_rate=200,
+                         raw_counts=raw_counts, backend=daq)
+    try:
+        data = joy.read()
+    finally:
+        joy.close()
+
+    assert np.abs(data.ai.astype(int) - [-127, 0, 127, 64, 0, 0, 0, -64]).max() <= 1
+    assert data.di.tolist() == [127, 0] * 6
+
+
+def test_simulated_read_loop_rate():
+    """Loop-rate measurement that runs without hardware, like main.py --dry --sim-daq."""
+    joy = NiDAQJoysticks(sample_rate=100, backend=SimulatedDAQ())
+    periods = []
+    try:
+        joy.read()
+        last = time.perf_counter()
+        for _ in range(50):
+            joy.read()
+            now = time.perf_counter()
+            periods.append(now - last)
+            last = now
+    finally:
+        joy.close()
+
+    mean_hz = 1.0 / statistics.mean(periods)
+    print(f"\n  sim NiDAQ read loop: {mean_hz:.1f} Hz, period stdev {statistics.stdev(periods) * 1e3:.2f} ms")
+    assert 80.0 < mean_hz < 120.0
+
+
+def test_event_mode_shares_blocks_between_consumers_with_timestamps():
+    joy = NiDAQJoysticks(sample_rate=100, acquisition_rate=500, acquisition_mode="event", backend=SimulatedDAQ())
+    try:
+        sequence, block, timestamp = joy.wait_for_block(after=0, timeout=1.0)
+        assert block.shape == (8, 5)
+        data = joy.read()
+        assert joy._last_block >= sequence
+        assert 0.0 <= joy.last_block_latency < 0.5
+        assert joy.last_block_timestamp >= timestamp
+        assert data.ai.tolist() == [0] * 8
+
+        next_sequence, _, next_timestamp = joy.wait_for_block(after=joy._last_block, timeout=1.0)
+        assert next_sequence > sequence
+        assert next_timestamp > timestamp
+    finally:
+        joy.close()
+
+
+@pytest.mark.parametrize("di_timing", ["ai_clock", "change_detection"])
+def test_buffered_di_latches_tap_between_reads(di_timing):
+    start = time.monotonic()
+
+    def tap(t, lines):
+        # Line 2 pressed for 15 ms, well inside one 100 ms read interval.
+        pressed = 0.040 <= t - (start - daq._start_time) < 0.055
+        return [pressed if line == 2 else False for line in range(lines)]
+
+    daq = SimulatedDAQ(di_waveform=tap)
+    joy = NiDAQJoysticks(sample_rate=10, acquisition_rate=1000, di_timing=di_timing, backend=daq)
+    try:
+        time.sleep(0.1)
+        first = joy.read().di.tolist()
+        second = joy.read().di.tolist()
+    finally:
+        joy.close()
+
+    assert first[2] == 127 and second[2] == 0
+    assert [(line, pressed) for line, pressed, _ in joy.button_edges] == [(2, True), (2, False)]
+    if di_timing == "ai_clock":
+        # Sample-clocked edges carry their sample time; change detection
+        # samples have no clock and are stamped with the read time.
+        press, release = (when for _, _, when in joy.button_edges)
+        assert 0.010 <= release - press <= 0.020
+
+
+def test_change_detection_glitch_filter_drops_short_pulses():
+    start = time.monotonic()
+
+    def glitch(t, lines):
+        pressed = 0.030 <= t - (start - daq._start_time) < 0.032
+        return [pressed] * lines
+
+    daq = SimulatedDAQ(di_waveform=glitch)
+    joy = NiDAQJoysticks(sample_rate=10, di_timing="change_detection", di_debounce_ms=5.0, backend=daq)
+    try:
+        time.sleep(0.1)
+        assert joy.read().di.tolist() == [0] * 12
+    finally:
+        joy.close()
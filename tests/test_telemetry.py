@@ -0,0 +1,95 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from modules.robot_sim import FAULT_NO_COMMAND, RobotSimulator
+from modules.telemetry import TELEMETRY_FORMAT, TelemetryRing, TelemetrySocket
+
+
+def test_ring_wraps_and_answers_time_windows():
+    ring = TelemetryRing(8, ("a", "b"), scales=(0.5, 1.0))
+    assert len(ring) == 0 and len(ring.latest()[0]) == 0
+    for i in range(13):
+        ring.append([2 * i, i], timestamp=float(i))
+    assert len(ring) == 8 and ring.count == 13
+    times, values = ring.latest(3)
+    assert times.tolist() == [10.0, 11.0, 12.0]
+    assert values[:, 0].tolist() == [10.0, 11.0, 12.0]  # scaled by 0.5
+    # Windows across the wrap point; rows older than the ring are gone.
+    assert ring.window(6.5, 9.0)[0].tolist() == [7.0, 8.0]
+    assert ring.window(0.0)[0].tolist() == [float(t) for t in range(5, 13)]
+    assert ring.window(12.5)[0].tolist() == []
+    assert ring.last(2.0, now=12.0)[0].tolist() == [10.0, 11.0, 12.0]
+    assert ring.rate_hz(4.0, now=12.5) == 1.0
+    assert ring.field_index("b") == 1
+    with pytest.raises(ValueError):
+        TelemetryRing(0, ("a",))
+    with pytest.raises(ValueError):
+        TelemetryRing(4, ("a", "b"), scales=(1.0,))
+
+
+def test_lock_free_readers_never_see_torn_rows():
+    ring = TelemetryRing(64, ("a", "b", "c"))
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        while not stop.is_set():
+            times, values = ring.last(0.02) if len(ring) % 2 else ring.latest(40)
+            # Every row was written as (k, k, k) at time k, in order.
+            if not (np.all(values == times[:, None]) and np.all(np.diff(times) == 1.0)):
+                errors.append((times, values))
+
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in readers:
+        thread.start()
+    try:
+        start = time.monotonic()
+        k = 0
+        while time.monotonic() - start < 0.5:
+            ring.append([k, k, k], timestamp=float(k))
+            k += 1
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+    assert k > 64 * 10
+    assert not errors
+
+
+def test_telemetry_socket_records_robot_state_history(tmp_path):
+    sim = RobotSimulator(telemetry_hz=200.0)
+    sim.setup("127.0.0.1", 0)
+    client = TelemetrySocket(capacity=1000, local_id=1)
+    client.setup("127.0.0.1", sim.port, inputs=TELEMETRY_FORMAT, outputs="<8bH")
+    thread = threading.Thread(target=sim.wait_for_sender, kwargs={"timeout": 2.0})
+    thread.start()
+    assert client.handshake(timeout=2.0)
+    thread.join()
+    client.start_receiving()
+    try:
+        start = time.monotonic()
+        while time.monotonic() - start < 0.5:
+            client.send([127, 0, 0, 0, 0, 0, 0, 0, 0])
+            time.sleep(0.01)
+        ring = client.telemetry
+        assert 150 < ring.rate_hz(0.5) < 250
+        _, values = ring.last(0.3)
+        boom = values[:, ring.field_index("boom_deg")]
+        # Full stick drives the boom at 30 deg/s: angles in degrees, rising.
+        assert np.all(np.diff(boom) >= 0) and 0.5 < boom[-1] < 20.0
+        assert np.all(values[:, ring.field_index("faults")] == 0)
+        assert values[-1, ring.field_index("boom_bar")] == pytest.approx(40.0 + 127 * 1.2)
+        ring.save(str(tmp_path / "tlm.npz"))
+        saved = np.load(tmp_path / "tlm.npz")
+        assert len(saved["time"]) > 50 and "pump_bar" in saved.files
+        # Commands stop: the simulator raises its no-command fault after max_age.
+        time.sleep(0.7)
+        assert int(ring.latest()[1][0, ring.field_index("faults")]) & FAULT_NO_COMMAND
+    finally:
+        client.close()
+        sim.close()
+    with pytest.raises(ValueError):
+        TelemetrySocket(local_id=1).setup("127.0.0.1", 1, inputs="<4h", outputs="<8bH")
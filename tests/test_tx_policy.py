@@ -0,0 +1,77 @@
+import pytest
+
+from modules.tx_policy import AdaptiveRateController, DeltaKeepalivePolicy
+
+
+def test_changes_send_immediately_and_idle_sends_keepalives():
+    policy = DeltaKeepalivePolicy(keepalive_period=0.2, thresholds=[2, 2])
+    assert policy.should_send([0, 0, 0], 0.0)
+    # Within the threshold: suppressed until the keepalive period.
+    assert not policy.should_send([2, 0, 0], 0.01)
+    assert not policy.should_send([2, 1, 0], 0.19)
+    assert policy.should_send([2, 1, 0], 0.2)
+    # Over the threshold relative to the last sent values.
+    assert policy.should_send([5, 1, 0], 0.21)
+    # Values without a threshold (the button mask) send on any edge.
+    assert policy.should_send([5, 1, 1], 0.22)
+    assert policy.keepalives_sent == 1
+    assert policy.changes_sent == 3
+    assert policy.suppressed == 2
+
+
+def test_return_to_zero_and_force_always_send():
+    policy = DeltaKeepalivePolicy(keepalive_period=1.0, thresholds=[10])
+    assert policy.should_send([3], 0.0)
+    assert policy.should_send([0], 0.1)
+    assert not policy.should_send([0], 0.2)
+    assert policy.should_send([0], 0.3, force=True)
+    with pytest.raises(ValueError):
+        DeltaKeepalivePolicy(keepalive_period=0.0)
+    with pytest.raises(ValueError):
+        DeltaKeepalivePolicy(keepalive_period=1.0, thresholds=[-1])
+
+
+def _reply(replies, loss=0.0, rtt=40.0, dropped=0):
+    return {"probe_replies": replies, "recent_loss_rate": loss, "rtt_ms": rtt, "packets_dropped": dropped}
+
+
+def test_rate_backs_off_on_loss_delay_and_drops_and_recovers_when_clear():
+    control = AdaptiveRateController(20, 100, initial_hz=100, hold_s=2.0, cooldown_s=1.0)
+    assert control.update(_reply(1), 0.0) is None
+    # Heavy loss: one cut, then the cooldown absorbs feedback from the same episode.
+    assert control.update(_reply(2, loss=0.2), 0.5) == 75.0
+    assert control.reason.startswith("loss")
+    assert control.update(_reply(3, loss=0.2), 1.0) is None
+    assert control.update(_reply(4, loss=0.0, rtt=40.0), 1.6) is None
+    # RTT 80 ms above the 40 ms baseline means queueing.
+    assert control.update(_reply(5, rtt=120.0), 2.7) == 56.25
+    assert control.reason == "RTT +80ms"
+    # Send-buffer drops count even without a new probe reply.
+    assert control.update(_reply(5, rtt=120.0, dropped=3), 3.8) == 42.1875
+    assert control.reason == "3 send drops"
+    # Clean for hold_s: additive increase, one step per hold period.
+    assert control.update(_reply(6, rtt=40.0, dropped=3), 4.0) is None
+    assert control.update(_reply(7, rtt=40.0, dropped=3), 5.8) == 47.1875
+    assert control.reason == "link clear"
+    assert control.update(_reply(8, rtt=40.0, dropped=3), 6.0) is None
+    assert control.update(_reply(9, rtt=40.0, dropped=3), 7.9) == 52.1875
+    assert (control.decreases, control.increases) == (3, 2)
+
+
+def test_rate_stays_within_floor_and_ceiling_and_rtt_baseline_expires():
+    control = AdaptiveRateController(30, 60, initial_hz=100, cooldown_s=0.0, min_rtt_window_s=5.0)
+    assert control.rate_hz == 60
+    for i in range(10):
+        control.update(_reply(i + 1, loss=0.5), float(i))
+    assert control.rate_hz == 30
+    control = AdaptiveRateController(30, 60, hold_s=100.0, min_rtt_window_s=5.0)
+    control.update(_reply(1, rtt=20.0), 0.0)
+    # The path got slower for good (e.g. a handover): once the 20 ms sample
+    # leaves the window the new RTT is the baseline, not queueing.
+    assert control.update(_reply(2, rtt=90.0), 1.0) == 45.0
+    assert control.update(_reply(3, rtt=90.0), 6.5) is None
+    assert control.queue_delay_ms == 0.0
+    with pytest.raises(ValueError):
+        AdaptiveRateController(50, 40)
+    with pytest.raises(ValueError):
+        AdaptiveRateController(10, 40, decrease=1.0)
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+
+from modules.udp_async import AsyncUDPSocket
+from modules.udp_socket import UDPSocket
+
+
+async def _async_pair(**kwargs):
+    server = AsyncUDPSocket(local_id=2, **kwargs)
+    await server.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    client = AsyncUDPSocket(local_id=1, **kwargs)
+    await client.setup("127.0.0.1", server.socket.getsockname()[1], outputs="<8bH")
+    server_ok, client_ok = await asyncio.gather(server.handshake(timeout=2.0), client.handshake(timeout=2.0))
+    assert server_ok and client_ok
+    return client, server
+
+
+@pytest.mark.parametrize("options", [{}, {"hmac_key": "secret", "mac_algorithm": "blake2s", "mac_tag_size": 8,
+                                          "sequence_numbers": True}])
+def test_async_stream_subscription_and_latest(options):
+    async def scenario():
+        client, server = await _async_pair(**options)
+        received = []
+        server.subscribe(received.append)
+        stream = server.packets(max_queue=8)
+        try:
+            for i in range(3):
+                client.send([i] * 8 + [i])
+            values = [await asyncio.wait_for(stream.__anext__(), 1.0) for _ in range(3)]
+            assert values == [[i] * 8 + [i] for i in range(3)]
+            assert received == values
+            assert server.get_latest() == [2] * 8 + [2]
+            assert server.get_connection_stats()["packets_received"] == 3
+        finally:
+            await stream.aclose()
+            client.close()
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_async_handshake_times_out_and_next_packet_times_out():
+    async def scenario():
+        server = AsyncUDPSocket()
+        await server.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+        try:
+            assert await server.handshake(timeout=0.05) is False
+            assert await server.next_packet(timeout=0.05) is None
+        finally:
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_async_client_interoperates_with_threaded_server():
+    server = UDPSocket(local_id=2, hmac_key="secret", sequence_numbers=True)
+    server.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault("ok", server.handshake(timeout=2.0)))
+    thread.start()
+
+    async def client_side():
+        client = AsyncUDPSocket(local_id=1, hmac_key="secret", sequence_numbers=True)
+        await client.setup("127.0.0.1", server.socket.getsockname()[1], outputs="<8bH")
+        try:
+            assert await client.handshake(timeout=2.0)
+            thread.join()
+            server.start_receiving()
+            client.send([5] * 8 + [5])
+            for _ in range(100):
+                if server.get_latest():
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            client.close()
+
+    try:
+        asyncio.run(client_side())
+        assert results["ok"]
+        assert server.get_latest() == [5] * 8 + [5]
+        assert server.get_connection_stats()["packets_lost"] == 0
+    finally:
+        server.close()
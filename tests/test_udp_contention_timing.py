@@ -0,0 +1,123 @@
+"""
+UDPSocket reader contention benchmark.
+
+Run: python tests/test_udp_contention_timing.py
+Feeds pre-packed datagrams to the receive path (_handle_datagram, as the
+receive thread calls it) while reader threads poll get_latest() and
+get_connection_stats() in a tight loop, and reports how long each packet
+took to ingest and how fast the readers ran. The lock-free snapshot reads
+are compared with the previous design, where the receive path and both
+readers took one shared lock: a reader preempted while holding it stalls
+ingest for up to a thread switch interval. Readers also check that every
+snapshot they get belongs to a single packet.
+"""
+
+from pathlib import Path
+import struct
+import sys
+import threading
+import time
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from modules.udp_socket import UDPSocket
+
+N_PACKETS = 20000
+READER_COUNTS = (0, 1, 4)
+ADDR = ("127.0.0.1", 9)
+
+
+class _LockedUDPSocket(UDPSocket):
+    """The previous receive path: ingest and every reader share data_lock."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.data_lock = threading.Lock()
+
+    def _handle_datagram(self, data, addr):
+        with self.data_lock:
+            return super()._handle_datagram(data, addr)
+
+    def get_latest(self):
+        with self.data_lock:
+            return super().get_latest()
+
+    def get_connection_stats(self):
+        with self.data_lock:
+            return super().get_connection_stats()
+
+
+def _datagrams(udp):
+    # Every packet carries k % 100 in all axes and k in the last field.
+    packer = struct.Struct(udp.recv_format)
+    return [packer.pack(k & 0xFFFFFFFF, *([k % 100] * 8), k) for k in range(N_PACKETS)]
+
+
+def _reader(udp, stop, results):
+    calls = torn = 0
+    while not stop.is_set():
+        latest = udp.get_latest()
+        if latest is not None and any(axis != latest[-1] % 100 for axis in latest[:8]):
+            torn += 1
+        udp.get_connection_stats()
+        calls += 2
+    results.append((calls, torn))
+
+
+def _run(cls, readers):
+    udp = cls(max_age_seconds=60.0)
+    udp.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    datagrams = _datagrams(udp)
+    stop = threading.Event()
+    results = []
+    threads = [threading.Thread(target=_reader, args=(udp, stop, results)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    handle = udp._handle_datagram
+    clock = time.perf_counter
+    durations = []
+    try:
+        t0 = clock()
+        for data in datagrams:
+            start = clock()
+            handle(data, ADDR)
+            durations.append(clock() - start)
+        elapsed = clock() - t0
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        udp.close()
+    assert udp.packets_received == N_PACKETS
+    durations.sort()
+    calls = sum(c for c, _ in results)
+    torn = sum(t for _, t in results)
+    return {
+        'ingest_rate': N_PACKETS / elapsed,
+        'p50_us': durations[len(durations) // 2] * 1e6,
+        'p99_us': durations[int(len(durations) * 0.99)] * 1e6,
+        'max_us': durations[-1] * 1e6,
+        'reads_per_s': calls / elapsed,
+        'torn': torn,
+    }
+
+
+def test_reader_contention():
+    print(f"\n  {N_PACKETS} packets through _handle_datagram, readers polling get_latest/get_connection_stats")
+    results = {}
+    for readers in READER_COUNTS:
+        for label, cls in (("locked", _LockedUDPSocket), ("snapshot", UDPSocket)):
+            r = results[label, readers] = _run(cls, readers)
+            print(f"  {label:8s} {readers} readers: ingest {r['ingest_rate']:8.0f} pkt/s  "
+                  f"p50 {r['p50_us']:6.1f} us  p99 {r['p99_us']:7.1f} us  max {r['max_us']:8.1f} us  "
+                  f"reads {r['reads_per_s']:8.0f}/s")
+    assert all(r['torn'] == 0 for r in results.values())
+    locked, snapshot = results["locked", 4], results["snapshot", 4]
+    print(f"  4 readers: snapshot ingest {snapshot['ingest_rate'] / locked['ingest_rate']:.2f}x, "
+          f"reads {snapshot['reads_per_s'] / locked['reads_per_s']:.2f}x the locked design")
+
+
+if __name__ == "__main__":
+    test_reader_contention()
@@ -0,0 +1,138 @@
+import time
+
+import pytest
+
+from modules.udp_server import UDPSessionServer
+from modules.udp_socket import UDPSocket
+
+N_PEERS = 200
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.002)
+    return False
+
+
+@pytest.fixture
+def server(request):
+    options = getattr(request, "param", {})
+    server = UDPSessionServer(local_id=9, **options)
+    server.setup("127.0.0.1", 0, inputs="<8bH", outputs="<B")
+    server.start_receiving()
+    yield server
+    server.close()
+
+
+def _client(server, local_id, **options):
+    client = UDPSocket(local_id=local_id, **options)
+    client.setup("127.0.0.1", server.socket.getsockname()[1], inputs="<B", outputs="<8bH")
+    assert client.handshake(timeout=2.0)
+    return client
+
+
+@pytest.mark.parametrize("server", [{"hmac_key": "secret", "sequence_numbers": True}], indirect=True)
+def test_hundreds_of_peers_each_get_a_session(server):
+    clients = [_client(server, i % 256, hmac_key="secret", sequence_numbers=i % 2 == 0) for i in range(N_PEERS)]
+    try:
+        for i, client in enumerate(clients):
+            client.send([i % 100] * 8 + [i])
+        assert _wait_for(lambda: len(server.latest_by_peer()) == N_PEERS)
+        latest = server.latest_by_peer()
+        for i, client in enumerate(clients):
+            addr = ("127.0.0.1", client.socket.getsockname()[1])
+            assert latest[addr] == [i % 100] * 8 + [i]
+            # Sequence numbers were negotiated per peer.
+            assert server.get_session(addr).get_handshake_info()["sequence_numbers"] == (i % 2 == 0)
+        assert server.get_connection_stats()["sessions"] == N_PEERS
+    finally:
+        for client in clients:
+            client.socket.close()
+
+
+def test_server_replies_to_each_peer():
+    server = UDPSessionServer(local_id=9)
+    server.setup("127.0.0.1", 0, inputs="<8bH", outputs="<B")
+    server.start_receiving()
+    clients = [_client(server, i) for i in range(3)]
+    try:
+        for client in clients:
+            client.start_receiving()
+        for i, client in enumerate(clients):
+            assert server.send(("127.0.0.1", client.socket.getsockname()[1]), [i + 1])
+        assert _wait_for(lambda: [c.get_latest() for c in clients] == [[1], [2], [3]])
+        assert server.broadcast([7]) == 3
+        assert _wait_for(lambda: [c.get_latest() for c in clients] == [[7]] * 3)
+    finally:
+        for client in clients:
+            client.close()
+        server.close()
+
+
+@pytest.mark.parametrize("server", [{"idle_timeout": 0.2, "max_sessions": 2}], indirect=True)
+def test_idle_sessions_are_evicted_and_capacity_is_enforced(server):
+    evicted, sessions = [], []
+    server.on_evict = lambda addr, session: (evicted.append(addr), sessions.append(session))
+    first, second = _client(server, 1), _client(server, 2)
+    third = UDPSocket(local_id=3)
+    third.setup("127.0.0.1", server.socket.getsockname()[1], inputs="<B", outputs="<8bH")
+    try:
+        assert not third.handshake(timeout=0.2)
+        assert server.get_connection_stats()["sessions_refused"] == 1
+
+        # Keep the first peer active; the second goes idle and is evicted.
+        deadline = time.monotonic() + 0.6
+        while time.monotonic() < deadline:
+            first.send([0] * 8 + [0])
+            time.sleep(0.02)
+        assert evicted == [("127.0.0.1", second.socket.getsockname()[1])]
+        assert server.get_connection_stats()["sessions"] == 1
+        # The evicted session is closed; the socket it shared stays open.
+        assert sessions[0].socket is None
+        assert server.socket.fileno() != -1
+
+        assert third.handshake(timeout=1.0)
+    finally:
+        for client in (first, second, third):
+            client.socket.close()
+
+
+def test_mismatched_peer_is_not_admitted(server):
+    client = UDPSocket(local_id=1)
+    client.setup("127.0.0.1", server.socket.getsockname()[1], inputs="<B", outputs="<4b")
+    try:
+        assert not client.handshake(timeout=1.0)
+        assert server.get_connection_stats()["handshakes_failed"] == 1
+        assert server.get_connection_stats()["sessions"] == 0
+    finally:
+        client.socket.close()
+
+
+@pytest.mark.parametrize("server", [
+    {"answer_probes": True},
+    # Signed probes are longer than a handshake and must not be taken for one.
+    {"answer_probes": True, "hmac_key": "secret"},
+], indirect=True)
+def test_sessions_answer_probes_without_mixing_them_into_data(server):
+    hmac_key = server.session_options.get("hmac_key")
+    clients = [_client(server, i, probe_interval_s=0.01, hmac_key=hmac_key) for i in range(2)]
+    try:
+        for client in clients:
+            client.start_receiving()
+        for n in range(20):
+            for i, client in enumerate(clients):
+                client.send([i] * 8 + [n])
+            time.sleep(0.005)
+        assert _wait_for(lambda: all(c.get_connection_stats()["probe_replies"] >= 5 for c in clients))
+        for i, client in enumerate(clients):
+            stats = client.get_connection_stats()
+            assert stats["rtt_ms"] is not None and stats["command_age_ms"] is not None
+            addr = ("127.0.0.1", client.socket.getsockname()[1])
+            assert server.get_latest(addr) == [i] * 8 + [19]
+        assert server.handshakes_failed == 0
+    finally:
+        for client in clients:
+            client.close()
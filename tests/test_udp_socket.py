@@ -0,0 +1,583 @@
+import hashlib
+import hmac
+import socket
+import threading
+import time
+
+import pytest
+
+from modules.netem import LinkModel, impair
+from modules.packet_layout import PacketLayout
+from modules.udp_socket import HMAC_DIGEST_SIZE, UDPSocket, _make_signer
+
+
+def _unconnected_pair(outputs="<8bH", hmac_key=None, client_kwargs=None, server_kwargs=None):
+    server = UDPSocket(local_id=2, hmac_key=hmac_key, **(server_kwargs or {}))
+    server.setup("127.0.0.1", 0, inputs=outputs, outputs="", is_server=True)
+    port = server.socket.getsockname()[1]
+    client = UDPSocket(local_id=1, hmac_key=hmac_key, **(client_kwargs or {}))
+    client.setup("127.0.0.1", port, inputs="", outputs=outputs, is_server=False)
+    return client, server
+
+
+def _handshake(client, server):
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault("server", server.handshake(timeout=2.0)))
+    thread.start()
+    client_ok = client.handshake(timeout=2.0)
+    thread.join()
+    return client_ok, results["server"]
+
+
+def _connected_pair(**kwargs):
+    """Loopback client -> server pair after a completed handshake."""
+    client, server = _unconnected_pair(**kwargs)
+    assert _handshake(client, server) == (True, True)
+    return client, server
+
+
+def _wait_for(predicate, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.001)
+    return False
+
+
+@pytest.fixture
+def pair(request):
+    client, server = _connected_pair(**getattr(request, "param", {}))
+    server.start_receiving()
+    yield client, server
+    client.close()
+    server.close()
+
+
+_BLAKE2S_8 = {"mac_algorithm": "blake2s", "mac_tag_size": 8}
+_HMAC_16 = {"mac_tag_size": 16}
+
+
+@pytest.mark.parametrize("pair", [
+    {},
+    {"hmac_key": "secret"},
+    {"hmac_key": "secret", "client_kwargs": _BLAKE2S_8, "server_kwargs": _BLAKE2S_8},
+    {"hmac_key": "secret", "client_kwargs": _HMAC_16, "server_kwargs": _HMAC_16},
+], indirect=True)
+def test_send_reuses_buffer_and_delivers_values(pair):
+    client, server = pair
+    buffer = client._send_buffer
+    for i in range(3):
+        assert client.send([i, -1, 2, -3, 4, -5, 6, -7, 0xABCD])
+    assert client._send_buffer is buffer
+    assert _wait_for(lambda: server.packets_received == 3)
+    assert server.get_latest() == [2, -1, 2, -3, 4, -5, 6, -7, 0xABCD]
+    assert client.get_connection_stats()["packets_sent"] == 3
+
+
+def test_hmac_mismatch_is_rejected():
+    client, server = _connected_pair(hmac_key="secret")
+    server.set_hmac("other")
+    server.start_receiving()
+    try:
+        assert len(client._send_buffer) == client._send_struct.size + HMAC_DIGEST_SIZE
+        client.send([0] * 8 + [0])
+        assert _wait_for(lambda: server.packets_rejected == 1)
+        assert server.get_latest() is None
+    finally:
+        client.close()
+        server.close()
+
+
+def test_nonblocking_send_stays_nonblocking_and_counts_drops():
+    client, server = _connected_pair()
+    client.set_nonblocking_send(True)
+    server.set_nonblocking_send(True)
+    server.start_receiving()
+    try:
+        assert client.socket.gettimeout() == 0.0
+        client.send([1] * 8 + [1])
+        assert _wait_for(lambda: server.packets_received == 1)
+        assert client.socket.gettimeout() == 0.0
+
+        class FullSocket:
+            def sendto(self, data, addr):
+                raise BlockingIOError
+
+            def close(self):
+                pass
+
+        real_socket, client.socket = client.socket, FullSocket()
+        try:
+            assert client.send([0] * 8 + [0])
+        finally:
+            client.socket = real_socket
+        assert client.packets_dropped == 1
+    finally:
+        client.close()
+        server.close()
+
+
+@pytest.mark.parametrize("algorithm", ["hmac-sha256", "blake2s"])
+def test_precomputed_signer_matches_one_shot_mac(algorithm):
+    sign = _make_signer(algorithm, b"secret", 16)
+    for payload in (b"", b"abc", bytes(range(13))):
+        if algorithm == "hmac-sha256":
+            expected = hmac.new(b"secret", payload, hashlib.sha256).digest()[:16]
+        else:
+            expected = hashlib.blake2s(payload, key=b"secret", digest_size=16).digest()
+        assert sign(payload) == expected
+
+
+def test_truncated_tag_shrinks_datagram():
+    client, server = _connected_pair(hmac_key="secret", client_kwargs=_BLAKE2S_8, server_kwargs=_BLAKE2S_8)
+    try:
+        assert len(client._send_buffer) == client._send_struct.size + 8
+    finally:
+        client.close()
+        server.close()
+
+
+def test_handshake_rejects_mac_mismatch():
+    client, server = _unconnected_pair(hmac_key="secret", client_kwargs=_BLAKE2S_8)
+    try:
+        assert _handshake(client, server) == (False, False)
+    finally:
+        client.close()
+        server.close()
+
+
+def test_invalid_mac_settings_are_rejected():
+    with pytest.raises(ValueError):
+        UDPSocket(hmac_key="k", mac_algorithm="md5")
+    with pytest.raises(ValueError):
+        UDPSocket(hmac_key="k", mac_tag_size=12)
+
+
+def _send_raw(client, sequence, values):
+    """Send a hand-built packet with a chosen sequence number."""
+    data = client._send_struct.pack(int(time.time() * 1000) & 0xFFFFFFFF, sequence, *values)
+    client.socket.sendto(data, client.remote_addr)
+
+
+def test_sequence_numbers_are_negotiated_and_late_packets_dropped():
+    seq = {"sequence_numbers": True}
+    client, server = _connected_pair(client_kwargs=seq, server_kwargs=seq)
+    server.start_receiving()
+    try:
+        assert client.get_handshake_info()["sequence_numbers"]
+        assert client.send_format == "<IH8bH"
+        _send_raw(client, 0, [0] * 9)
+        _send_raw(client, 2, [2] * 9)
+        _send_raw(client, 1, [1] * 9)  # late: must not replace seq 2
+        assert _wait_for(lambda: server.get_connection_stats()["packets_reordered"] == 1)
+        stats = server.get_connection_stats()
+        assert server.get_latest() == [2] * 9
+        assert stats["packets_received"] == 2
+        assert stats["packets_lost"] == 0
+        assert stats["packets_expected"] == 3
+    finally:
+        client.close()
+        server.close()
+
+
+def test_sequence_numbers_fall_back_when_peer_does_not_request_them():
+    client, server = _connected_pair(client_kwargs={"sequence_numbers": True})
+    server.start_receiving()
+    try:
+        assert not client.get_handshake_info()["sequence_numbers"]
+        assert client.send_format == "<I8bH"
+        client.send([3] * 9)
+        assert _wait_for(lambda: server.get_latest() == [3] * 9)
+        assert "packets_lost" not in server.get_connection_stats()
+    finally:
+        client.close()
+        server.close()
+
+
+@pytest.mark.parametrize("sequence_numbers", [False, True])
+def test_drain_newest_publishes_only_newest_of_backlog(sequence_numbers):
+    options = {"receive_mode": "drain_newest", "sequence_numbers": sequence_numbers}
+    client, server = _connected_pair(hmac_key="secret", client_kwargs={"sequence_numbers": sequence_numbers},
+                                     server_kwargs=options)
+    try:
+        # Queue a backlog before the receive thread runs, as after a stall.
+        for i in range(100):
+            client.send([i % 100] * 8 + [i])
+        time.sleep(0.05)
+        server.start_receiving()
+        assert _wait_for(lambda: server.packets_received == 1)
+        stats = server.get_connection_stats()
+        assert server.get_latest() == [99] * 8 + [99]
+        assert stats["packets_skipped"] == 99
+        if sequence_numbers:
+            assert stats["packets_lost"] == 0
+            assert stats["loss_bursts"] == 0
+    finally:
+        client.close()
+        server.close()
+
+
+def test_drain_newest_falls_back_past_forged_newest_packet():
+    client, server = _connected_pair(hmac_key="secret", server_kwargs={"receive_mode": "drain_newest"})
+    try:
+        client.send([1] * 8 + [1])
+        client.set_hmac("forged")
+        client.send([2] * 8 + [2])
+        time.sleep(0.05)
+        server.start_receiving()
+        assert _wait_for(lambda: server.packets_received == 1)
+        assert server.get_latest() == [1] * 8 + [1]
+        assert server.packets_rejected == 1
+        assert server.packets_skipped == 0
+    finally:
+        client.close()
+        server.close()
+
+
+def test_drain_newest_picks_the_highest_sequence_of_a_reordered_backlog():
+    options = {"receive_mode": "drain_newest", "sequence_numbers": True}
+    client, server = _connected_pair(client_kwargs={"sequence_numbers": True}, server_kwargs=options)
+    try:
+        timestamp = int(time.time() * 1000) & 0xFFFFFFFF
+        datagrams = [client._send_struct.pack(timestamp, seq, *([seq] * 9)) for seq in range(3)]
+        assert server._handle_datagram(datagrams[0], client.remote_addr) == [0] * 9
+        # Within one drain seq 2 arrives first, then 1, then a duplicate of 0.
+        for data in (datagrams[2], datagrams[1], datagrams[0]):
+            client.socket.sendto(data, client.remote_addr)
+        time.sleep(0.05)
+        server.start_receiving()
+        assert _wait_for(lambda: server.packets_received == 2)
+        time.sleep(0.02)
+        stats = server.get_connection_stats()
+        assert server.get_latest() == [2] * 9
+        assert stats["packets_lost"] == 0
+        assert stats["packets_skipped"] == 2
+    finally:
+        client.close()
+        server.close()
+
+
+def test_drain_newest_credits_the_earliest_copy_to_its_path():
+    paths = {"multipath": True, "receive_mode": "drain_newest"}
+    client, server = _connected_pair(client_kwargs={"multipath": True}, server_kwargs=paths)
+    try:
+        timestamp = int(time.time() * 1000) & 0xFFFFFFFF
+        # Path 1 delivers first; both copies are read in the same drain.
+        for path_id in (1, 0):
+            data = client._send_struct.pack(timestamp, 7, path_id, *([7] * 9))
+            client.socket.sendto(data, client.remote_addr)
+        time.sleep(0.05)
+        server.start_receiving()
+        assert _wait_for(lambda: server.packets_received == 1)
+        assert server.get_connection_stats()["path_first_arrivals"] == {1: 1}
+        assert server.get_latest() == [7] * 9
+    finally:
+        client.close()
+        server.close()
+
+
+class _EndlessQueue:
+    """Wraps a socket so its receive queue never empties: every read returns `datagram`."""
+
+    def __init__(self, sock, datagram):
+        self._sock = sock
+        self.datagram = datagram
+        self.reads = 0
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def recvfrom_into(self, buffer, nbytes=0):
+        self.reads += 1
+        buffer[:len(self.datagram)] = self.datagram
+        return len(self.datagram), ("127.0.0.1", 9)
+
+
+def test_drain_newest_keeps_publishing_under_a_flood_and_follows_socket_swaps():
+    client, server = _connected_pair(server_kwargs={"receive_mode": "drain_newest"})
+    server.start_receiving()
+    flood = server._recv_struct.pack(0, *[3] * 8, 3)
+    # Swapped in while receiving, like netem.impair(); select() still needs
+    # the real socket to be readable, and nothing reads it any more.
+    server.socket = _EndlessQueue(server.socket, flood)
+    try:
+        assert _wait_for(lambda: client.send([1] * 9) and server.get_latest() == [3] * 9, timeout=3.0)
+        received = server.packets_received
+        assert _wait_for(lambda: server.packets_received > received + 2, timeout=3.0)
+        assert server.socket.reads > server.packets_received
+        server.stop_receiving()
+        assert not server.recv_thread.is_alive()
+    finally:
+        client.close()
+        server.close()
+
+
+def test_receive_buffer_size_is_configurable():
+    udp = UDPSocket(recv_buffer_bytes=8192)
+    udp.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    try:
+        # Linux reports double the requested size for bookkeeping overhead.
+        assert 8192 <= udp.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) <= 2 * 8192
+    finally:
+        udp.close()
+    with pytest.raises(ValueError):
+        UDPSocket(receive_mode="latest")
+
+
+def test_multipath_copies_are_deduplicated_and_attributed():
+    client, server = _connected_pair(hmac_key="secret", client_kwargs={"multipath": True, "copies": 2},
+                                     server_kwargs={"multipath": True})
+    client.add_path("127.0.0.1", server.socket.getsockname()[1], bind_host="127.0.0.1")
+    server.start_receiving()
+    try:
+        assert client.get_handshake_info()["multipath"]
+        assert client.send_format == "<IHB8bH"
+        for i in range(20):
+            client.send([i] * 8 + [i])
+            time.sleep(0.005)
+        # 2 paths x 2 copies: three redundant copies per packet.
+        assert _wait_for(lambda: sum(server.get_connection_stats()["path_duplicates"].values()) == 60)
+        stats = server.get_connection_stats()
+        assert stats["packets_received"] == 20
+        assert sum(stats["path_first_arrivals"].values()) == 20
+        assert set(stats["path_duplicates"]) <= {0, 1, 2, 3}
+        assert stats["packets_lost"] == 0 and stats["packets_reordered"] == 0
+        assert server.get_latest() == [19] * 8 + [19]
+        assert client.get_connection_stats()["redundant_sent"] == 60
+    finally:
+        client.close()
+        server.close()
+
+
+def test_multipath_reports_which_path_delivered_first():
+    paths = {"multipath": True}
+    client, server = _connected_pair(client_kwargs=paths, server_kwargs=paths)
+    server.start_receiving()
+    try:
+        timestamp = int(time.time() * 1000) & 0xFFFFFFFF
+        for sequence in range(5):
+            # The secondary path (id 1) wins every race.
+            for path_id in (1, 0):
+                data = client._send_struct.pack(timestamp, sequence, path_id, *([sequence] * 9))
+                client.socket.sendto(data, client.remote_addr)
+        assert _wait_for(lambda: server.get_connection_stats()["path_duplicates"].get(0) == 5)
+        stats = server.get_connection_stats()
+        assert stats["path_first_arrivals"] == {0: 0, 1: 5}
+        assert stats["path_mean_lag_ms"][0] >= 0.0
+        assert server.get_latest() == [4] * 9
+    finally:
+        client.close()
+        server.close()
+
+
+def test_multipath_falls_back_to_single_copy():
+    client, server = _connected_pair(client_kwargs={"multipath": True, "copies": 3})
+    server.start_receiving()
+    try:
+        assert not client.get_handshake_info()["multipath"]
+        assert client.send_format == "<I8bH"
+        client.send([5] * 9)
+        assert _wait_for(lambda: server.get_latest() == [5] * 9)
+        time.sleep(0.02)
+        assert server.packets_received == 1 and client.redundant_sent == 0
+    finally:
+        client.close()
+        server.close()
+    with pytest.raises(ValueError):
+        UDPSocket(multipath=True, copies=0)
+
+
+def test_keepalive_mode_suppresses_unchanged_packets_and_is_negotiated():
+    client, server = _unconnected_pair(client_kwargs={"keepalive_rate_hz": 1.0, "delta_thresholds": [1] * 8},
+                                       server_kwargs={"max_age_seconds": 0.5})
+    assert _handshake(client, server) == (True, True)
+    server.start_receiving()
+    try:
+        assert server.get_handshake_info()["remote_keepalive_rate_hz"] == 1.0
+        # 1 Hz would let the robot's 0.5 s max_age expire: raised to 4 Hz.
+        assert client.tx_policy.keepalive_period == pytest.approx(0.25)
+        for _ in range(20):
+            assert client.send([1] * 8 + [0])
+        assert client.send([1] * 8 + [4])  # button edge
+        assert _wait_for(lambda: server.packets_received == 2)
+        stats = client.get_connection_stats()
+        assert stats["packets_sent"] == 2
+        assert stats["packets_suppressed"] == 19
+        assert stats["bytes_saved"] == 19 * (client._send_struct.size + 28)
+        assert server.get_latest() == [1] * 8 + [4]
+        time.sleep(0.26)
+        client.send([1] * 8 + [4])
+        assert client.get_connection_stats()["keepalives_sent"] == 1
+    finally:
+        client.close()
+        server.close()
+
+
+_LAYOUT_SPEC = "v2;q10:s7,s7,s6,s7,s7,s6,u7,u7,m3fff"
+
+
+def test_compact_layout_is_negotiated_and_tracks_sequence():
+    layout = PacketLayout.from_spec(_LAYOUT_SPEC)
+    client, server = _connected_pair(hmac_key="secret", client_kwargs={"packet_layout": layout},
+                                     server_kwargs={"accept_layouts": True})
+    server.start_receiving()
+    try:
+        assert client.get_handshake_info()["send_layout"] == _LAYOUT_SPEC
+        assert server.get_handshake_info()["recv_layout"] == _LAYOUT_SPEC
+        assert server._expected_datagram_size() == layout.size + HMAC_DIGEST_SIZE
+        # Enough packets to wrap the 10-bit rolling sequence number.
+        for i in range(1100):
+            client.send([-64, 63, 0, 0, 0, 0, 127, 0, 0xC001])
+            if i % 50 == 0:
+                time.sleep(0.002)
+        client.send([-11, 11, 0, 0, 0, 0, 5, 0, 0x2])
+        assert _wait_for(lambda: server.get_latest() == [-10, 10, 0, 0, 0, 0, 5, 0, 0x2], timeout=3.0)
+        stats = server.get_connection_stats()
+        assert stats["packets_expected"] == stats["packets_received"] == 1101
+        assert stats["packets_lost"] == 0
+    finally:
+        client.close()
+        server.close()
+
+
+def test_compact_layout_falls_back_to_struct_format():
+    layout = PacketLayout.from_spec(_LAYOUT_SPEC)
+    client, server = _connected_pair(client_kwargs={"packet_layout": layout})
+    server.start_receiving()
+    try:
+        assert client.get_handshake_info()["send_layout"] is None
+        client.send([1] * 9)
+        assert _wait_for(lambda: server.get_latest() == [1] * 9)
+    finally:
+        client.close()
+        server.close()
+    with pytest.raises(ValueError):
+        _unconnected_pair(outputs="<4b", client_kwargs={"packet_layout": layout})
+
+
+def test_compact_layout_version_mismatch_fails_the_handshake():
+    layout = PacketLayout.from_spec(_LAYOUT_SPEC)
+    # What a peer with the unversioned v1 layout announces.
+    layout.spec = _LAYOUT_SPEC.partition(";")[2]
+    client, server = _unconnected_pair(client_kwargs={"packet_layout": layout},
+                                       server_kwargs={"accept_layouts": True})
+    try:
+        assert not _handshake(client, server)[1]
+    finally:
+        client.close()
+        server.close()
+
+
+def test_compact_layout_is_not_used_with_multipath():
+    layout = PacketLayout.from_spec(_LAYOUT_SPEC)
+    client, server = _connected_pair(client_kwargs={"multipath": True, "packet_layout": layout},
+                                     server_kwargs={"multipath": True, "accept_layouts": True})
+    server.start_receiving()
+    try:
+        assert client.get_handshake_info()["multipath"]
+        assert client.get_handshake_info()["send_layout"] is None
+        assert server.get_handshake_info()["recv_layout"] is None
+        client.send([2] * 9)
+        assert _wait_for(lambda: server.get_latest() == [2] * 9)
+    finally:
+        client.close()
+        server.close()
+
+
+@pytest.mark.parametrize("hmac_key", [None, "secret"])
+def test_probes_measure_rtt_one_way_delay_and_command_age(hmac_key):
+    client, server = _unconnected_pair(hmac_key=hmac_key, client_kwargs={"probe_interval_s": 0.02},
+                                       server_kwargs={"answer_probes": True})
+    assert _handshake(client, server) == (True, True)
+    assert client.get_handshake_info()["probes"] and server.get_handshake_info()["probes"]
+    # 15 ms each way: RTT ~30 ms, and a command is ~15 ms old when it arrives.
+    impair(client, tx=LinkModel(delay_ms=15.0), rx=LinkModel(delay_ms=15.0))
+    server.start_receiving()
+    client.start_receiving()
+    try:
+        for i in range(50):
+            client.send([0] * 8 + [i])
+            time.sleep(0.01)
+        assert _wait_for(lambda: client.get_connection_stats()["probe_replies"] >= 10)
+        stats = client.get_connection_stats()
+        # Load only adds delay, so only lower bounds are checked; the one-way
+        # figures also absorb clock offset error. Accuracy is reported by
+        # tests/test_netem_timing.py.
+        assert stats["srtt_ms"] > 28.0
+        assert stats["clock_offset_ms"] is not None
+        assert stats["one_way_delay_ms"] > 10.0
+        assert stats["command_age_ms"] > 10.0
+        assert stats["remote_loss_rate"] == 0.0
+        assert server.get_connection_stats()["probes_answered"] == stats["probes_sent"]
+        # Probes never reach get_latest() as data.
+        assert _wait_for(lambda: server.get_latest() == [0] * 8 + [49])
+    finally:
+        client.close()
+        server.close()
+
+
+def test_probes_are_not_sent_to_peers_that_do_not_answer():
+    client, server = _connected_pair(client_kwargs={"probe_interval_s": 0.01})
+    server.start_receiving()
+    try:
+        assert client.get_handshake_info()["probes"] is False
+        for i in range(5):
+            client.send([0] * 8 + [i])
+            time.sleep(0.005)
+        assert _wait_for(lambda: server.get_latest() == [0] * 8 + [4])
+        assert "rtt_ms" not in client.get_connection_stats()
+        assert client.probes_sent == 0
+    finally:
+        client.close()
+        server.close()
+
+
+def test_rate_changes_reach_the_peer_and_probe_intervals_report_loss():
+    client, server = _unconnected_pair(client_kwargs={"probe_interval_s": 0.05, "nominal_rate_hz": 100.0},
+                                       server_kwargs={"answer_probes": True, "sequence_numbers": True})
+    assert _handshake(client, server) == (True, True)
+    assert client.get_handshake_info()["remote_max_age_seconds"] == 0.5
+    # Lose every fourth datagram (data and probes alike) after the handshake.
+    impair(client, tx=LinkModel(burst_enter=0.25, burst_exit=1.0, seed=3))
+    server.start_receiving()
+    client.start_receiving()
+    try:
+        client.set_nominal_rate_hz(40.0)
+        for i in range(200):
+            client.send([0] * 8 + [i % 256])
+            time.sleep(0.002)
+        assert _wait_for(lambda: server.get_handshake_info()["remote_nominal_rate_hz"] == 40.0)
+        stats = client.get_connection_stats()
+        assert 0.1 < stats["recent_loss_rate"] < 0.5
+        assert 0.1 < stats["remote_loss_rate"] < 0.4
+    finally:
+        client.close()
+        server.close()
+
+
+def test_readers_get_snapshot_copies_and_exact_expiry_counts():
+    client, server = _connected_pair(server_kwargs={"max_age_seconds": 0.05})
+    server.start_receiving()
+    try:
+        client.send([1, 2, 3, 4, 5, 6, 7, 8, 9])
+        assert _wait_for(lambda: server.packets_received == 1)
+        latest = server.get_latest()
+        latest[0] = 99
+        assert server.get_latest() == [1, 2, 3, 4, 5, 6, 7, 8, 9]
+        assert server.latest_data == [1, 2, 3, 4, 5, 6, 7, 8, 9]
+        assert server.last_packet_time == server.latest_timestamp > 0
+
+        # Expired reads are counted from many threads without losing increments.
+        time.sleep(0.1)
+        threads = [threading.Thread(target=lambda: [server.get_latest() for _ in range(500)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = server.get_connection_stats()
+        assert stats["packets_expired"] == 2000
+        assert stats["has_data"] and not stats["is_connected"]
+    finally:
+        client.close()
+        server.close()
@@ -0,0 +1,248 @@
+"""
+UDP send micro-benchmark.
+
+Run: python tests/test_udp_timing.py
+Compares the original per-packet send (struct.pack with a format string,
+bytes concatenation for the MAC, blocking-mode toggling around sendto) with
+the precompiled Struct / reusable buffer send, over loopback, and the
+per-packet MAC cost of hmac.new() against the precomputed contexts, and
+how long each receive mode takes to apply a queued backlog, and loopback
+receive latency of the receive thread against the asyncio transport, and
+the bytes and per-packet CPU of the compact bit-packed layout against the
+struct packet.
+"""
+
+import asyncio
+import hashlib
+import hmac
+from pathlib import Path
+import socket
+import statistics
+import struct
+import sys
+import threading
+import time
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from modules.controller_stack import DEFAULT_CONFIG_PATH, load_controller_config
+from modules.packet_layout import layout_from_config
+from modules.udp_async import AsyncUDPSocket
+from modules.udp_socket import UDPSocket, _make_signer
+
+N_ITERS = 3000
+VALUES = [1, -2, 3, -4, 5, -6, 7, -8, 0x1234]
+
+
+def _legacy_send(udp, values):
+    """The send path before precompiled Structs, for comparison."""
+    timestamp_ms = int(time.time() * 1000) & 0xFFFFFFFF
+    data = struct.pack(udp.send_format, timestamp_ms, *values)
+    if udp._hmac_key:
+        data += hmac.new(udp._hmac_key, data, hashlib.sha256).digest()
+    previous_timeout = udp.socket.gettimeout()
+    try:
+        udp.socket.setblocking(False)
+        udp.socket.sendto(data, udp.remote_addr)
+    except (BlockingIOError, socket.timeout):
+        return True
+    finally:
+        udp.socket.settimeout(previous_timeout)
+    return True
+
+
+def _time_per_send_us(send, hmac_key):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sink.bind(("127.0.0.1", 0))
+    udp = UDPSocket(hmac_key=hmac_key)
+    udp.setup("127.0.0.1", sink.getsockname()[1], outputs="<8bH")
+    udp.set_nonblocking_send(True)
+    try:
+        t0 = time.perf_counter()
+        for _ in range(N_ITERS):
+            send(udp, VALUES)
+        return (time.perf_counter() - t0) / N_ITERS * 1e6
+    finally:
+        udp.socket.close()
+        sink.close()
+
+
+def test_send_speed():
+    print()
+    for hmac_key in (None, "secret"):
+        label = "hmac" if hmac_key else "plain"
+        legacy = min(_time_per_send_us(_legacy_send, hmac_key) for _ in range(3))
+        current = min(_time_per_send_us(UDPSocket.send, hmac_key) for _ in range(3))
+        print(f"  {label:5s} send: legacy {legacy:6.2f} us   pack_into {current:6.2f} us   "
+              f"({legacy / current:.2f}x)")
+
+
+def _time_per_mac_us(sign, payload):
+    t0 = time.perf_counter()
+    for _ in range(N_ITERS * 10):
+        sign(payload)
+    return (time.perf_counter() - t0) / (N_ITERS * 10) * 1e6
+
+
+def test_mac_speed():
+    key = b"secret"
+    payload = struct.pack("<I8bH", 0, *VALUES)
+    one_shot = min(_time_per_mac_us(lambda data: hmac.new(key, data, hashlib.sha256).digest(), payload)
+                   for _ in range(3))
+    print(f"\n  hmac.new per packet       {one_shot:5.2f} us  ({len(payload) + 32} B datagram)")
+    results = {}
+    for algorithm, tag_size in (("hmac-sha256", 32), ("hmac-sha256", 16), ("blake2s", 16), ("blake2s", 8)):
+        sign = _make_signer(algorithm, key, tag_size)
+        results[algorithm, tag_size] = min(_time_per_mac_us(sign, payload) for _ in range(3))
+        print(f"  {algorithm:11s} tag {tag_size:2d} B    {results[algorithm, tag_size]:5.2f} us  "
+              f"({len(payload) + tag_size} B datagram, {one_shot / results[algorithm, tag_size]:.2f}x)")
+
+
+BACKLOG = 500
+
+
+def _backlog_apply_ms(receive_mode):
+    """Queue BACKLOG packets, start receiving, return ms until the newest one is live."""
+    server = UDPSocket(hmac_key="secret", receive_mode=receive_mode, recv_buffer_bytes=1 << 20)
+    server.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    client = UDPSocket(hmac_key="secret")
+    client.setup("127.0.0.1", server.socket.getsockname()[1], outputs="<8bH")
+    thread = threading.Thread(target=server.handshake, kwargs={"timeout": 2.0})
+    thread.start()
+    client.handshake(timeout=2.0)
+    thread.join()
+    try:
+        for i in range(BACKLOG):
+            client.send([0] * 8 + [i])
+        time.sleep(0.05)
+        t0 = time.perf_counter()
+        server.start_receiving()
+        while True:
+            latest = server.get_latest()
+            if latest and latest[-1] == BACKLOG - 1:
+                return (time.perf_counter() - t0) * 1000, server.packets_received, server.packets_skipped
+            time.sleep(0)
+    finally:
+        client.close()
+        server.close()
+
+
+def test_backlog_drain_speed():
+    print()
+    results = {}
+    for mode in ("each", "drain_newest"):
+        results[mode] = _backlog_apply_ms(mode)
+        ms, applied, skipped = results[mode]
+        print(f"  {mode:12s} {BACKLOG} queued packets: newest live after {ms:6.2f} ms "
+              f"({applied} applied, {skipped} skipped)")
+    assert results["drain_newest"][1] == 1
+
+
+LATENCY_SAMPLES = 300
+
+
+def _percentiles_us(samples):
+    samples = sorted(samples)
+    return (statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99) - 1] * 1e6)
+
+
+def _thread_receive_latencies():
+    """Send, then spin until the receive thread has published the packet."""
+    server = UDPSocket(hmac_key="secret")
+    server.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    client = UDPSocket(hmac_key="secret")
+    client.setup("127.0.0.1", server.socket.getsockname()[1], outputs="<8bH")
+    thread = threading.Thread(target=server.handshake, kwargs={"timeout": 2.0})
+    thread.start()
+    client.handshake(timeout=2.0)
+    thread.join()
+    server.start_receiving()
+    latencies = []
+    try:
+        for i in range(LATENCY_SAMPLES):
+            t0 = time.perf_counter()
+            client.send([0] * 8 + [i])
+            while server.packets_received <= i:
+                pass
+            latencies.append(time.perf_counter() - t0)
+            time.sleep(0.001)
+    finally:
+        client.close()
+        server.close()
+    return latencies
+
+
+async def _asyncio_receive_latencies():
+    """Send, then await the server's next_packet() in the same event loop."""
+    server = AsyncUDPSocket(hmac_key="secret")
+    await server.setup("127.0.0.1", 0, inputs="<8bH", is_server=True)
+    client = AsyncUDPSocket(hmac_key="secret")
+    await client.setup("127.0.0.1", server.socket.getsockname()[1], outputs="<8bH")
+    await asyncio.gather(server.handshake(timeout=2.0), client.handshake(timeout=2.0))
+    latencies = []
+    try:
+        for i in range(LATENCY_SAMPLES):
+            waiter = asyncio.ensure_future(server.next_packet(timeout=1.0))
+            await asyncio.sleep(0)
+            t0 = time.perf_counter()
+            client.send([0] * 8 + [i])
+            await waiter
+            latencies.append(time.perf_counter() - t0)
+            await asyncio.sleep(0.001)
+    finally:
+        client.close()
+        server.close()
+    return latencies
+
+
+def test_receive_latency_thread_vs_asyncio():
+    thread_median, thread_p99 = _percentiles_us(_thread_receive_latencies())
+    async_median, async_p99 = _percentiles_us(asyncio.run(_asyncio_receive_latencies()))
+    print(f"\n  receive thread  latency: median {thread_median:6.1f} us  p99 {thread_p99:7.1f} us")
+    print(f"  asyncio         latency: median {async_median:6.1f} us  p99 {async_p99:7.1f} us")
+    assert async_median < 10_000 and thread_median < 10_000
+
+
+def _time_per_call_us(fn):
+    t0 = time.perf_counter()
+    for _ in range(N_ITERS * 10):
+        fn()
+    return (time.perf_counter() - t0) / (N_ITERS * 10) * 1e6
+
+
+def test_compact_layout_cost():
+    layout = layout_from_config(load_controller_config(DEFAULT_CONFIG_PATH))
+    packer = struct.Struct("<I8bH")
+    sign = _make_signer("blake2s", b"secret", 8)
+    buffer = bytearray(packer.size)
+    compact = bytearray(layout.size)
+    packer.pack_into(buffer, 0, 0, *VALUES)
+    layout.pack_into(compact, 0, 0, *VALUES)
+    struct_data = bytes(buffer)
+    compact_data = bytes(compact)
+    rows = (
+        ("struct", packer.size,
+         lambda: sign(packer.pack_into(buffer, 0, 0, *VALUES) or buffer),
+         lambda: packer.unpack(struct_data)),
+        ("compact", layout.size,
+         lambda: sign(layout.pack_into(compact, 0, 0, *VALUES) or compact),
+         lambda: layout.unpack(compact_data)),
+    )
+    print(f"\n  layout {layout.spec}")
+    for label, size, pack, unpack in rows:
+        pack_us = min(_time_per_call_us(pack) for _ in range(3))
+        unpack_us = min(_time_per_call_us(unpack) for _ in range(3))
+        print(f"  {label:7s} {size:2d} B payload, {size + 8 + 28:2d} B on air with blake2s-8 and IP/UDP   "
+              f"pack+MAC {pack_us:5.2f} us   unpack {unpack_us:5.2f} us")
+    assert layout.size < packer.size
+
+
+if __name__ == "__main__":
+    test_send_speed()
+    test_mac_speed()
+    test_backlog_drain_speed()
+    test_receive_latency_thread_vs_asyncio()
+    test_compact_layout_cost()